@@ -1,12 +1,49 @@
 import argparse
 import copy
+import importlib
+import json
+import os
+import math
+import mmap
+import multiprocessing
+import random
+import struct
 import sys
+import threading
 import time
 import numpy as np
+from array import array
+from bisect import bisect_right
 from itertools import chain
+from math import comb
 
-cache = {}  # you can use this to implement state caching!
 DEPTH_LIMIT = 10  # global variable indicating depth limit
+MAX_PLY = 100  # Deepest ply a search can reach, used to recognise win scores
+WIN_SCORE = 10000  # Score of a won position, minus the number of plies to the win
+ASPIRATION_WINDOW = 1  # Half width of the window around the previous iteration's value
+EXACT, LOWER_BOUND, UPPER_BOUND = 0, 1, 2  # Kinds of values in the transposition table
+BATCH_EVALUATION = True  # Score the quiet leaves below a node in one vectorized call
+LATE_MOVE_REDUCTIONS = False  # Search late quiet moves one ply shallower, re-searching on a fail high
+LMR_MIN_DEPTH = 3  # Shallowest remaining depth at which moves are reduced
+LMR_MIN_MOVE = 3  # Number of moves searched at full depth before reductions start
+FUTILITY_PRUNING = False  # Skip the quiet moves of a node near the horizon that can not reach alpha
+FUTILITY_MARGINS = [0, 2, 4]  # Largest gain expected from a quiet move, per remaining depth
+DRAW_SCORE = 0  # Score of a drawn position
+REPETITION_LIMIT = 3  # Number of occurrences of a position that draws the game
+NO_PROGRESS_LIMIT = 80  # Plies without a capture or a man move that draw the game
+
+# Weights of the evaluation terms. The positional terms add, per piece, the weight
+# times the square value below, and are off by default.
+EVAL_WEIGHTS = {'man': 1, 'king': 2, 'advancement': 0, 'center': 0, 'back_row': 0}
+RED_MAN_SQUARE_VALUES = [0] * 64
+BLACK_MAN_SQUARE_VALUES = [0] * 64
+KING_SQUARE_VALUES = [0] * 64
+QUIESCENCE_NODE_LIMIT = 2000  # Maximum number of capture-search nodes below one leaf
+quiescence_stats = {'leaves': 0, 'nodes': 0, 'cutoffs': 0, 'limit_hits': 0, 'max_ply': 0, 'leaf_start': 0}
+DARK_SQUARES = [(row, column) for row in range(8) for column in range(8) if (row + column) % 2 == 1]
+COLOR_SWAP = {'r': 'b', 'R': 'B', 'b': 'r', 'B': 'R', '.': '.'}
+COLOR_SWAP_TABLE = str.maketrans(COLOR_SWAP)
+KINGS_REMOVED_TABLE = str.maketrans({'R': '.', 'B': '.'})
 
 
 # class board:
@@ -60,6 +97,65 @@ def read_from_file(filename):
     return board
 
 
+# Helper function to write a board as one line, FEN style
+# The side to move, then the red and the black pieces as numbers of the dark
+# squares (1-32, row by row from the top), kings prefixed by K: "R:R21,K30:B1,5"
+def board_to_fen(board, player):
+    squares = {'r': [], 'b': []}
+    for number, (row, column) in enumerate(DARK_SQUARES):
+        char = board[row][column]
+        if char != '.':
+            squares[char.lower()].append(('K' if char.isupper() else '') + str(number + 1))
+
+    return '{}:R{}:B{}'.format(player.upper(), ','.join(squares['r']), ','.join(squares['b']))
+
+
+# Helper function to read a board and the side to move from a FEN style line
+def fen_to_board(line):
+    fields = line.strip().split(':')
+    if len(fields) != 3 or fields[0] not in ['R', 'B']:
+        raise ValueError("Malformed position: {}".format(line.strip()))
+
+    board = [['.' for _ in range(8)] for _ in range(8)]
+    for field in fields[1:]:
+        color = field[0].lower()
+        for square in filter(None, field[1:].split(',')):
+            piece = color.upper() if square.startswith('K') else color
+            row, column = DARK_SQUARES[int(square.lstrip('K')) - 1]
+            board[row][column] = piece
+
+    return board, fields[0].lower()
+
+
+# Reads the positions of a file one at a time
+# The file may hold FEN style lines, or 8-line boards separated by blank lines
+# (red to move). Yields (board, player) pairs.
+def read_positions(filename):
+    with open(filename) as position_file:
+        rows = []
+        for line in position_file:
+            line = line.strip()
+            if ':' in line:
+                yield fen_to_board(line)
+            elif line:
+                rows.append([str(x) for x in line])
+                if len(rows) == 8:
+                    yield rows, 'r'
+                    rows = []
+
+
+# Helper function to append a position to a game record as soon as it is decided
+# The grid format writes the 8 rows and a blank line, the fen format one line
+def write_position(output_file, board, player, output_format):
+    if output_format == 'fen':
+        output_file.write(board_to_fen(board, player) + "\n")
+    else:
+        for line in board:
+            output_file.write(''.join(line) + "\n")
+        output_file.write("\n")
+    output_file.flush()
+
+
 # Boolean helper to check whether if the piece can jump left and up
 def piece_left_up_jump_is_possible(board, x_cord, y_cord, piece):
     if y_cord > 0:
@@ -124,48 +220,6 @@ def jump_right_up(board, x_cord, y_cord, piece):
     return result
 
 
-# Helper function to do consecutive jumps
-def consecutive_jumps_up(board, x_cord, y_cord, piece):
-    new_board = copy.deepcopy(board)
-
-    while piece_left_up_jump_is_possible(new_board, x_cord, y_cord, piece) or \
-            piece_right_up_jump_is_possible(new_board, x_cord, y_cord, piece):
-
-        if piece_left_up_jump_is_possible(new_board, x_cord, y_cord, piece):
-            new_board = jump_left_up(new_board, x_cord, y_cord, piece)
-            x_cord -= 2
-            y_cord -= 2
-
-        elif piece_right_up_jump_is_possible(new_board, x_cord, y_cord, piece):
-            new_board = jump_right_up(new_board, x_cord, y_cord, piece)
-            x_cord += 2
-            y_cord -= 2
-
-    return new_board
-
-
-# Helper function to generate jumps
-def generate_red_piece_jumps(game_state, x_cord, y_cord, piece):
-    curr_board = copy.deepcopy(game_state.board)
-    resulting_states = []
-    # Note that red pieces can only jump up
-    # Check if the piece can jump left:
-    if piece_left_up_jump_is_possible(curr_board, x_cord, y_cord, piece):
-        board_left = jump_left_up(curr_board, x_cord, y_cord, piece)
-        x_cord -= 2
-        y_cord -= 2
-        result_left = consecutive_jumps_up(board_left, x_cord, y_cord, piece)  # Conduct consecutive jumps
-        resulting_states.append(State(result_left, game_state.depth + 1, game_state))
-    if piece_right_up_jump_is_possible(curr_board, x_cord, y_cord, piece):
-        board_right = jump_right_up(curr_board, x_cord, y_cord, piece)
-        x_cord += 2
-        y_cord -= 2
-        result_right = consecutive_jumps_up(board_right, x_cord, y_cord, piece)
-        resulting_states.append(State(result_right, game_state.depth + 1, game_state))
-
-    return resulting_states
-
-
 # Helper function to conduct simple move left
 def move_piece_left_up(board, x_cord, y_cord, piece):
     new_board = copy.deepcopy(board)
@@ -204,14 +258,17 @@ def generate_red_piece_simple_moves(game_state, x_cord, y_cord, piece):
 
 
 # Helper function to move the selected red pieces
+# With mirrored, directions are tried in the opposite order (see generate_red_moves)
 # Returns a list of possible states
-def move_red_piece(game_state, x_cord, y_cord, piece):
+def move_red_piece(game_state, x_cord, y_cord, piece, mirrored=False):
     # First, consider jumps
-    jump_states = generate_red_piece_jumps(game_state, x_cord, y_cord, piece)  # Get the jumps if possible
+    directions = MAN_JUMPS[::-1] if mirrored else MAN_JUMPS
+    jump_states = generate_piece_jumps(game_state, x_cord, y_cord, piece, directions)  # Get the jumps if possible
     if jump_states:  # there are jumps that can be made
         return jump_states, 1
     else:
-        return generate_red_piece_simple_moves(game_state, x_cord, y_cord, piece), 0
+        simple_list = generate_red_piece_simple_moves(game_state, x_cord, y_cord, piece)
+        return simple_list[::-1] if mirrored else simple_list, 0
 
 
 # Boolean helper to check whether if the piece can jump left and down
@@ -280,48 +337,6 @@ def jump_right_down(board, x_cord, y_cord, piece):
     return result
 
 
-# Helper function to do consecutive jumps down
-def consecutive_jumps_down(board, x_cord, y_cord, piece):
-    new_board = copy.deepcopy(board)
-
-    while piece_left_down_jump_is_possible(new_board, x_cord, y_cord, piece) or \
-            piece_right_down_jump_is_possible(new_board, x_cord, y_cord, piece):
-
-        if piece_left_down_jump_is_possible(new_board, x_cord, y_cord, piece):
-            new_board = jump_left_down(new_board, x_cord, y_cord, piece)
-            x_cord -= 2
-            y_cord += 2
-
-        elif piece_right_down_jump_is_possible(new_board, x_cord, y_cord, piece):
-            new_board = jump_right_down(new_board, x_cord, y_cord, piece)
-            x_cord += 2
-            y_cord += 2
-
-    return new_board
-
-
-# Helper function to generate jumps
-def generate_black_piece_jumps(game_state, x_cord, y_cord, piece):
-    curr_board = copy.deepcopy(game_state.board)
-    resulting_states = []
-    # Note that black pieces can only jump down
-    # Check if the piece can jump left:
-    if piece_left_down_jump_is_possible(curr_board, x_cord, y_cord, piece):
-        board_left = jump_left_down(curr_board, x_cord, y_cord, piece)
-        x_cord -= 2
-        y_cord += 2
-        result_left = consecutive_jumps_down(board_left, x_cord, y_cord, piece)  # Conduct consecutive jumps
-        resulting_states.append(State(result_left, game_state.depth + 1, game_state))
-    if piece_right_down_jump_is_possible(curr_board, x_cord, y_cord, piece):
-        board_right = jump_right_down(curr_board, x_cord, y_cord, piece)
-        x_cord += 2
-        y_cord += 2
-        result_right = consecutive_jumps_down(board_right, x_cord, y_cord, piece)
-        resulting_states.append(State(result_right, game_state.depth + 1, game_state))
-
-    return resulting_states
-
-
 # Helper function to conduct simple move left
 def move_piece_left_down(board, x_cord, y_cord, piece):
     new_board = copy.deepcopy(board)
@@ -359,119 +374,86 @@ def generate_black_piece_simple_moves(game_state, x_cord, y_cord, piece):
     return result_states
 
 
-# Helper function to move the selected blue pieces
-def move_black_piece(state, x_cord, y_cord, piece):
-
-    # First, consider jumps
-    jump_states = generate_black_piece_jumps(state, x_cord, y_cord, piece)  # Get the jumps if possible
-    if jump_states:  # there are jumps that can be made
-        return jump_states, 1
-    else:
-        return generate_black_piece_simple_moves(state, x_cord, y_cord, piece), 0
+# Jump directions as (check, jump, x step, y step), in the order red tries them
+MAN_JUMPS = [(piece_left_up_jump_is_possible, jump_left_up, -2, -2),
+             (piece_right_up_jump_is_possible, jump_right_up, 2, -2)]
+KING_JUMPS = MAN_JUMPS + [(piece_left_down_jump_is_possible, jump_left_down, -2, 2),
+                          (piece_right_down_jump_is_possible, jump_right_down, 2, 2)]
 
 
-# Helper function to generate consecutive jumps for the king
-def consecutive_jumps_king(board, x_cord, y_cord, piece):
+# Helper function to do consecutive jumps, always taking the first possible direction
+def consecutive_jumps(board, x_cord, y_cord, piece, directions):
     new_board = copy.deepcopy(board)
 
-    while piece_left_down_jump_is_possible(new_board, x_cord, y_cord, piece) or \
-            piece_right_down_jump_is_possible(new_board, x_cord, y_cord, piece) or \
-            piece_left_up_jump_is_possible(new_board, x_cord, y_cord, piece) or \
-            piece_right_up_jump_is_possible(new_board, x_cord, y_cord, piece):
-
-        if piece_left_up_jump_is_possible(new_board, x_cord, y_cord, piece):
-            new_board = jump_left_up(new_board, x_cord, y_cord, piece)
-            x_cord -= 2
-            y_cord -= 2
-
-        elif piece_right_up_jump_is_possible(new_board, x_cord, y_cord, piece):
-            new_board = jump_right_up(new_board, x_cord, y_cord, piece)
-            x_cord += 2
-            y_cord -= 2
-
-        elif piece_left_down_jump_is_possible(new_board, x_cord, y_cord, piece):
-            new_board = jump_left_down(new_board, x_cord, y_cord, piece)
-            x_cord -= 2
-            y_cord += 2
-
-        elif piece_right_down_jump_is_possible(new_board, x_cord, y_cord, piece):
-            new_board = jump_right_down(new_board, x_cord, y_cord, piece)
-            x_cord += 2
-            y_cord += 2
+    jumped = True
+    while jumped:
+        jumped = False
+        for jump_is_possible, jump, x_step, y_step in directions:
+            if jump_is_possible(new_board, x_cord, y_cord, piece):
+                new_board = jump(new_board, x_cord, y_cord, piece)
+                x_cord += x_step
+                y_cord += y_step
+                jumped = True
+                break
 
     return new_board
 
 
-# Helper to generate jumps for the king
-def generate_king_jumps(game_state, x_cord, y_cord, player):
+# Helper function to generate the jumps of a piece, trying the directions in order
+# Each direction is checked from the square the previous one landed on
+def generate_piece_jumps(game_state, x_cord, y_cord, piece, directions):
     curr_board = copy.deepcopy(game_state.board)
     resulting_states = []
-    # Note that the king can go both forward and backward, regardless of the color
-    # Check if the piece can jump left:
-    if piece_left_up_jump_is_possible(curr_board, x_cord, y_cord, player):  # Can jump left and up
-        board_left = jump_left_up(curr_board, x_cord, y_cord, player)
-        x_cord -= 2
-        y_cord -= 2
-        result_left_up = consecutive_jumps_king(board_left, x_cord, y_cord, player)  # Conduct consecutive jumps
-        resulting_states.append(State(result_left_up, game_state.depth + 1, game_state))
-
-    if piece_right_up_jump_is_possible(curr_board, x_cord, y_cord, player):  # Can jump right and up
-        board_right = jump_right_up(curr_board, x_cord, y_cord, player)
-        x_cord += 2
-        y_cord -= 2
-        result_right_up = consecutive_jumps_king(board_right, x_cord, y_cord, player)
-        resulting_states.append(State(result_right_up, game_state.depth + 1, game_state))
-
-    if piece_left_down_jump_is_possible(curr_board, x_cord, y_cord, player):
-        board_left = jump_left_down(curr_board, x_cord, y_cord, player)
-        x_cord -= 2
-        y_cord += 2
-        result_left_down = consecutive_jumps_king(board_left, x_cord, y_cord, player)
-        resulting_states.append(State(result_left_down, game_state.depth + 1, game_state))
-
-    if piece_right_down_jump_is_possible(curr_board, x_cord, y_cord, player):
-        board_right = jump_right_down(curr_board, x_cord, y_cord, player)
-        x_cord += 2
-        y_cord += 2
-        result_right_down = consecutive_jumps_king(board_right, x_cord, y_cord, player)
-        resulting_states.append(State(result_right_down, game_state.depth + 1, game_state))
+    for jump_is_possible, jump, x_step, y_step in directions:
+        if jump_is_possible(curr_board, x_cord, y_cord, piece):
+            jumped_board = jump(curr_board, x_cord, y_cord, piece)
+            x_cord += x_step
+            y_cord += y_step
+            result = consecutive_jumps(jumped_board, x_cord, y_cord, piece, directions)  # Conduct consecutive jumps
+            resulting_states.append(State(result, game_state.depth + 1, game_state))
 
     return resulting_states
 
 
 # Helper function to move the selected king
-def move_king(game_state, x_cord, y_cord, player):
+# With mirrored, directions are tried in the opposite order (see generate_red_moves)
+def move_king(game_state, x_cord, y_cord, player, mirrored=False):
 
     # First, consider jumps
-    jump_states = generate_king_jumps(game_state, x_cord, y_cord, player)
+    directions = KING_JUMPS[::-1] if mirrored else KING_JUMPS
+    jump_states = generate_piece_jumps(game_state, x_cord, y_cord, player, directions)
     if jump_states:
         return jump_states, 1
     else:
         simple_list = generate_red_piece_simple_moves(game_state, x_cord, y_cord, player) + \
                       generate_black_piece_simple_moves(game_state, x_cord, y_cord, player)
 
-        return simple_list, 0
+        return simple_list[::-1] if mirrored else simple_list, 0
 
 
 # Helper function to generate possible successors for red
-def generate_red_moves(game_state):
+# mirrored is set when the board is black's turned by 180 degrees: the squares are
+# then visited, and each piece's directions tried, in the opposite order, which is
+# the order black's own moves take on the unturned board. Multi-jumps take the
+# first possible direction, so the order decides which branch they follow.
+def generate_red_moves(game_state, mirrored=False):
     jump_successors = []
     simple_successors = []
-    for row in range(game_state.height):
-        for column in range(game_state.width):
-            if game_state.board[row][column] == 'r':
-                temp_list, signal = move_red_piece(game_state, column, row, 'r')
-                if signal == 1:
-                    jump_successors += temp_list
-                else:  # simple moves is returned
-                    simple_successors += temp_list
-
-            elif game_state.board[row][column] == 'R':
-                temp_list, signal = move_king(game_state, column, row, 'R')
-                if signal == 1:
-                    jump_successors += temp_list
-                else:  # simple moves is returned
-                    simple_successors += temp_list
+    squares = [(row, column) for row in range(game_state.height) for column in range(game_state.width)]
+    for row, column in reversed(squares) if mirrored else squares:
+        if game_state.board[row][column] == 'r':
+            temp_list, signal = move_red_piece(game_state, column, row, 'r', mirrored)
+            if signal == 1:
+                jump_successors += temp_list
+            else:  # simple moves is returned
+                simple_successors += temp_list
+
+        elif game_state.board[row][column] == 'R':
+            temp_list, signal = move_king(game_state, column, row, 'R', mirrored)
+            if signal == 1:
+                jump_successors += temp_list
+            else:  # simple moves is returned
+                simple_successors += temp_list
 
     if jump_successors:
         return jump_successors
@@ -479,78 +461,52 @@ def generate_red_moves(game_state):
     return simple_successors
 
 
-# Helper function to generate possible successors for blue
-def generate_black_moves(state):
-    jump_successors = []
-    simple_successors = []
-    for row in range(state.height):
-        for column in range(state.width):
-            if state.board[row][column] == 'b':
-                temp_list, signal = move_black_piece(state, column, row, 'b')
-                if signal == 1:
-                    jump_successors += temp_list
-                else:  # simple moves is returned
-                    simple_successors += temp_list
-
-            elif state.board[row][column] == 'B':
-                temp_list, signal = move_king(state, column, row, 'B')
-                if signal == 1:
-                    jump_successors += temp_list
-                else:  # simple moves is returned
-                    simple_successors += temp_list
+# Helper function to turn the board by 180 degrees and swap the colors
+# The result, with the other side to move, is the same position seen from the other
+# side, so one move generator and one table entry serve both colors
+def flip_board(board):
+    return [[COLOR_SWAP[char] for char in reversed(row)] for row in reversed(board)]
 
-    if jump_successors:
-        return jump_successors
-    return simple_successors
+
+# Helper function to give the key of a board as seen by the player, red always moving up
+def oriented_key(board, player):
+    key = board_key(board)
+    if player == 'r':
+        return key
+    return key[::-1].translate(COLOR_SWAP_TABLE)
 
 
 # Helper function to generate possible successors of this state
 # This helper takes a state and returns all possible states for the player specified
+# Black's moves are generated as red's moves on the flipped board
 # Returns a list of states
 def generate_successors(game_state, player):
-    successors = []
     if player == 'r':  # Current player is red
-        successors += generate_red_moves(game_state)
-
-    else:  # Current player is black
-        successors += generate_black_moves(game_state)
-
-    return successors
-
-
-# Helper function to evaluate the Utility of a terminal state
-# Given the state and the current player.
-# Precondition: The state given is a KNOWN terminal state
-def utility_function(game_state, player):
-    curr_board = game_state.board
-
-    # Case 1: no more pieces remain for one of the players
-    red_pieces = 0
-    black_pieces = 0
-    for row in range(game_state.height):
-        for column in range(game_state.width):
-            if curr_board[row][column] == 'r' or curr_board[row][column] == 'R':
-                red_pieces += 1
-            elif curr_board[row][column] == 'b' or curr_board[row][column] == 'B':
-                black_pieces += 1
+        return generate_red_moves(game_state)
 
-    if player == 'r' and red_pieces == 0:  # Current player is red, no more piece remains for red
-        return -np.inf
-    elif player == 'r' and black_pieces == 0:  # Current player is red, no more piece remain for black
-        return np.inf
+    # Current player is black
+    flipped_state = State(flip_board(game_state.board), game_state.depth, game_state.parent)
+    # mirrored keeps the directions in the order black tries them on its own board
+    return [State(flip_board(successor.board), game_state.depth + 1, game_state)
+            for successor in generate_red_moves(flipped_state, mirrored=True)]
 
-    if player == 'b' and red_pieces == 0:  # Current player is red, no more piece remains for red
-        return np.inf
-    elif player == 'b' and black_pieces == 0:  # Current player is red, no more piece remain for black
-        return -np.inf
 
-    # Case 2: no more legal moves left for the current player
-    successors_list = generate_successors(game_state, player)
+# Helper function to set the evaluation weights and rebuild the square value tables
+def set_eval_weights(weights):
+    EVAL_WEIGHTS.update(weights)
+    for row in range(8):
+        for column in range(8):
+            center = 1 if 3 <= row <= 4 and 2 <= column <= 5 else 0
+            RED_MAN_SQUARE_VALUES[row * 8 + column] = (EVAL_WEIGHTS['advancement'] * (7 - row)
+                                                       + EVAL_WEIGHTS['center'] * center
+                                                       + EVAL_WEIGHTS['back_row'] * (row == 7))
+            BLACK_MAN_SQUARE_VALUES[row * 8 + column] = (EVAL_WEIGHTS['advancement'] * row
+                                                         + EVAL_WEIGHTS['center'] * center
+                                                         + EVAL_WEIGHTS['back_row'] * (row == 0))
+            KING_SQUARE_VALUES[row * 8 + column] = EVAL_WEIGHTS['center'] * center
 
-    if not successors_list:  # No legal moves left for the current player
-        return -np.inf
 
-    return 0  # Failsafe return in case if the state passed in isn't a terminal state
+set_eval_weights({})
 
 
 # Helper function to estimate the Utility of a non-terminal state
@@ -560,6 +516,8 @@ def evaluation_function(game_state, player):
     red_kings = 0
     black_pieces = 0
     black_kings = 0
+    red_position = 0
+    black_position = 0
 
     curr_board = game_state.board
 
@@ -567,18 +525,776 @@ def evaluation_function(game_state, player):
         for column in range(game_state.width):
             if curr_board[row][column] == 'r':
                 red_pieces += 1
+                red_position += RED_MAN_SQUARE_VALUES[row * 8 + column]
             elif curr_board[row][column] == 'R':
                 red_kings += 1
+                red_position += KING_SQUARE_VALUES[row * 8 + column]
             elif curr_board[row][column] == 'b':
                 black_pieces += 1
+                black_position += BLACK_MAN_SQUARE_VALUES[row * 8 + column]
             elif curr_board[row][column] == 'B':
                 black_kings += 1
+                black_position += KING_SQUARE_VALUES[row * 8 + column]
+
+    red_score = EVAL_WEIGHTS['king'] * red_kings + EVAL_WEIGHTS['man'] * red_pieces + red_position
+    black_score = EVAL_WEIGHTS['king'] * black_kings + EVAL_WEIGHTS['man'] * black_pieces + black_position
 
     # Case 1: the current player is red
     if player == 'r':
-        return (2 * red_kings + red_pieces) - (2 * black_kings + black_pieces)
+        return red_score - black_score
+
+    return black_score - red_score
+
+
+# ---------------------------------------------------------------------------------
+# Batch evaluation
+# ---------------------------------------------------------------------------------
+# The children of a node one ply above the depth limit are all leaves. They are
+# packed into an (N, 64) int8 array (red men 1, red kings 2, black men -1, black
+# kings -2) and scored together; the same array also tells which of them are quiet.
 
-    return (2 * black_kings + black_pieces) - (2 * red_kings + red_pieces)
+SQUARE_CODES = np.zeros(256, dtype=np.int8)
+SQUARE_CODES[ord('r')] = 1
+SQUARE_CODES[ord('R')] = 2
+SQUARE_CODES[ord('b')] = -1
+SQUARE_CODES[ord('B')] = -2
+SQUARE_CODES[ord('.')] = 0
+DIAGONALS = [(-1, -1), (-1, 1), (1, -1), (1, 1)]  # (row step, column step)
+
+
+# Helper function to pack the boards of the states into an (N, 64) int8 array
+def boards_to_array(states):
+    packed = ''.join(board_key(state.board) for state in states).encode()
+    return SQUARE_CODES[np.frombuffer(packed, dtype=np.uint8)].reshape(len(states), 64)
+
+
+# Same contract as evaluation_function, for a list of states at once
+# Returns a list with the value of every state for the player
+def evaluation_function_batch(states, player, board_array=None):
+    if board_array is None:
+        board_array = boards_to_array(states)
+    red_men = board_array == 1
+    red_kings = board_array == 2
+    black_men = board_array == -1
+    black_kings = board_array == -2
+
+    red_score = (EVAL_WEIGHTS['man'] * red_men.sum(axis=1) + EVAL_WEIGHTS['king'] * red_kings.sum(axis=1)
+                 + red_men @ np.array(RED_MAN_SQUARE_VALUES) + red_kings @ np.array(KING_SQUARE_VALUES))
+    black_score = (EVAL_WEIGHTS['man'] * black_men.sum(axis=1) + EVAL_WEIGHTS['king'] * black_kings.sum(axis=1)
+                   + black_men @ np.array(BLACK_MAN_SQUARE_VALUES) + black_kings @ np.array(KING_SQUARE_VALUES))
+
+    if player == 'r':
+        return (red_score - black_score).tolist()
+    return (black_score - red_score).tolist()
+
+
+# Helper function to find, for every board in the array, whether the player has a
+# jump and whether the player has any legal move. Mirrors the move generator:
+# men step and jump forward only, kings in all four directions.
+def batch_move_flags(board_array, player):
+    sign = 1 if player == 'r' else -1
+    forward = -1 if player == 'r' else 1
+    padded = np.full((len(board_array), 12, 12), 99, dtype=np.int8)  # Off-board squares are never empty
+    padded[:, 2:10, 2:10] = board_array.reshape(-1, 8, 8)
+    board = padded[:, 2:10, 2:10]
+    men = board == sign
+    kings = board == 2 * sign
+
+    has_jump = np.zeros(len(board_array), dtype=bool)
+    has_move = np.zeros(len(board_array), dtype=bool)
+    for row_step, column_step in DIAGONALS:
+        movers = kings | men if row_step == forward else kings
+        near = padded[:, 2 + row_step:10 + row_step, 2 + column_step:10 + column_step]
+        far = padded[:, 2 + 2 * row_step:10 + 2 * row_step, 2 + 2 * column_step:10 + 2 * column_step]
+        has_move |= (movers & (near == 0)).any(axis=(1, 2))
+        has_jump |= (movers & (near * sign < 0) & (far == 0)).any(axis=(1, 2))
+
+    return has_jump, has_move | has_jump
+
+
+# Helper function to score the leaves that need no quiescence search
+# Returns one value per state for the player to move there, or None when the state
+# is covered by the tablebase, has a capture pending or has no legal move. With the
+# search tables and the ply of the leaves, a leaf is also None when negamax would
+# score it otherwise: a repetition, a no-progress draw or a transposition table hit.
+def evaluate_quiet_leaves(states, player, tables=None, ply=None):
+    board_array = boards_to_array(states)
+    has_jump, has_move = batch_move_flags(board_array, player)
+    values = evaluation_function_batch(states, player, board_array)
+    for position, state in enumerate(states):
+        if has_jump[position] or not has_move[position] or probe_tablebase(state, player) is not None:
+            values[position] = None
+        elif tables is not None:
+            key = oriented_key(state.board, player)
+            if key + player in tables.repetitions or key in tables.transpositions or \
+                    (tables.quiet_plies + ply >= NO_PROGRESS_LIMIT and men_key(state.board) == tables.root_men):
+                values[position] = None
+    return values
+
+
+# Measures the cost per leaf of the scalar and the batched evaluation on the
+# children of the given states. Returns (scalar seconds, batch seconds) per leaf.
+def benchmark_evaluation(states, player, repeat=20):
+    leaves = [successor for state in states for successor in generate_successors(state, player)]
+    if not leaves:
+        return 0.0, 0.0
+    next_player = get_next_turn(player)
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        scalar_values = [evaluation_function(leaf, next_player) for leaf in leaves]
+    scalar_time = (time.perf_counter() - start) / (repeat * len(leaves))
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        batch_values = evaluation_function_batch(leaves, next_player)
+    batch_time = (time.perf_counter() - start) / (repeat * len(leaves))
+
+    if scalar_values != batch_values:
+        raise ValueError("Batch evaluation disagrees with evaluation_function")
+    return scalar_time, batch_time
+
+
+# ---------------------------------------------------------------------------------
+# Compact boards
+# ---------------------------------------------------------------------------------
+# A compact board is the 64 squares of a board, row by row, as bytes with the same
+# characters (board_key(board) encoded), so square row * 8 + column is one byte and
+# dark square number n is byte n // 2 of its row pair. A move copies 64 bytes
+# instead of deep-copying eight lists. The generator below follows the list-based
+# helpers step by step, including the order in which a piece tries its jumps and
+# the square its later jump directions are tried from, so it gives the same
+# successors as generate_successors. It is used where positions are generated in
+# bulk: the tablebase builder and the MCTS playouts.
+
+RED_MAN, RED_KING, BLACK_MAN, BLACK_KING, EMPTY = b'rRbB.'
+COMPACT_COLOR_SWAP = bytes.maketrans(b'rRbB', b'bBrR')
+MAN_JUMP_DIRECTIONS = [(-1, -1), (-1, 1)]  # (row step, column step), in the order tried
+KING_JUMP_DIRECTIONS = [(-1, -1), (-1, 1), (1, -1), (1, 1)]
+DARK_CELLS = [row * 8 + column for row, column in DARK_SQUARES]
+
+
+# Helper functions to convert between boards and compact boards
+def board_to_compact(board):
+    return board_key(board).encode()
+
+
+def compact_to_board(cells):
+    return [list(cells[row * 8:row * 8 + 8].decode()) for row in range(8)]
+
+
+# Helper function to turn a compact board by 180 degrees and swap the colors, as flip_board
+def flip_compact(cells):
+    return bytes(cells[::-1].translate(COMPACT_COLOR_SWAP))
+
+
+# Boolean helper to check whether the red piece on (row, column) can jump in a direction
+def compact_jump_is_possible(cells, row, column, row_step, column_step):
+    if not (0 <= row + 2 * row_step <= 7 and 0 <= column + 2 * column_step <= 7):
+        return False
+    return cells[(row + row_step) * 8 + column + column_step] in (BLACK_MAN, BLACK_KING) and \
+        cells[(row + 2 * row_step) * 8 + column + 2 * column_step] == EMPTY
+
+
+# Helper function to jump a red piece in a direction
+# Returns a new compact board with the piece jumping
+def compact_jump(cells, row, column, row_step, column_step, piece):
+    result = bytearray(cells)
+    landing_row = row + 2 * row_step
+    if landing_row == 0 and piece == RED_MAN:  # The red piece reached the top row
+        result[landing_row * 8 + column + 2 * column_step] = RED_KING
+    else:
+        result[landing_row * 8 + column + 2 * column_step] = piece
+    result[(row + row_step) * 8 + column + column_step] = EMPTY  # The black piece is captured
+    result[row * 8 + column] = EMPTY
+    return result
+
+
+# Helper function to do consecutive jumps, always taking the first possible direction
+def compact_consecutive_jumps(cells, row, column, piece, directions):
+    while True:
+        for row_step, column_step in directions:
+            if compact_jump_is_possible(cells, row, column, row_step, column_step):
+                cells = compact_jump(cells, row, column, row_step, column_step, piece)
+                row += 2 * row_step
+                column += 2 * column_step
+                break
+        else:
+            return bytes(cells)
+
+
+# Helper function to generate the jumps of one red piece
+# As in generate_piece_jumps, each direction is tried
+# from the square the previous jump landed on
+def compact_piece_jumps(cells, row, column, piece, directions):
+    results = []
+    for row_step, column_step in directions:
+        if compact_jump_is_possible(cells, row, column, row_step, column_step):
+            jumped = compact_jump(cells, row, column, row_step, column_step, piece)
+            row += 2 * row_step
+            column += 2 * column_step
+            results.append(compact_consecutive_jumps(jumped, row, column, piece, directions))
+    return results
+
+
+# Helper function to generate the simple moves of one red piece
+def compact_piece_simple_moves(cells, row, column, piece):
+    results = []
+    row_steps = (-1, 1) if piece == RED_KING else (-1,)
+    for row_step in row_steps:
+        for column_step in (-1, 1):
+            target_row, target_column = row + row_step, column + column_step
+            if 0 <= target_row <= 7 and 0 <= target_column <= 7 and cells[target_row * 8 + target_column] == EMPTY:
+                result = bytearray(cells)
+                if target_row == 0 and piece == RED_MAN:  # The red piece reached the top row
+                    result[target_row * 8 + target_column] = RED_KING
+                else:
+                    result[target_row * 8 + target_column] = piece
+                result[row * 8 + column] = EMPTY
+                results.append(bytes(result))
+    return results
+
+
+# Helper function to generate the successors of a compact board for red
+# mirrored visits the squares and directions in the opposite order, as in generate_red_moves
+def compact_red_successors(cells, mirrored=False):
+    jump_successors = []
+    simple_successors = []
+    for square in range(63, -1, -1) if mirrored else range(64):
+        piece = cells[square]
+        if piece != RED_MAN and piece != RED_KING:
+            continue
+        row, column = divmod(square, 8)
+        directions = MAN_JUMP_DIRECTIONS if piece == RED_MAN else KING_JUMP_DIRECTIONS
+        jumps = compact_piece_jumps(cells, row, column, piece, directions[::-1] if mirrored else directions)
+        if jumps:
+            jump_successors += jumps
+        elif not jump_successors:  # Simple moves only count while no piece can jump
+            simple_moves = compact_piece_simple_moves(cells, row, column, piece)
+            simple_successors += simple_moves[::-1] if mirrored else simple_moves
+
+    if jump_successors:
+        return jump_successors
+    return simple_successors
+
+
+# Helper function to generate the successors of a compact board for the player
+# Black's moves are generated as red's moves on the flipped board
+# Returns a list of compact boards
+def compact_successors(cells, player):
+    if player == 'r':
+        return compact_red_successors(cells)
+    return [flip_compact(successor) for successor in compact_red_successors(flip_compact(cells), mirrored=True)]
+
+
+# Helper function to estimate the utility of a compact board for the player, as
+# evaluation_function does for a state
+def compact_evaluation(cells, player):
+    scores = {}
+    for piece, weight, square_values in ((RED_MAN, EVAL_WEIGHTS['man'], RED_MAN_SQUARE_VALUES),
+                                         (RED_KING, EVAL_WEIGHTS['king'], KING_SQUARE_VALUES),
+                                         (BLACK_MAN, EVAL_WEIGHTS['man'], BLACK_MAN_SQUARE_VALUES),
+                                         (BLACK_KING, EVAL_WEIGHTS['king'], KING_SQUARE_VALUES)):
+        score = 0
+        square = cells.find(piece)
+        while square != -1:
+            score += weight + square_values[square]
+            square = cells.find(piece, square + 1)
+        scores[piece] = score
+
+    red_score = scores[RED_MAN] + scores[RED_KING]
+    black_score = scores[BLACK_MAN] + scores[BLACK_KING]
+    if player == 'r':
+        return red_score - black_score
+    return black_score - red_score
+
+
+# compact_successors with the signature of generate_successors, as a perft backend
+def generate_successors_compact(game_state, player):
+    return [State(compact_to_board(successor), game_state.depth + 1, game_state)
+            for successor in compact_successors(board_to_compact(game_state.board), player)]
+
+
+# ---------------------------------------------------------------------------------
+# Perft
+# ---------------------------------------------------------------------------------
+# perft counts the leaves of the full move tree to a fixed depth, so a change to the
+# move generator can be checked against known counts. A move generator backend is any
+# function with the signature of generate_successors; the differential mode walks the
+# tree of one backend and compares the successor set of every node with the other's.
+
+MOVE_GENERATORS = {'default': generate_successors, 'compact': generate_successors_compact}
+
+
+# Helper function to look up a move generator by name, or by "module:function"
+def get_move_generator(name):
+    if name in MOVE_GENERATORS:
+        return MOVE_GENERATORS[name]
+    if ':' not in name:
+        raise ValueError("Unknown move generator: {}".format(name))
+    module_name, function_name = name.split(':', 1)
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+# Counts the leaves of the move tree of the given depth below the state
+# The successors of the last ply are counted, not generated one by one
+def perft(game_state, player, depth, generator=generate_successors):
+    if depth == 0:
+        return 1
+    successors = generator(game_state, player)
+    if depth == 1:
+        return len(successors)
+
+    next_player = get_next_turn(player)
+    return sum(perft(successor, next_player, depth - 1, generator) for successor in successors)
+
+
+# Runs perft at every depth up to the given one for each (board, player) position
+# Yields (position number, depth, leaves, seconds)
+def perft_positions(positions, depth, generator=generate_successors):
+    for number, (board, player) in enumerate(positions):
+        for current_depth in range(1, depth + 1):
+            start = time.perf_counter()
+            leaves = perft(State(board, 0), player, current_depth, generator)
+            yield number, current_depth, leaves, time.perf_counter() - start
+
+
+# Helper function to turn a list of successors into a sorted list of board keys
+# Duplicate successors are kept, so a generator that repeats a move is caught
+def successor_keys(successors):
+    return sorted(board_key(successor.board) for successor in successors)
+
+
+# Walks the move tree of the first generator to the given depth and compares the
+# successors of every node with those of the second generator.
+# Returns None, or (board, player, moves to the node, keys only in the first, keys
+# only in the second) for the first node where the two successor sets differ
+def perft_divergence(game_state, player, depth, generator, other_generator, path=()):
+    successors = generator(game_state, player)
+    keys = successor_keys(successors)
+    other_keys = successor_keys(other_generator(game_state, player))
+    if keys != other_keys:
+        only_first = [key for key in keys if keys.count(key) > other_keys.count(key)]
+        only_second = [key for key in other_keys if other_keys.count(key) > keys.count(key)]
+        return game_state.board, player, list(path), sorted(set(only_first)), sorted(set(only_second))
+    if depth <= 1:
+        return None
+
+    next_player = get_next_turn(player)
+    for successor in successors:
+        divergence = perft_divergence(successor, next_player, depth - 1, generator, other_generator,
+                                      path + (move_key(game_state.board, successor.board, player),))
+        if divergence is not None:
+            return divergence
+    return None
+
+
+# Prints the perft counts of the positions and the leaves per second
+def perft_report(positions, depth, generator_name='default', output=sys.stdout):
+    generator = get_move_generator(generator_name)
+    total_leaves = 0
+    total_time = 0.0
+    for number, current_depth, leaves, seconds in perft_positions(positions, depth, generator):
+        print("position {} depth {}: {} leaves in {:.3f} s ({:.0f} nodes/s)".format(
+            number, current_depth, leaves, seconds, leaves / seconds if seconds else 0.0), file=output)
+        if current_depth == depth:
+            total_leaves += leaves
+            total_time += seconds
+    print("total depth {}: {} leaves in {:.3f} s ({:.0f} nodes/s)".format(
+        depth, total_leaves, total_time, total_leaves / total_time if total_time else 0.0), file=output)
+
+
+# Compares two move generators on the positions, reporting the first divergence
+# Returns True if the generators agree on every node
+def perft_compare(positions, depth, generator_name, other_name, output=sys.stdout):
+    generator = get_move_generator(generator_name)
+    other_generator = get_move_generator(other_name)
+    for number, (board, player) in enumerate(positions):
+        divergence = perft_divergence(State(board, 0), player, depth, generator, other_generator)
+        if divergence is not None:
+            node_board, node_player, path, only_first, only_second = divergence
+            print("position {}: diverges at {} after moves {}".format(
+                number, board_to_fen(node_board, node_player), path), file=output)
+            for name, keys in [(generator_name, only_first), (other_name, only_second)]:
+                for key in keys:
+                    print("  only {}: {}".format(
+                        name, board_to_fen([list(key[row * 8:row * 8 + 8]) for row in range(8)],
+                                           get_next_turn(node_player))), file=output)
+            return False
+        print("position {}: agree to depth {}".format(number, depth), file=output)
+    return True
+
+
+# ---------------------------------------------------------------------------------
+# Endgame tablebase
+# ---------------------------------------------------------------------------------
+# Every position with at most N pieces is given a perfect index: the material
+# signature (red men, red kings, black men, black kings) selects a block, and
+# inside a block the squares of each piece kind are ranked with the combinatorial
+# number system over the 32 dark squares that are still free. The value of a
+# position is stored in one byte:
+#   0      -> draw (or a position that can not occur)
+#   d + 1  -> the side to move wins (d odd) or loses (d even) in d plies
+#
+# A block is solved by retrograde analysis on compact boards: one pass generates
+# the moves of every position, looking captures and promotions up in earlier
+# blocks, and the positions are then resolved in order of distance. The moves that
+# stay inside a block are quiet moves, which are found backwards from a resolved
+# position by un-moving a piece, so no predecessor lists are kept; the per-position
+# state is a few bytes in flat arrays. Building takes about half a minute for up to
+# 3 pieces and about a quarter of an hour for 4 (16.6 million positions); 5 pieces
+# (403 million positions) is out of reach of this pure Python builder.
+
+TABLEBASE_PIECES = ['r', 'R', 'b', 'B']  # Order in which the piece kinds are placed in an index
+TABLEBASE_PIECE_CODES = ''.join(TABLEBASE_PIECES).encode()  # The same order on compact boards
+# comb(n, k) for every n up to the number of dark squares, one list per k
+TABLEBASE_COMBINATIONS = [[comb(n, k) for n in range(len(DARK_SQUARES) + 1)] for k in range(len(DARK_SQUARES) + 1)]
+TABLEBASE_MAGIC = b'CKTB'
+TABLEBASE_WIN_SCORE = 500  # Score of a won tablebase position, minus its distance
+tablebase = None  # The loaded Tablebase, probed by the search when set
+
+
+# Helper function to list the material signatures with up to max_pieces pieces
+# Signatures are ordered so that every capture or promotion leads to an earlier one
+def tablebase_signatures(max_pieces):
+    signatures = []
+    for total in range(2, max_pieces + 1):
+        for red in range(1, total):
+            black = total - red
+            for red_kings in range(red + 1):
+                for black_kings in range(black + 1):
+                    signatures.append((red - red_kings, red_kings, black - black_kings, black_kings))
+
+    signatures.sort(key=lambda signature: (sum(signature), signature[0] + signature[2]))
+    return signatures
+
+
+# Helper function to return the number of positions (both sides to move) in a signature
+def signature_size(signature):
+    size = 2
+    free_squares = len(DARK_SQUARES)
+    for count in signature:
+        size *= comb(free_squares, count)
+        free_squares -= count
+    return size
+
+
+# Helper function to count the pieces on a board and return its material signature
+# Returns None if a piece stands on a light square and thus can not be indexed
+def board_signature(board):
+    counts = {'r': 0, 'R': 0, 'b': 0, 'B': 0}
+    for row in range(len(board)):
+        for column in range(len(board[row])):
+            char = board[row][column]
+            if char in counts:
+                if (row + column) % 2 == 0:
+                    return None
+                counts[char] += 1
+
+    return tuple(counts[piece] for piece in TABLEBASE_PIECES)
+
+
+# Helper function to compute the perfect index of a board inside its signature block
+def tablebase_index(board, player):
+    return compact_tablebase_index(board_to_compact(board), player)
+
+
+# Helper function to give the material signature of a compact board whose pieces all
+# stand on dark squares
+def compact_signature(cells):
+    return cells.count(RED_MAN), cells.count(RED_KING), cells.count(BLACK_MAN), cells.count(BLACK_KING)
+
+
+# Helper function to compute the perfect index of a compact board inside its signature block
+def compact_tablebase_index(cells, player):
+    index = 0
+    used = 0  # Mask of the dark squares taken by earlier kinds
+    free_squares = len(DARK_SQUARES)
+    for piece in TABLEBASE_PIECE_CODES:
+        rank = 0
+        count = 0
+        taken = 0
+        square = cells.find(piece)
+        while square != -1:
+            number = square >> 1  # The number of the dark square
+            count += 1
+            # Relative number of the square among the squares not taken by earlier kinds
+            rank += TABLEBASE_COMBINATIONS[count][number - bin(used & ((1 << number) - 1)).count('1')]
+            taken |= 1 << number
+            square = cells.find(piece, square + 1)
+        index = index * TABLEBASE_COMBINATIONS[count][free_squares] + rank
+        free_squares -= count
+        used |= taken
+
+    return index * 2 + (0 if player == 'r' else 1)
+
+
+# Helper function to rebuild the compact board and the player to move from an index
+def tablebase_unindex(signature, index):
+    player = 'r' if index % 2 == 0 else 'b'
+    index //= 2
+
+    # Split the index into one combinatorial rank per piece kind
+    ranks = []
+    free_squares = len(DARK_SQUARES) - sum(signature)
+    for count in reversed(signature):
+        size = comb(free_squares + count, count)
+        ranks.append(index % size)
+        index //= size
+        free_squares += count
+    ranks.reverse()
+
+    cells = bytearray(b'.' * 64)
+    free = list(range(len(DARK_SQUARES)))
+    for piece, count, rank in zip(TABLEBASE_PIECE_CODES, signature, ranks):
+        relatives = []
+        for position in range(count, 0, -1):  # Unrank the combination, largest element first
+            # The largest relative square whose binomial coefficient fits in the rank
+            relative = bisect_right(TABLEBASE_COMBINATIONS[position], rank) - 1
+            rank -= TABLEBASE_COMBINATIONS[position][relative]
+            relatives.append(relative)
+        for relative in relatives:
+            cells[DARK_CELLS[free[relative]]] = piece
+        for relative in sorted(relatives, reverse=True):
+            del free[relative]
+
+    return bytes(cells), player
+
+
+# Helper function to tell whether a compact board can occur in a game
+# Men never stand on the row where they would have been crowned
+def tablebase_position_is_legal(cells):
+    return RED_MAN not in cells[:8] and BLACK_MAN not in cells[56:]
+
+
+# Helper function to generate the compact boards that reach the given one by a quiet
+# move (no capture, no promotion) of the player
+def compact_unmoves(cells, player):
+    man, king = (RED_MAN, RED_KING) if player == 'r' else (BLACK_MAN, BLACK_KING)
+    man_row_steps = (1,) if player == 'r' else (-1,)  # Men come back from behind them
+    results = []
+    for square in range(64):
+        piece = cells[square]
+        if piece != man and piece != king:
+            continue
+        row, column = divmod(square, 8)
+        for row_step in (man_row_steps if piece == man else (-1, 1)):
+            for column_step in (-1, 1):
+                origin_row, origin_column = row + row_step, column + column_step
+                if 0 <= origin_row <= 7 and 0 <= origin_column <= 7 and \
+                        cells[origin_row * 8 + origin_column] == EMPTY:
+                    result = bytearray(cells)
+                    result[origin_row * 8 + origin_column] = piece
+                    result[square] = EMPTY
+                    results.append(bytes(result))
+    return results
+
+
+# Helper function to turn a stored byte into a score for the player to move
+def tablebase_score(value):
+    if value == 0:
+        return 0
+    distance = value - 1
+    if distance % 2 == 1:
+        return TABLEBASE_WIN_SCORE - distance
+    return -(TABLEBASE_WIN_SCORE - distance)
+
+
+# Helper function to solve one signature block by retrograde analysis
+# solved maps every earlier signature to its values, so captures and promotions
+# can be looked up directly. Returns a bytearray with one value per index.
+def solve_tablebase_signature(signature, solved):
+    size = signature_size(signature)
+    values = bytearray(size)
+    resolved = bytearray(size)
+    remaining = bytearray(size)  # Successors not yet known to be won by the opponent
+    longest_win = array('H', bytes(2 * size))  # Longest opponent win seen among the successors
+    can_draw = bytearray(size)
+    quiet = bytearray(size)  # Whether the moves stay in the block, so un-moves reach the position
+    queue = {}  # Distance -> indices to resolve at that distance
+
+    for index in range(size):
+        cells, player = tablebase_unindex(signature, index)
+        if not tablebase_position_is_legal(cells):
+            resolved[index] = 1
+            continue
+
+        successors = compact_successors(cells, player)
+        if not successors:  # The player to move is stuck (or has no pieces left): lost in 0
+            queue.setdefault(0, array('I')).append(index)
+            continue
+
+        remaining[index] = len(successors)
+        best_win = None
+        for successor in successors:
+            successor_signature = compact_signature(successor)
+            if successor_signature == signature:
+                quiet[index] = 1
+                continue
+
+            if successor_signature not in solved:  # The opponent has no pieces left
+                best_win = 1
+                continue
+            value = solved[successor_signature][compact_tablebase_index(successor, get_next_turn(player))]
+            if value == 0:
+                can_draw[index] = 1
+            elif (value - 1) % 2 == 0:  # The opponent loses after this move
+                if best_win is None or value < best_win:
+                    best_win = value
+            else:
+                remaining[index] -= 1
+                longest_win[index] = max(longest_win[index], value - 1)
+
+        if best_win is not None:
+            queue.setdefault(best_win, array('I')).append(index)
+        elif remaining[index] == 0 and not can_draw[index]:
+            queue.setdefault(longest_win[index] + 1, array('I')).append(index)
+
+    # Resolve positions in order of distance, propagating to their predecessors
+    while queue:
+        distance = min(queue)
+        for index in queue.pop(distance):
+            if resolved[index]:
+                continue
+            resolved[index] = 1
+            capped = min(distance, 254 - distance % 2)
+            values[index] = capped + 1
+
+            cells, player = tablebase_unindex(signature, index)
+            predecessor_player = get_next_turn(player)
+            for predecessor_cells in compact_unmoves(cells, predecessor_player):
+                predecessor = compact_tablebase_index(predecessor_cells, predecessor_player)
+                if resolved[predecessor] or not quiet[predecessor]:  # Not reached, or jumps are forced
+                    continue
+                if distance % 2 == 0:  # A move into this lost position wins
+                    queue.setdefault(distance + 1, array('I')).append(predecessor)
+                else:
+                    remaining[predecessor] -= 1
+                    longest_win[predecessor] = max(longest_win[predecessor], distance)
+                    if remaining[predecessor] == 0 and not can_draw[predecessor]:
+                        queue.setdefault(longest_win[predecessor] + 1, array('I')).append(predecessor)
+
+    return values
+
+
+# Generates the tablebase for up to max_pieces pieces and writes it to filename
+# File layout: magic, piece limit, block count, then one (signature, offset, size)
+# entry per block, followed by the value bytes of all blocks.
+def build_tablebase(filename, max_pieces, verbose=False):
+    signatures = tablebase_signatures(max_pieces)
+    solved = {}
+    for signature in signatures:
+        start = time.time()
+        solved[signature] = solve_tablebase_signature(signature, solved)
+        if verbose:
+            print("Solved {} ({} positions) in {:.1f}s".format(
+                signature, len(solved[signature]), time.time() - start))
+
+    header_size = 4 + 4 + 4 + len(signatures) * (4 + 8 + 8)
+    with open(filename, "wb") as tablebase_file:
+        tablebase_file.write(TABLEBASE_MAGIC)
+        tablebase_file.write(struct.pack("<II", max_pieces, len(signatures)))
+        offset = header_size
+        for signature in signatures:
+            tablebase_file.write(struct.pack("<4BQQ", *signature, offset, len(solved[signature])))
+            offset += len(solved[signature])
+        for signature in signatures:
+            tablebase_file.write(solved[signature])
+
+
+class Tablebase:
+    # This class gives read access to a tablebase file through a memory map.
+    # filename : the file written by build_tablebase
+    def __init__(self, filename):
+        self.filename = filename
+        self.file = open(filename, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.data[:4] != TABLEBASE_MAGIC:
+            raise ValueError("{} is not a checkers tablebase".format(filename))
+
+        self.max_pieces, block_count = struct.unpack_from("<II", self.data, 4)
+        self.blocks = {}
+        for block in range(block_count):
+            entry = struct.unpack_from("<4BQQ", self.data, 12 + block * 20)
+            self.blocks[tuple(entry[:4])] = (entry[4], entry[5])
+        self.hits = 0
+
+    # Returns the score of the board for the player to move, or None if not covered
+    def probe(self, board, player):
+        signature = board_signature(board)
+        if signature is None or signature not in self.blocks:
+            return None
+
+        offset, _ = self.blocks[signature]
+        self.hits += 1
+        return tablebase_score(self.data[offset + tablebase_index(board, player)])
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+
+# Helper function to probe the loaded tablebase, if any
+def probe_tablebase(game_state, player):
+    if tablebase is None:
+        return None
+    pieces = 64 - sum(row.count('.') for row in game_state.board)
+    if pieces > tablebase.max_pieces:
+        return None
+    return tablebase.probe(game_state.board, player)
+
+
+# Helper function to tell whether the successors of a state are captures
+# Jumps are forced, so either every successor captures or none of them does
+def successors_are_captures(game_state, successors, player):
+    if not successors:
+        return False
+    opponent = get_opp_char(player)
+    before = sum(row.count(opponent[0]) + row.count(opponent[1]) for row in game_state.board)
+    after = sum(row.count(opponent[0]) + row.count(opponent[1]) for row in successors[0].board)
+    return after < before
+
+
+# This function extends the search at the depth limit until no capture is pending
+# Only captures are searched, and the value is given for the player to move
+def quiescence(game_state, alpha, beta, player, ply):
+    quiescence_stats['nodes'] += 1
+    quiescence_stats['max_ply'] = max(quiescence_stats['max_ply'], ply)
+
+    tablebase_value = probe_tablebase(game_state, player)
+    if tablebase_value is not None:
+        return tablebase_value
+
+    successors = generate_successors(game_state, player)
+    if not successors:  # No legal moves left for the current player
+        return -(WIN_SCORE - ply)
+    if not successors_are_captures(game_state, successors, player):  # The position is quiet
+        return evaluation_function(game_state, player)
+    if quiescence_stats['nodes'] - quiescence_stats['leaf_start'] >= QUIESCENCE_NODE_LIMIT:
+        quiescence_stats['limit_hits'] += 1
+        return evaluation_function(game_state, player)
+
+    value = -np.inf
+    for successor in successors:
+        value = max(value, -quiescence(successor, -beta, -alpha, get_next_turn(player), ply + 1))
+        if value >= beta:
+            quiescence_stats['cutoffs'] += 1
+            return value
+        alpha = max(alpha, value)
+    return value
+
+
+# Helper function to evaluate a leaf at the depth limit through the quiescence search
+def quiescence_value(game_state, alpha, beta, player, ply):
+    quiescence_stats['leaves'] += 1
+    quiescence_stats['leaf_start'] = quiescence_stats['nodes']
+    return quiescence(game_state, alpha, beta, player, ply)
+
+
+# Helper function to reset the quiescence counters before a search
+def reset_quiescence_stats():
+    for key in quiescence_stats:
+        quiescence_stats[key] = 0
 
 
 # # Recycled from A1
@@ -600,79 +1316,1034 @@ def evaluation_function(game_state, player):
 #     return result_sequence
 
 
-# This function computes the utilities for the MAX player
-def max_value(game_state, alpha, beta, depth, player):
-    temp_value = utility_function(game_state, get_next_turn(player))
-    if depth == DEPTH_LIMIT:  # We are at the depth limit
-        if temp_value == 0:  # The state is a terminal state
-            flattened_board = list(chain.from_iterable(game_state.board))
-            board_as_string = ' '.join(flattened_board)
-            if board_as_string not in cache.keys():
-                cache[board_as_string] = evaluation_function(game_state, player)
-            return cache[board_as_string]
-        return temp_value
-    elif temp_value != 0:  # We are not at the depth limit, but we are at the terminal state
-        # terminal_state.append(game_state)
-        return temp_value
+# Helper function to turn a board into a string key for the transposition table
+def board_key(board):
+    return ''.join(chain.from_iterable(board))
+
+
+# Helper function to describe the move between two boards as (from square, to square)
+# For a multi-jump only the first and the last square of the jumping piece are kept
+def move_key(board, next_board, player):
+    own_pieces = [player.lower(), player.upper()]
+    from_square = None
+    to_square = None
+    for row in range(len(board)):
+        for column in range(len(board[row])):
+            if board[row][column] in own_pieces and next_board[row][column] == '.':
+                from_square = (row, column)
+            elif board[row][column] == '.' and next_board[row][column] in own_pieces:
+                to_square = (row, column)
+    return from_square, to_square
+
+
+# Helper function to shift win scores between root and node distance before they
+# are stored in (or after they are read from) the transposition table
+def score_to_table(value, ply):
+    if value >= WIN_SCORE - MAX_PLY:
+        return value + ply
+    if value <= -(WIN_SCORE - MAX_PLY):
+        return value - ply
+    return value
+
 
-    value = -np.inf
-    next_actions = generate_successors(game_state, player)
-    for successor in next_actions:
-        successor_flattened_board = list(chain.from_iterable(successor.board))
-        successor_board_as_string = ' '.join(successor_flattened_board)
-        if successor_board_as_string not in cache.keys():
-            value = max(value, min_value(successor, alpha, beta, depth + 1, get_next_turn(player)))
-            cache[successor_board_as_string] = value
-        else:
-            value = cache[successor_board_as_string]
-        if value >= beta:
-            return value
-        alpha = max(alpha, value)
+def score_from_table(value, ply):
+    if value >= WIN_SCORE - MAX_PLY:
+        return value - ply
+    if value <= -(WIN_SCORE - MAX_PLY):
+        return value + ply
     return value
 
 
-# This function computes the utilities for the MIN player
-def min_value(game_state, alpha, beta, depth, player):
-    temp_value = utility_function(game_state, get_next_turn(player))
-    if depth == DEPTH_LIMIT:  # We are at the depth limit
-        if temp_value == 0:  # The state is a terminal state
-            flattened_board = list(chain.from_iterable(game_state.board))
-            board_as_string = ' '.join(flattened_board)
-            if board_as_string not in cache.keys():
-                cache[board_as_string] = evaluation_function(game_state, player)
-            return cache[board_as_string]
-        return temp_value
-    elif temp_value != 0:  # We are not at the depth limit, but have reached a terminal state
-        # terminal_state.append(game_state)
-        return temp_value
-
-    value = np.inf
-    next_actions = generate_successors(game_state, player)
-    for successor in next_actions:
-        successor_flattened_board = list(chain.from_iterable(successor.board))
-        successor_board_as_string = ' '.join(successor_flattened_board)
-        if successor_board_as_string not in cache.keys():
-            value = min(value, max_value(successor, alpha, beta, depth + 1, get_next_turn(player)))
-            cache[successor_board_as_string] = value
+# Helper function to give the key of the men of a board, with the kings left out
+# Men only move forward and captures only remove pieces, so two positions with the
+# same men_key and piece count have no capture or man move between them
+def men_key(board):
+    return board_key(board).translate(KINGS_REMOVED_TABLE) + str(piece_count(board))
+
+
+# Helper function to give the key of a position for the repetition counts
+def position_key(board, player):
+    return oriented_key(board, player) + player
+
+
+# Helper functions to add a position to (and remove it from) the repetition counts
+def enter_position(counts, position):
+    counts[position] = counts.get(position, 0) + 1
+
+
+def leave_position(counts, position):
+    count = counts[position] - 1
+    if count:
+        counts[position] = count
+    else:
+        del counts[position]
+
+
+class SearchCancelled(Exception):
+    # Raised inside a search whose stop event was set. The table entries of the
+    # subtrees finished so far are kept.
+    pass
+
+
+class SearchTables:
+    # This class holds the tables used by the nodes of a search.
+    # transpositions : maps the oriented key of a position (see oriented_key) to
+    #                  (depth, value, bound, oriented key of the best successor)
+    # killers : maps a ply to the (up to two) latest moves that caused a cutoff there
+    # history : maps (player, move) to a score that grows each time the move causes a cutoff
+    # stop : an optional threading.Event; once it is set the search raises SearchCancelled
+    # node_limit : an optional number of nodes after which the search raises SearchCancelled
+    # repetitions : counts the positions (see position_key) of the game since the last
+    #               capture or man move and of the current search path
+    # quiet_plies : the number of plies played without a capture or a man move before the root
+    # root_men : the men_key of the root, set by the search
+    def __init__(self):
+        self.transpositions = {}
+        self.killers = {}
+        self.history = {}
+        self.nodes = 0
+        self.depth = 0
+        self.stop = None
+        self.node_limit = None
+        self.reductions = 0
+        self.re_searches = 0
+        self.futility_prunes = 0
+        self.repetitions = {}
+        self.quiet_plies = 0
+        self.root_men = None
+
+    # Helper function to remember a move that caused a beta cutoff
+    def record_cutoff(self, ply, move, player, depth):
+        killers = self.killers.setdefault(ply, [])
+        if move not in killers:
+            killers.insert(0, move)
+            del killers[2:]
+        self.history[(player, move)] = self.history.get((player, move), 0) + depth * depth
+
+
+# Helper function to order successors: best move from the table first, then killers,
+# then the moves with the highest history score
+def order_successors(game_state, successors, player, ply, best_key, tables):
+    killers = tables.killers.get(ply, [])
+    scored = []
+    for position, successor in enumerate(successors):
+        move = move_key(game_state.board, successor.board, player)
+        if best_key is not None and oriented_key(successor.board, player) == best_key:
+            priority = 3000000
+        elif move in killers:
+            priority = 2000000 - killers.index(move)
         else:
-            value = cache[successor_board_as_string]
-        if value <= alpha:
-            return value
-        beta = min(beta, value)
-    return value
+            priority = tables.history.get((player, move), 0)
+        scored.append((-priority, position, successor, move))
+    scored.sort(key=lambda item: (item[0], item[1]))
+    return [(successor, move) for _, _, successor, move in scored]
+
+
+# This function does a principal variation search (negamax form) of the state
+# The value is given for the player to move
+def negamax(game_state, alpha, beta, depth, ply, player, tables):
+    tables.nodes += 1
+    if tables.stop is not None and tables.stop.is_set():
+        raise SearchCancelled()
+    if tables.node_limit is not None and tables.nodes > tables.node_limit:
+        raise SearchCancelled()
+
+    key = oriented_key(game_state.board, player)
+    if ply > 0:
+        if key + player in tables.repetitions:  # The position repeats, so the game can be drawn
+            return DRAW_SCORE
+        if tables.quiet_plies + ply >= NO_PROGRESS_LIMIT and men_key(game_state.board) == tables.root_men:
+            return DRAW_SCORE  # No capture or man move since the root, the no-progress rule applies
+
+        tablebase_value = probe_tablebase(game_state, player)
+        if tablebase_value is not None:  # The exact result is known, no need to search further
+            return tablebase_value
+    entry = tables.transpositions.get(key)
+    best_key = None
+    if entry is not None:
+        entry_depth, entry_value, entry_bound, best_key = entry
+        entry_value = score_from_table(entry_value, ply)
+        if entry_depth >= depth and ply > 0:
+            if entry_bound == EXACT:
+                return entry_value
+            if entry_bound == LOWER_BOUND and entry_value >= beta:
+                return entry_value
+            if entry_bound == UPPER_BOUND and entry_value <= alpha:
+                return entry_value
+
+    if depth == 0:  # We are at the depth limit
+        return quiescence_value(game_state, alpha, beta, player, ply)
+
+    successors = generate_successors(game_state, player)
+    if not successors:  # No legal moves left for the current player
+        return -(WIN_SCORE - ply)
+
+    original_alpha = alpha
+    best_value = -np.inf
+    best_successor_key = None
+    next_player = get_next_turn(player)
+    ordered = order_successors(game_state, successors, player, ply, best_key, tables)
+    leaf_values = None
+    if depth == 1 and BATCH_EVALUATION:  # All the successors are leaves
+        leaf_values = evaluate_quiet_leaves([successor for successor, _ in ordered], next_player, tables, ply + 1)
+
+    # Captures are forced, so either every successor is a capture or none is
+    quiet = (LATE_MOVE_REDUCTIONS or FUTILITY_PRUNING) and not successors_are_captures(
+        game_state, successors, player)
+    futile = False
+    if FUTILITY_PRUNING and quiet and depth < len(FUTILITY_MARGINS) and abs(alpha) < WIN_SCORE - MAX_PLY:
+        futile = evaluation_function(game_state, player) + FUTILITY_MARGINS[depth] <= alpha
+    killers = tables.killers.get(ply, [])
+
+    enter_position(tables.repetitions, key + player)
+    for position, (successor, move) in enumerate(ordered):
+        if futile and position > 0:  # The first move still gives the node a value
+            tables.futility_prunes += len(ordered) - position
+            break
+        if leaf_values is not None and leaf_values[position] is not None:
+            tables.nodes += 1
+            value = -leaf_values[position]
+        elif position == 0:
+            value = -negamax(successor, -beta, -alpha, depth - 1, ply + 1, next_player, tables)
+        else:
+            reduction = 0
+            if (LATE_MOVE_REDUCTIONS and quiet and depth >= LMR_MIN_DEPTH and position >= LMR_MIN_MOVE
+                    and move not in killers):
+                reduction = 1
+                tables.reductions += 1
+            # Prove that the move is no better than the principal variation with a null window
+            value = -negamax(successor, -alpha - 1, -alpha, depth - 1 - reduction, ply + 1, next_player, tables)
+            if reduction and value > alpha:  # The reduced search failed high, search again at full depth
+                tables.re_searches += 1
+                value = -negamax(successor, -alpha - 1, -alpha, depth - 1, ply + 1, next_player, tables)
+            if alpha < value < beta:
+                value = -negamax(successor, -beta, -value, depth - 1, ply + 1, next_player, tables)
+
+        if value > best_value:
+            best_value = value
+            best_successor_key = oriented_key(successor.board, player)
+        alpha = max(alpha, value)
+        if alpha >= beta:
+            tables.record_cutoff(ply, move, player, depth)
+            break
+    leave_position(tables.repetitions, key + player)
+
+    if best_value <= original_alpha:
+        bound = UPPER_BOUND
+    elif best_value >= beta:
+        bound = LOWER_BOUND
+    else:
+        bound = EXACT
+    tables.transpositions[key] = (depth, score_to_table(best_value, ply), bound, best_successor_key)
+    return best_value
+
+
+# This function searches the root to a fixed depth inside the (alpha, beta) window
+# Returns the value and the best successor, so no second pass over the root is needed
+def search_root(game_state, successors, alpha, beta, depth, player, tables):
+    key = oriented_key(game_state.board, player)
+    entry = tables.transpositions.get(key)
+    best_key = entry[3] if entry is not None else None
+
+    original_alpha = alpha
+    best_value = -np.inf
+    best_successor = None
+    next_player = get_next_turn(player)
+    tables.root_men = men_key(game_state.board)
+    enter_position(tables.repetitions, key + player)
+    for position, (successor, move) in enumerate(
+            order_successors(game_state, successors, player, 0, best_key, tables)):
+        if position == 0:
+            value = -negamax(successor, -beta, -alpha, depth - 1, 1, next_player, tables)
+        else:
+            value = -negamax(successor, -alpha - 1, -alpha, depth - 1, 1, next_player, tables)
+            if alpha < value < beta:
+                value = -negamax(successor, -beta, -value, depth - 1, 1, next_player, tables)
+
+        if value > best_value:
+            best_value = value
+            best_successor = successor
+        alpha = max(alpha, value)
+        if alpha >= beta:
+            break
+    leave_position(tables.repetitions, key + player)
+
+    if best_value <= original_alpha:
+        bound = UPPER_BOUND
+    elif best_value >= beta:
+        bound = LOWER_BOUND
+    else:
+        bound = EXACT
+    tables.transpositions[key] = (depth, best_value, bound, oriented_key(best_successor.board, player))
+    return best_value, best_successor
 
 
 # This function does Alpha-Beta Pruning
-def alpha_beta_search(game_state, player):
-    best_value = max_value(game_state, -np.inf, np.inf, 0, player)
+# Iterative deepening up to DEPTH_LIMIT, each iteration searching an aspiration window
+# around the value of the previous one. Returns the best successor and its value.
+# If the search is cancelled through tables.stop, the result of the last finished
+# iteration is returned (tables.depth tells which).
+def alpha_beta_search(game_state, player, tables=None):
+    if tables is None:
+        tables = SearchTables()
+    reset_quiescence_stats()
+
+    successors = generate_successors(game_state, player)
+    if not successors:
+        return game_state, 999
+
+    best_value = 0
+    best_successor = successors[0]
+    for depth in range(1, DEPTH_LIMIT + 1):
+        if depth == 1:
+            alpha, beta = -np.inf, np.inf
+        else:
+            alpha, beta = best_value - ASPIRATION_WINDOW, best_value + ASPIRATION_WINDOW
+
+        try:
+            while True:
+                value, successor = search_root(game_state, successors, alpha, beta, depth, player, tables)
+                if value <= alpha:  # Failed low, open the window downwards
+                    alpha = -np.inf
+                elif value >= beta:  # Failed high, open the window upwards
+                    beta = np.inf
+                else:
+                    break
+        except SearchCancelled:
+            if depth == 1:  # No iteration finished, there is no result to fall back on
+                raise
+            break
+
+        best_value, best_successor = value, successor
+        tables.depth = depth
+        if abs(best_value) >= WIN_SCORE - MAX_PLY:  # A forced win or loss was found
+            break
+
+    return best_successor, best_value
+
+
+# ---------------------------------------------------------------------------------
+# Position analysis
+# ---------------------------------------------------------------------------------
+# Positions are streamed from a file or a directory of files and searched on a
+# process pool. Each worker keeps one SearchTables for all its positions, so the
+# transposition table warms up over the run. Results are written as JSON lines in
+# the order they complete.
+
+analysis_tables = None  # The SearchTables of an analysis worker process
+ANALYSIS_TABLE_ENTRIES = 2000000  # The transposition table of a worker is cleared beyond this size
+
+
+# Helper function to yield (source, number, board, player) for every position in a
+# file, or in the files of a directory in name order
+def iter_analysis_positions(path):
+    if os.path.isdir(path):
+        sources = [os.path.join(path, name) for name in sorted(os.listdir(path))
+                   if os.path.isfile(os.path.join(path, name))]
+    else:
+        sources = [path]
+    for source in sources:
+        for number, (board, player) in enumerate(read_positions(source)):
+            yield source, number, board, player
+
+
+# Helper function to collect the search settings a worker process needs: the
+# tablebase file, the draw rule and the engine configuration in effect here
+def worker_settings():
+    engine_config = dict(DEFAULT_ENGINE_CONFIG, depth=DEPTH_LIMIT, lmr=LATE_MOVE_REDUCTIONS,
+                         futility=FUTILITY_PRUNING, quiescence_nodes=QUIESCENCE_NODE_LIMIT,
+                         weights=dict(EVAL_WEIGHTS))
+    return {'tablebase': tablebase.filename if tablebase is not None else None,
+            'draw_plies': NO_PROGRESS_LIMIT, 'engine_config': engine_config}
+
+
+# Sets up a worker process with the settings of worker_settings, so the workers
+# search alike whether the pool forks or spawns them
+def init_search_worker(settings):
+    global tablebase, NO_PROGRESS_LIMIT
+    tablebase = Tablebase(settings['tablebase']) if settings['tablebase'] is not None else None
+    NO_PROGRESS_LIMIT = settings['draw_plies']
+    apply_engine_config(settings['engine_config'])
+
+
+# Sets up an analysis worker process
+def init_analysis_worker(depth, settings):
+    global analysis_tables, DEPTH_LIMIT
+    init_search_worker(settings)
+    analysis_tables = SearchTables()
+    DEPTH_LIMIT = depth
+
+
+# Searches one position in an analysis worker and returns its result as a dict
+# The search stops after time_budget seconds, or is cut off after timeout seconds;
+# either way the last finished iteration is reported
+def analyse_position(source, number, board, player, time_budget=None, timeout=None):
+    tables = analysis_tables if analysis_tables is not None else SearchTables()
+    if len(tables.transpositions) > ANALYSIS_TABLE_ENTRIES:
+        tables.transpositions.clear()
+    tables.nodes = 0
+    tables.depth = 0
+    tables.repetitions = {}
+    tables.quiet_plies = 0
+    limits = [limit for limit in (time_budget, timeout) if limit is not None]
+    timer = None
+    if limits:
+        tables.stop = threading.Event()
+        timer = threading.Timer(min(limits), tables.stop.set)
+        timer.start()
+
+    result = {'source': source, 'position': number, 'fen': board_to_fen(board, player)}
+    start = time.perf_counter()
+    try:
+        successor, value = alpha_beta_search(State(board, 0), player, tables)
+    except SearchCancelled:
+        successor, value = None, None
+    finally:
+        if timer is not None:
+            timer.cancel()
+        stopped = tables.stop is not None and tables.stop.is_set()
+        tables.stop = None
+
+    if value == 999:  # No legal move
+        successor = None
+    result['best_move'] = move_text(board, successor.board, player) if successor is not None else None
+    result['score'] = value
+    result['depth'] = tables.depth
+    result['nodes'] = tables.nodes
+    result['seconds'] = round(time.perf_counter() - start, 3)
+    result['timed_out'] = stopped and timeout is not None and (time_budget is None or timeout <= time_budget)
+    return result
 
-    next_action = generate_successors(game_state, player)
-    for move in next_action:
-        next_flattened_board = list(chain.from_iterable(move.board))
-        action_board_as_string = ' '.join(next_flattened_board)
-        if action_board_as_string in cache.keys() and cache[action_board_as_string] == best_value:
-            return move, cache[action_board_as_string]
-    return game_state, 999
+
+# Helper function to unpack the arguments of analyse_position for the pool
+def analyse_job(job):
+    return analyse_position(*job)
+
+
+# Analyses the positions found at path on a process pool and writes one JSON line
+# per position to output_file as soon as its result arrives
+# Returns the number of positions analysed
+def analyse_positions(path, output_file, depth, workers=1, time_budget=None, timeout=None):
+    jobs = ((source, number, board, player, time_budget, timeout)
+            for source, number, board, player in iter_analysis_positions(path))
+    count = 0
+    with multiprocessing.Pool(workers, initializer=init_analysis_worker, initargs=(depth, worker_settings())) as pool:
+        for result in pool.imap_unordered(analyse_job, jobs):
+            output_file.write(json.dumps(result) + "\n")
+            output_file.flush()
+            count += 1
+    return count
+
+
+# ---------------------------------------------------------------------------------
+# Tournament
+# ---------------------------------------------------------------------------------
+# Two engine configurations play each other from a set of opening positions, each
+# opening once with either configuration as red. Games run on a process pool. A
+# configuration is a dict of any of:
+#   depth, lmr, futility, quiescence_nodes, weights (see set_eval_weights),
+#   engine ('alphabeta' or 'mcts'), mcts_playouts, mcts_policy
+# Missing keys take the values of DEFAULT_ENGINE_CONFIG, which the command line
+# options update.
+
+DEFAULT_ENGINE_CONFIG = {'depth': DEPTH_LIMIT, 'lmr': LATE_MOVE_REDUCTIONS, 'futility': FUTILITY_PRUNING,
+                         'quiescence_nodes': QUIESCENCE_NODE_LIMIT, 'weights': dict(EVAL_WEIGHTS),
+                         'engine': 'alphabeta', 'mcts_playouts': None, 'mcts_policy': 'light'}
+TOURNAMENT_MAX_PLIES = 300  # A game still going after this many plies is scored as a draw
+
+
+# Helper function to set the search options of a configuration before its move
+def apply_engine_config(config):
+    global DEPTH_LIMIT, LATE_MOVE_REDUCTIONS, FUTILITY_PRUNING, QUIESCENCE_NODE_LIMIT
+    DEPTH_LIMIT = config['depth']
+    LATE_MOVE_REDUCTIONS = config['lmr']
+    FUTILITY_PRUNING = config['futility']
+    QUIESCENCE_NODE_LIMIT = config['quiescence_nodes']
+    set_eval_weights(dict(DEFAULT_ENGINE_CONFIG['weights'], **config['weights']))
+
+
+# Helper function to search a move for a session within the time or node budget
+# Returns (successor, value, nodes, depth)
+def budgeted_search(session, move_time=None, move_nodes=None):
+    if session.mcts is not None:
+        successor, value = session.search()
+        return successor, value, session.mcts.iterations, 0
+
+    tables = session.tables
+    timer = None
+    if move_time is not None:
+        tables.stop = threading.Event()
+        timer = threading.Timer(move_time, tables.stop.set)
+        timer.start()
+    tables.node_limit = move_nodes
+    try:
+        successor, value = session.search()
+    except SearchCancelled:  # Not even the first iteration finished
+        successor, value = generate_successors(session.state, session.player)[0], 0
+    finally:
+        if timer is not None:
+            timer.cancel()
+        tables.stop = None
+        tables.node_limit = None
+    return successor, value, tables.nodes, tables.depth
+
+
+# Plays one game between two configurations and returns the result for red (1, 0.5
+# or 0), the number of plies and, per color, the nodes, seconds, depth sum and moves
+def play_tournament_game(board, player, configs, move_time=None, move_nodes=None,
+                         max_plies=TOURNAMENT_MAX_PLIES):
+    sessions = {}
+    for color, config in configs.items():
+        mcts = None
+        if config['engine'] == 'mcts':
+            playouts = config['mcts_playouts'] or move_nodes
+            mcts = MCTSEngine(playouts, move_time if playouts is None else None, policy=config['mcts_policy'])
+        sessions[color] = GameSession(State(board, 0), player, mcts=mcts)
+    statistics = {color: {'nodes': 0, 'seconds': 0.0, 'depth': 0, 'moves': 0} for color in configs}
+
+    turn = player
+    result = 0.5
+    plies = 0
+    while plies < max_plies:
+        apply_engine_config(configs[turn])
+        start = time.perf_counter()
+        successor, value, nodes, depth = budgeted_search(sessions[turn], move_time, move_nodes)
+        if value == 999:  # The side to move has no legal move and loses
+            result = 0.0 if turn == 'r' else 1.0
+            break
+        statistics[turn]['seconds'] += time.perf_counter() - start
+        statistics[turn]['nodes'] += nodes
+        statistics[turn]['depth'] += depth
+        statistics[turn]['moves'] += 1
+
+        successor.parent = None
+        for session in sessions.values():
+            session.play(successor)
+        turn = get_next_turn(turn)
+        plies += 1
+        if sessions[turn].draw_reason() is not None:
+            break
+
+    return result, plies, statistics
+
+
+# Plays one tournament game in a worker process
+# Returns (opening number, whether A was red, score of A, plies, statistics of A and of B)
+def tournament_job(job):
+    number, a_is_red, board, player, config_a, config_b, move_time, move_nodes, max_plies = job
+    configs = {'r': config_a, 'b': config_b} if a_is_red else {'r': config_b, 'b': config_a}
+    red_result, plies, statistics = play_tournament_game(board, player, configs, move_time, move_nodes, max_plies)
+    a_color, b_color = ('r', 'b') if a_is_red else ('b', 'r')
+    score = red_result if a_is_red else 1.0 - red_result
+    return number, a_is_red, score, plies, statistics[a_color], statistics[b_color]
+
+
+# Helper function to give the mean score and its 95% confidence half width
+def score_interval(scores):
+    if not scores:
+        return 0.0, 0.0
+    mean = sum(scores) / len(scores)
+    if len(scores) < 2:
+        return mean, 0.0
+    variance = sum((score - mean) ** 2 for score in scores) / (len(scores) - 1)
+    return mean, 1.96 * math.sqrt(variance / len(scores))
+
+
+# Plays every opening twice (colors swapped) between configuration A and B on a
+# process pool, prints each game as it ends and then the summary
+# Returns (wins, draws, losses) of A
+def run_tournament(openings, config_a, config_b, workers=1, move_time=None, move_nodes=None,
+                   max_plies=TOURNAMENT_MAX_PLIES, output=sys.stdout):
+    config_a = dict(DEFAULT_ENGINE_CONFIG, **config_a)
+    config_b = dict(DEFAULT_ENGINE_CONFIG, **config_b)
+    jobs = [(number, a_is_red, board, player, config_a, config_b, move_time, move_nodes, max_plies)
+            for number, (board, player) in enumerate(openings) for a_is_red in (True, False)]
+    scores = []
+    totals = {'A': {'nodes': 0, 'seconds': 0.0, 'depth': 0, 'moves': 0},
+              'B': {'nodes': 0, 'seconds': 0.0, 'depth': 0, 'moves': 0}}
+    with multiprocessing.Pool(workers, initializer=init_search_worker, initargs=(worker_settings(),)) as pool:
+        for number, a_is_red, score, plies, statistics_a, statistics_b in pool.imap_unordered(tournament_job, jobs):
+            scores.append(score)
+            for name, statistics in [('A', statistics_a), ('B', statistics_b)]:
+                for key in statistics:
+                    totals[name][key] += statistics[key]
+            print("opening {} A as {}: {} in {} plies".format(
+                number, 'red' if a_is_red else 'black', {1.0: 'A wins', 0.5: 'draw', 0.0: 'B wins'}[score], plies),
+                file=output)
+
+    wins, draws, losses = scores.count(1.0), scores.count(0.5), scores.count(0.0)
+    mean, half_width = score_interval(scores)
+    print("A vs B: +{} ={} -{}, score {:.3f} +- {:.3f} (95%)".format(wins, draws, losses, mean, half_width),
+          file=output)
+    for name in ['A', 'B']:
+        total = totals[name]
+        print("{}: {:.0f} nodes/s, mean depth {:.2f}, {} moves".format(
+            name, total['nodes'] / total['seconds'] if total['seconds'] else 0.0,
+            total['depth'] / total['moves'] if total['moves'] else 0.0, total['moves']), file=output)
+    return wins, draws, losses
+
+
+# Searches every (board, player) position with each combination of the selective
+# search options and prints nodes, time and depth per option set. Strength is shown
+# as how often the best move matches the full-width search and how far the value is
+# from it on average. The options are restored afterwards.
+def benchmark_selective_search(positions, output=sys.stdout):
+    global LATE_MOVE_REDUCTIONS, FUTILITY_PRUNING
+    saved = LATE_MOVE_REDUCTIONS, FUTILITY_PRUNING
+    positions = list(positions)
+    baseline = None
+    try:
+        for reductions, futility in [(False, False), (True, False), (False, True), (True, True)]:
+            LATE_MOVE_REDUCTIONS, FUTILITY_PRUNING = reductions, futility
+            results = []
+            nodes = reduced = re_searched = pruned = 0
+            start = time.perf_counter()
+            for board, player in positions:
+                tables = SearchTables()
+                successor, value = alpha_beta_search(State(board, 0), player, tables)
+                results.append((board_key(successor.board), value))
+                nodes += tables.nodes
+                reduced += tables.reductions
+                re_searched += tables.re_searches
+                pruned += tables.futility_prunes
+            seconds = time.perf_counter() - start
+            if baseline is None:
+                baseline = results
+            same_moves = sum(result[0] == base[0] for result, base in zip(results, baseline))
+            value_error = sum(abs(result[1] - base[1]) for result, base in zip(results, baseline))
+            print("lmr={:d} futility={:d}: {} nodes in {:.2f} s ({:.0f} nodes/s) depth {}, reduced {} "
+                  "re-searched {} pruned {}, same move {}/{}, mean value error {:.2f}".format(
+                      reductions, futility, nodes, seconds, nodes / seconds if seconds else 0.0, DEPTH_LIMIT,
+                      reduced, re_searched, pruned, same_moves, len(positions),
+                      value_error / len(positions) if positions else 0.0), file=output)
+    finally:
+        LATE_MOVE_REDUCTIONS, FUTILITY_PRUNING = saved
+
+
+# Helper function to follow the best successors stored in the transposition table
+# Returns the principal variation from the state as a list of board keys
+def principal_variation(game_state, player, tables, limit=MAX_PLY):
+    variation = []
+    seen = set()
+    while len(variation) < limit:
+        entry = tables.transpositions.get(oriented_key(game_state.board, player))
+        if entry is None or entry[3] is None:
+            break
+        next_state = None
+        for successor in generate_successors(game_state, player):
+            if oriented_key(successor.board, player) == entry[3]:
+                next_state = successor
+                break
+        if next_state is None or board_key(next_state.board) in seen:
+            break
+        variation.append(board_key(next_state.board))
+        seen.add(variation[-1])
+        game_state = next_state
+        player = get_next_turn(player)
+    return variation
+
+
+# Helper function to count the pieces on a board
+def piece_count(board):
+    return sum(char != '.' for row in board for char in row)
+
+
+# Runs the search of a ponder thread until it finishes or is cancelled
+def ponder(game_state, player, tables):
+    try:
+        alpha_beta_search(game_state, player, tables)
+    except SearchCancelled:
+        pass
+
+
+# Helper function to write a move as the numbers of its first and last dark squares
+# (1-32, as in board_to_fen), joined by 'x' for a capture and '-' otherwise
+def move_text(board, next_board, player):
+    from_square, to_square = move_key(board, next_board, player)
+    separator = 'x' if piece_count(next_board) < piece_count(board) else '-'
+    return '{}{}{}'.format(DARK_SQUARES.index(from_square) + 1, separator, DARK_SQUARES.index(to_square) + 1)
+
+
+# Asks the solver daemon (solver_daemon.py) on the Unix socket at path for the best move
+# Returns the successor and its value, or None if no daemon answers with a move
+def daemon_search(path, game_state, player):
+    import solver_daemon
+    response = solver_daemon.send_request({'type': 'checkers', 'position': board_to_fen(game_state.board, player),
+                                           'depth': DEPTH_LIMIT, 'time': None, 'timeout': None}, path)
+    if response is None or not response.get('ok') or response.get('best_move') is None:
+        return None
+    for successor in generate_successors(game_state, player):
+        if move_text(game_state.board, successor.board, player) == response['best_move']:
+            return successor, response['score']
+    return None
+
+
+# Helper function to ask for a move on stdin until a legal one is given
+# Returns the successor that was chosen, or None at the end of the input
+def read_human_move(game_state, player, successors):
+    moves = {}
+    for successor in successors:
+        moves.setdefault(move_text(game_state.board, successor.board, player).replace('x', '-'), successor)
+    while True:
+        print("{} to move, one of: {}".format(player, ' '.join(sorted(moves))))
+        line = sys.stdin.readline()
+        if not line:
+            return None
+        successor = moves.get(line.strip().replace('x', '-'))
+        if successor is not None:
+            return successor
+        print("Illegal move: {}".format(line.strip()))
+
+
+class GameSession:
+    # This class keeps the search tables of a game from one move to the next.
+    # The transposition table is keyed by position, so the entries below the move
+    # actually played stay valid and seed the next search: its best move comes first
+    # and the shallow iterations of the iterative deepening are answered by the table.
+    # tables : the SearchTables shared by the searches of the game
+    # pv : the principal variation of the last search, as board keys
+    # reuse : when False, every search starts from empty tables
+    # positions : counts the positions of the game since the last capture or man move
+    # quiet_plies : the number of plies since the last capture or man move
+    # mcts : an MCTSEngine that chooses the moves instead of alpha_beta_search, or None
+    # daemon : the socket of a solver daemon to ask first, or None
+    def __init__(self, game_state, player, reuse=True, mcts=None, daemon=None):
+        self.state = game_state
+        self.player = player
+        self.reuse = reuse
+        self.mcts = mcts
+        self.daemon = daemon
+        self.tables = SearchTables()
+        self.pv = []
+        self.positions = {position_key(game_state.board, player): 1}
+        self.quiet_plies = 0
+        self.ponder_thread = None
+        self.ponder_tables = None
+        self.ponder_key = None
+        self.ponder_stats = {'searches': 0, 'hits': 0, 'nodes': 0, 'depth': 0}
+
+    # Searches the current position and returns the best successor and its value
+    def search(self):
+        self.stop_pondering()
+        if self.mcts is not None:
+            return self.mcts.search(self.state, self.player)
+        if self.daemon is not None and self.quiet_plies == 0:
+            # The daemon knows nothing of the game, so it is only asked right after a
+            # capture or a man move, where no earlier position can come back
+            answer = daemon_search(self.daemon, self.state, self.player)
+            if answer is not None:
+                self.pv = []
+                return answer
+        if not self.reuse:
+            self.tables = SearchTables()
+        self.tables.nodes = 0
+        self.seed_draw_rules(self.tables)
+        # search_root counts the root itself
+        leave_position(self.tables.repetitions, position_key(self.state.board, self.player))
+        best_successor, value = alpha_beta_search(self.state, self.player, self.tables)
+        if value != 999:
+            self.pv = principal_variation(self.state, self.player, self.tables)
+        else:
+            self.pv = []
+        return best_successor, value
+
+    # The successor the principal variation expects from the current position, or None
+    def predicted_reply(self):
+        if not self.pv:
+            return None
+        for successor in generate_successors(self.state, self.player):
+            if board_key(successor.board) == self.pv[0]:
+                return successor
+        return None
+
+    # Moves the session to the successor that was played
+    def play(self, next_state):
+        played_key = board_key(next_state.board)
+        ponder_tables = self.stop_pondering()
+        if self.mcts is not None:
+            self.mcts.play(next_state)
+        self.pv = self.pv[1:] if self.pv and self.pv[0] == played_key else []
+        if men_key(next_state.board) != men_key(self.state.board):  # A capture or a man move
+            self.positions = {}
+            self.quiet_plies = 0
+        else:
+            self.quiet_plies += 1
+        self.state = next_state
+        self.player = get_next_turn(self.player)
+        enter_position(self.positions, position_key(next_state.board, self.player))
+        if self.reuse:
+            if ponder_tables is not None and played_key == self.ponder_key:
+                # The ponder search ran from this very position, so its killers
+                # and history already fit the next search
+                self.ponder_stats['hits'] += 1
+                self.tables.killers = ponder_tables.killers
+                self.tables.history = ponder_tables.history
+            self.age_tables(1)
+        self.ponder_key = None
+
+    # Starts searching, in a background thread, the position after the reply the
+    # principal variation expects. Called once our move is played and the opponent
+    # is to move. The thread writes into the shared transposition table.
+    def start_pondering(self):
+        self.stop_pondering()
+        if not self.reuse:
+            return False
+        reply = self.predicted_reply()
+        if reply is None:
+            return False
+
+        tables = SearchTables()
+        tables.transpositions = self.tables.transpositions
+        tables.killers = {ply - 1: list(moves) for ply, moves in self.tables.killers.items() if ply >= 1}
+        tables.history = dict(self.tables.history)
+        tables.stop = threading.Event()
+        self.seed_draw_rules(tables)
+        if men_key(reply.board) != men_key(self.state.board):  # A capture or a man move, as in play
+            tables.repetitions = {}
+            tables.quiet_plies = 0
+        else:
+            tables.quiet_plies += 1
+        self.ponder_tables = tables
+        self.ponder_key = self.pv[0]
+        self.ponder_thread = threading.Thread(target=ponder, args=(reply, get_next_turn(self.player), tables),
+                                              daemon=True)
+        self.ponder_stats['searches'] += 1
+        self.ponder_thread.start()
+        return True
+
+    # Helper function to give a search the positions and the quiet plies of the game
+    def seed_draw_rules(self, tables):
+        tables.repetitions = dict(self.positions)
+        tables.quiet_plies = self.quiet_plies
+
+    # Returns why the game is drawn at the current position, or None
+    def draw_reason(self):
+        if self.positions.get(position_key(self.state.board, self.player), 0) >= REPETITION_LIMIT:
+            return "the position occurred {} times".format(REPETITION_LIMIT)
+        if self.quiet_plies >= NO_PROGRESS_LIMIT:
+            return "no capture or man move in {} plies".format(NO_PROGRESS_LIMIT)
+        return None
+
+    # Cancels the ponder search, if any, and waits for it to finish
+    # Returns the tables of the ponder search, or None
+    def stop_pondering(self):
+        if self.ponder_thread is None:
+            return None
+        self.ponder_tables.stop.set()
+        self.ponder_thread.join()
+        tables = self.ponder_tables
+        tables.stop = None
+        self.ponder_stats['nodes'] += tables.nodes
+        self.ponder_stats['depth'] = tables.depth
+        self.ponder_thread = None
+        self.ponder_tables = None
+        return tables
+
+    # Helper function to shift the tables by the plies played
+    # Killers are stored per ply from the root, so they move up with the root. History
+    # scores are halved so recent cutoffs count more. Entries for positions with more
+    # pieces than the current one can not occur again (captures are irreversible).
+    def age_tables(self, plies):
+        tables = self.tables
+        tables.killers = {ply - plies: moves for ply, moves in tables.killers.items() if ply >= plies}
+        tables.history = {move: score // 2 for move, score in tables.history.items() if score > 1}
+        pieces = piece_count(self.state.board)
+        tables.transpositions = {key: entry for key, entry in tables.transpositions.items()
+                                 if key.count('.') >= 64 - pieces}
+
+
+# ---------------------------------------------------------------------------------
+# Monte Carlo tree search
+# ---------------------------------------------------------------------------------
+# An alternative to alpha_beta_search. Each iteration walks down the tree by UCT,
+# adds one child, plays the game out with cheap moves on compact boards for at most
+# MCTS_PLAYOUT_PLIES plies, and backs the result up. A playout that is cut off is
+# scored by the sign of the evaluation. The move played is the most visited child of
+# the root.
+
+MCTS_EXPLORATION = 1.4  # Weight of the exploration term of UCT
+MCTS_PLAYOUT_PLIES = 20  # Longest playout before the position is scored by the evaluation
+
+
+class MCTSNode:
+    # This class represents a node of the Monte Carlo tree.
+    # state : the position, with player to move
+    # untried : the successors that have no node yet (None until the node is first expanded)
+    # visits, wins : the playouts through the node, and their score for the player who
+    #                moved into it (1 for a win, 0.5 for a draw)
+    def __init__(self, state, player, parent=None):
+        self.state = state
+        self.player = player
+        self.parent = parent
+        self.children = []
+        self.untried = None
+        self.visits = 0
+        self.wins = 0.0
+
+    # Helper function to pick the child with the highest UCT value
+    def select_child(self):
+        log_visits = math.log(self.visits)
+        return max(self.children, key=lambda child: child.wins / child.visits
+                   + MCTS_EXPLORATION * math.sqrt(log_visits / child.visits))
+
+
+# Helper function to pick a playout move among compact successors
+# The light policy takes the move that leaves the best material balance, with some
+# randomness; the random policy any legal move
+def playout_move(successors, player, policy, rng):
+    if policy == 'light' and rng.random() < 0.75:
+        return max(successors, key=lambda successor: (compact_evaluation(successor, player), rng.random()))
+    return rng.choice(successors)
+
+
+# Plays the game out from the state and returns its score for the player to move there
+# The playout runs on compact boards
+def playout(game_state, player, policy, rng):
+    cells = board_to_compact(game_state.board)
+    mover = player
+    for _ in range(MCTS_PLAYOUT_PLIES):
+        successors = compact_successors(cells, mover)
+        if not successors:  # The side to move has lost
+            return 0.0 if mover == player else 1.0
+        cells = playout_move(successors, mover, policy, rng)
+        mover = get_next_turn(mover)
+
+    value = compact_evaluation(cells, player)
+    return 1.0 if value > 0 else 0.0 if value < 0 else 0.5
+
+
+# Runs MCTS iterations below the root until the node or the time budget is used up
+# Returns the number of iterations done
+def mcts_iterate(root, node_budget=None, time_budget=None, policy='light', rng=random):
+    deadline = time.perf_counter() + time_budget if time_budget is not None else None
+    iterations = 0
+    while (node_budget is None or iterations < node_budget) and \
+            (deadline is None or time.perf_counter() < deadline):
+        node = root
+        # Selection
+        while node.untried is not None and not node.untried and node.children:
+            node = node.select_child()
+        # Expansion
+        if node.untried is None:
+            node.untried = generate_successors_compact(node.state, node.player)
+            rng.shuffle(node.untried)
+        if node.untried:
+            child = MCTSNode(node.untried.pop(), get_next_turn(node.player), node)
+            node.children.append(child)
+            node = child
+            score = playout(node.state, node.player, policy, rng)
+        else:  # No legal move, the side to move has lost
+            score = 0.0
+        # Backpropagation: score is for the player to move at node
+        while node is not None:
+            node.visits += 1
+            node.wins += 1.0 - score
+            score = 1.0 - score
+            node = node.parent
+        iterations += 1
+    return iterations
+
+
+# Helper function to sum the visits and wins of the children of the root by board key
+def root_statistics(root):
+    return {board_key(child.state.board): (child.visits, child.wins) for child in root.children}
+
+
+# Runs one root-parallel MCTS in a worker process
+def mcts_worker(board, player, node_budget, time_budget, policy, seed):
+    root = MCTSNode(State(board, 0), player)
+    iterations = mcts_iterate(root, node_budget, time_budget, policy, random.Random(seed))
+    return root_statistics(root), iterations
+
+
+class MCTSEngine:
+    # This class plays moves by Monte Carlo tree search.
+    # The tree below the moves actually played is kept for the next search.
+    # With workers > 1, independent trees are grown in a process pool from the same
+    # root and their root statistics summed (root parallelization); no tree is kept then.
+    def __init__(self, node_budget=None, time_budget=None, workers=1, policy='light', seed=None):
+        if node_budget is None and time_budget is None:
+            node_budget = 10000
+        self.node_budget = node_budget
+        self.time_budget = time_budget
+        self.workers = workers
+        self.policy = policy
+        self.rng = random.Random(seed)
+        self.root = None
+        self.iterations = 0
+
+    # Searches the state and returns the chosen successor and its expected score
+    # (0 to 1 for the player), or (game_state, 999) when there is no legal move
+    def search(self, game_state, player):
+        successors = generate_successors(game_state, player)
+        if not successors:
+            return game_state, 999
+        if self.root is None or self.root.player != player or \
+                board_key(self.root.state.board) != board_key(game_state.board):
+            self.root = MCTSNode(game_state, player)
+
+        if self.workers > 1:
+            statistics = self.search_parallel(game_state, player)
+        else:
+            self.iterations = mcts_iterate(self.root, self.node_budget, self.time_budget, self.policy, self.rng)
+            statistics = root_statistics(self.root)
+
+        by_key = {board_key(successor.board): successor for successor in successors}
+        best_key = max(statistics, key=lambda key: statistics[key][0])
+        visits, wins = statistics[best_key]
+        return by_key[best_key], wins / visits
+
+    # Helper function to grow a tree per worker and sum their root statistics
+    def search_parallel(self, game_state, player):
+        node_budget = None if self.node_budget is None else -(-self.node_budget // self.workers)
+        jobs = [(game_state.board, player, node_budget, self.time_budget, self.policy, self.rng.randrange(2 ** 32))
+                for _ in range(self.workers)]
+        with multiprocessing.Pool(self.workers) as pool:
+            results = pool.starmap(mcts_worker, jobs)
+        statistics = {}
+        self.iterations = 0
+        for worker_statistics, iterations in results:
+            self.iterations += iterations
+            for key, (visits, wins) in worker_statistics.items():
+                total_visits, total_wins = statistics.get(key, (0, 0.0))
+                statistics[key] = (total_visits + visits, total_wins + wins)
+        self.root = None
+        return statistics
+
+    # Moves the root to the child that was played, keeping its subtree
+    def play(self, next_state):
+        played_key = board_key(next_state.board)
+        child = None
+        if self.root is not None:
+            for node in self.root.children:
+                if board_key(node.state.board) == played_key:
+                    child = node
+                    break
+        if child is not None:
+            child.parent = None
+            child.state = next_state
+        self.root = child
+
+
+# Searches every (board, player) position with alpha_beta_search and then with MCTS
+# given the same time, and prints the time, nodes or playouts and the moves chosen
+def benchmark_mcts(positions, workers=1, policy='light', output=sys.stdout):
+    same_moves = 0
+    count = 0
+    for number, (board, player) in enumerate(positions):
+        tables = SearchTables()
+        start = time.perf_counter()
+        successor, value = alpha_beta_search(State(board, 0), player, tables)
+        seconds = time.perf_counter() - start
+        engine = MCTSEngine(time_budget=seconds, workers=workers, policy=policy, seed=number)
+        mcts_successor, score = engine.search(State(board, 0), player)
+        same = board_key(successor.board) == board_key(mcts_successor.board)
+        same_moves += same
+        count += 1
+        print("position {}: alpha-beta {} nodes depth {} value {} in {:.2f} s, mcts {} playouts score {:.2f}, "
+              "{}".format(number, tables.nodes, tables.depth, value, seconds, engine.iterations, score,
+                          "same move" if same else "different move"), file=output)
+    print("same move {}/{}".format(same_moves, count), file=output)
 
 
 if __name__ == '__main__':
@@ -681,16 +2352,264 @@ if __name__ == '__main__':
     parser.add_argument(
         "--inputfile",
         type=str,
-        required=True,
         help="The input file that contains the puzzles."
     )
     parser.add_argument(
         "--outputfile",
         type=str,
-        required=True,
         help="The output file that contains the solution."
     )
+    parser.add_argument(
+        "--outputformat",
+        type=str,
+        default="grid",
+        choices=['grid', 'fen'],
+        help="Write the game as 8-line boards or as one FEN style line per position."
+    )
+    parser.add_argument(
+        "--display",
+        action="store_true",
+        help="Also print every position of the game to stdout."
+    )
+    parser.add_argument(
+        "--tablebase",
+        type=str,
+        help="An endgame tablebase file to probe during the search."
+    )
+    parser.add_argument(
+        "--build-tablebase",
+        type=str,
+        help="Generate an endgame tablebase into this file and exit."
+    )
+    parser.add_argument(
+        "--tablebase-pieces",
+        type=int,
+        default=3,
+        help="The maximum number of pieces covered by a generated tablebase (4 takes about a quarter "
+             "of an hour, 5 is not feasible)."
+    )
+    parser.add_argument(
+        "--depth",
+        type=int,
+        default=DEPTH_LIMIT,
+        help="The depth limit of the main search."
+    )
+    parser.add_argument(
+        "--quiescence-nodes",
+        type=int,
+        default=QUIESCENCE_NODE_LIMIT,
+        help="The maximum number of capture-search nodes below one leaf."
+    )
+    parser.add_argument(
+        "--benchmark-eval",
+        action="store_true",
+        help="Compare the scalar and the batched evaluation on the input position and exit."
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="Print search statistics to stderr after every move."
+    )
+    parser.add_argument(
+        "--perft",
+        type=int,
+        help="Count the leaves of the move tree to this depth for every position of the input file and exit."
+    )
+    parser.add_argument(
+        "--perft-backend",
+        type=str,
+        default="default",
+        help="The move generator perft uses, by name or as module:function."
+    )
+    parser.add_argument(
+        "--perft-compare",
+        type=str,
+        help="Compare the successors of --perft-backend with this move generator at every node and exit."
+    )
+    parser.add_argument(
+        "--no-reuse",
+        action="store_true",
+        help="Start every move's search from empty tables instead of keeping them between moves."
+    )
+    parser.add_argument(
+        "--lmr",
+        action="store_true",
+        help="Search late quiet moves one ply shallower, re-searching them at full depth on a fail high."
+    )
+    parser.add_argument(
+        "--futility",
+        action="store_true",
+        help="Skip the quiet moves of nodes near the horizon whose material margin can not reach alpha."
+    )
+    parser.add_argument(
+        "--benchmark-search",
+        action="store_true",
+        help="Search every position of the input file with each --lmr/--futility combination and exit."
+    )
+    parser.add_argument(
+        "--draw-plies",
+        type=int,
+        default=NO_PROGRESS_LIMIT,
+        help="The number of plies without a capture or a man move that draws the game."
+    )
+    parser.add_argument(
+        "--engine",
+        type=str,
+        default="alphabeta",
+        choices=['alphabeta', 'mcts'],
+        help="Choose moves by alpha-beta search or by Monte Carlo tree search."
+    )
+    parser.add_argument(
+        "--mcts-playouts",
+        type=int,
+        help="The number of playouts of an MCTS move (10000 if no time is given either)."
+    )
+    parser.add_argument(
+        "--mcts-time",
+        type=float,
+        help="The number of seconds of an MCTS move."
+    )
+    parser.add_argument(
+        "--mcts-workers",
+        type=int,
+        default=1,
+        help="The number of processes that grow MCTS trees from the root in parallel."
+    )
+    parser.add_argument(
+        "--mcts-policy",
+        type=str,
+        default="light",
+        choices=['random', 'light'],
+        help="Play out with random moves, or mostly with the move that keeps the best material."
+    )
+    parser.add_argument(
+        "--benchmark-mcts",
+        action="store_true",
+        help="Give MCTS the time alpha-beta takes on every position of the input file, compare, and exit."
+    )
+    parser.add_argument(
+        "--analyse",
+        type=str,
+        help="Search every position of this file or directory and write JSON lines to --outputfile, then exit."
+    )
+    parser.add_argument(
+        "--analysis-workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="The number of processes of --analyse."
+    )
+    parser.add_argument(
+        "--analysis-time",
+        type=float,
+        help="Search each position of --analyse for this many seconds instead of to --depth."
+    )
+    parser.add_argument(
+        "--analysis-timeout",
+        type=float,
+        help="Cut the search of a position of --analyse off after this many seconds."
+    )
+    parser.add_argument(
+        "--tournament",
+        type=str,
+        help="Play --config-a against --config-b from every opening in this file and exit."
+    )
+    parser.add_argument(
+        "--config-a",
+        type=str,
+        default="{}",
+        help='The first engine configuration as JSON, e.g. \'{"depth": 8, "lmr": true}\'.'
+    )
+    parser.add_argument(
+        "--config-b",
+        type=str,
+        default="{}",
+        help="The second engine configuration as JSON."
+    )
+    parser.add_argument(
+        "--tournament-workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="The number of games played at once."
+    )
+    parser.add_argument(
+        "--move-time",
+        type=float,
+        help="The number of seconds each tournament move may take."
+    )
+    parser.add_argument(
+        "--move-nodes",
+        type=int,
+        help="The number of nodes (or MCTS playouts) each tournament move may take."
+    )
+    parser.add_argument(
+        "--human",
+        type=str,
+        choices=['r', 'b'],
+        help="Play this side from stdin (moves as dark square numbers, e.g. 22-18) against the engine."
+    )
+    parser.add_argument(
+        "--ponder",
+        action="store_true",
+        help="With --human, search the expected reply in the background while the human thinks."
+    )
+    parser.add_argument(
+        "--daemon",
+        type=str,
+        metavar="SOCKET",
+        help="Ask the solver daemon on this Unix socket for the alpha-beta moves after captures and man moves; "
+             "the moves are searched here if no daemon answers."
+    )
     args = parser.parse_args()
+    DEPTH_LIMIT = args.depth
+    QUIESCENCE_NODE_LIMIT = args.quiescence_nodes
+    LATE_MOVE_REDUCTIONS = args.lmr
+    FUTILITY_PRUNING = args.futility
+    NO_PROGRESS_LIMIT = args.draw_plies
+
+    if args.build_tablebase:
+        build_tablebase(args.build_tablebase, args.tablebase_pieces, verbose=True)
+        sys.exit(0)
+    if args.tablebase:  # Loaded before any mode runs, so every search probes it
+        tablebase = Tablebase(args.tablebase)
+    if args.perft is not None:
+        if args.inputfile is None:
+            parser.error("--perft needs --inputfile")
+        if args.perft_compare:
+            agree = perft_compare(read_positions(args.inputfile), args.perft, args.perft_backend, args.perft_compare)
+            sys.exit(0 if agree else 1)
+        perft_report(read_positions(args.inputfile), args.perft, args.perft_backend)
+        sys.exit(0)
+    if args.benchmark_search:
+        if args.inputfile is None:
+            parser.error("--benchmark-search needs --inputfile")
+        benchmark_selective_search(read_positions(args.inputfile))
+        sys.exit(0)
+    if args.tournament:
+        DEFAULT_ENGINE_CONFIG.update(depth=DEPTH_LIMIT, lmr=LATE_MOVE_REDUCTIONS, futility=FUTILITY_PRUNING,
+                                     quiescence_nodes=QUIESCENCE_NODE_LIMIT)
+        run_tournament(read_positions(args.tournament), json.loads(args.config_a), json.loads(args.config_b),
+                       args.tournament_workers, args.move_time, args.move_nodes)
+        sys.exit(0)
+    if args.analyse:
+        if args.outputfile is None:
+            parser.error("--analyse needs --outputfile")
+        with open(args.outputfile, "w") as analysis_file:
+            analyse_positions(args.analyse, analysis_file, MAX_PLY // 2 if args.analysis_time else DEPTH_LIMIT,
+                              args.analysis_workers, args.analysis_time, args.analysis_timeout)
+        sys.exit(0)
+    if args.benchmark_mcts:
+        if args.inputfile is None:
+            parser.error("--benchmark-mcts needs --inputfile")
+        benchmark_mcts(read_positions(args.inputfile), args.mcts_workers, args.mcts_policy)
+        sys.exit(0)
+    if args.inputfile is None or args.outputfile is None:
+        parser.error("--inputfile and --outputfile are required")
+    if args.benchmark_eval:
+        # Leaves two plies below the input position, as seen by the last ply of a search
+        benchmark_states = generate_successors(State(read_from_file(args.inputfile), 0), 'r')
+        scalar_time, batch_time = benchmark_evaluation(benchmark_states, 'b')
+        print("scalar: {:.2f} us/leaf, batch: {:.2f} us/leaf".format(scalar_time * 1e6, batch_time * 1e6))
+        sys.exit(0)
 
     # initial_board = read_from_file("checkers2.txt")
     initial_board = read_from_file(args.inputfile)
@@ -699,35 +2618,65 @@ if __name__ == '__main__':
     ctr = 0
 
     # Attempting to simulate a checker games
-    move_list = [initial_state]
-
-    next_state, state_value = alpha_beta_search(initial_state, turn)
+    # Every position is written out as soon as it is decided, so the game is never held in memory
+    output_file = open(args.outputfile, "w")
+    write_position(output_file, initial_state.board, turn, args.outputformat)
+    if args.display:
+        initial_state.display()
+
+    mcts = None
+    if args.engine == 'mcts':
+        mcts = MCTSEngine(args.mcts_playouts, args.mcts_time, args.mcts_workers, args.mcts_policy)
+    session = GameSession(initial_state, turn, reuse=not args.no_reuse, mcts=mcts, daemon=args.daemon)
+    if args.human:
+        # The engine plays the other side; with --ponder it searches the expected
+        # reply while waiting for the human's move
+        while True:
+            if turn == args.human:
+                successors = generate_successors(session.state, turn)
+                new_state = read_human_move(session.state, turn, successors) if successors else None
+                if new_state is None:
+                    break
+            else:
+                new_state, state_value = session.search()
+                if state_value == 999:
+                    break
+                print("engine plays {} (value {})".format(
+                    move_text(session.state.board, new_state.board, turn), state_value))
+            new_state.parent = None
+            session.play(new_state)
+            turn = session.player
+            write_position(output_file, new_state.board, turn, args.outputformat)
+            new_state.display()
+            if session.draw_reason() is not None:
+                print("draw: {}".format(session.draw_reason()))
+                break
+            if turn == args.human and args.ponder:
+                session.start_pondering()
+        session.stop_pondering()
+        if args.stats:
+            print("ponder: {}".format(session.ponder_stats), file=sys.stderr)
+        output_file.close()
+        sys.exit(0)
+
+    next_state, state_value = session.search()
     while state_value != 999:
-        move_list.append(next_state)
+        if args.stats:
+            print("move {}: value {} depth {} nodes {} quiescence {}".format(
+                ctr, state_value, session.tables.depth, session.tables.nodes, quiescence_stats), file=sys.stderr)
         # if ctr == DEPTH_LIMIT - 1:
         #     break
         new_state = next_state
-        turn = get_next_turn(turn)
-        next_state, state_value = alpha_beta_search(new_state, turn)
+        new_state.parent = None  # Let the finished part of the game be freed
+        session.play(new_state)
+        turn = session.player
+        write_position(output_file, new_state.board, turn, args.outputformat)
+        if args.display:
+            new_state.display()
+        if session.draw_reason() is not None:
+            print("draw: {}".format(session.draw_reason()), file=sys.stderr)
+            break
+        next_state, state_value = session.search()
         ctr += 1
 
-    for state_action in move_list:
-        state_action.display()
-
-    output_file = open(args.outputfile, "w")
-    if move_list:
-        for action in move_list:
-            for line in action.board:
-                for char in line:
-                    output_file.write(char)
-                output_file.write("\n")
-            output_file.write("\n")
-
     output_file.close()
-
-    # sys.stdout = open(args.outputfile, 'w')
-    #
-    # sys.stdout = sys.__stdout__
-
-    # something = 1  # Used for debugging
-
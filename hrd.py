@@ -1,10 +1,27 @@
 import heapq
-from copy import deepcopy
 from heapq import heappush, heappop
+from collections import OrderedDict
 from itertools import chain
 import time
 import argparse
+import hashlib
+import math
+import mmap
+import multiprocessing
+import os
+import struct
 import sys
+import tempfile
+import tracemalloc
+
+try:
+    import numpy as np
+except ImportError:  # Only the vectorized BFS needs NumPy
+    np = None
+try:
+    import fcntl
+except ImportError:  # Not on Windows, where the on-disk cache is not locked
+    fcntl = None
 
 #====================================================================================
 
@@ -16,7 +33,7 @@ class Piece:
     This represents a piece on the Hua Rong Dao puzzle.
     """
 
-    def __init__(self, is_goal, is_single, coord_x, coord_y, orientation):
+    def __init__(self, is_goal, is_single, coord_x, coord_y, orientation, kind=None):
         """
         :param is_goal: True if the piece is the goal piece and False otherwise.
         :type is_goal: bool
@@ -29,6 +46,9 @@ class Piece:
         :param orientation: The orientation of the piece (one of 'h' or 'v') 
             if the piece is a 1x2 piece. Otherwise, this is None
         :type orientation: str
+        :param kind: The index of the kind of the piece in the puzzle spec, or None
+            to derive it from the other attributes (classic pieces only).
+        :type kind: Optional[int]
         """
 
         self.is_goal = is_goal
@@ -36,26 +56,199 @@ class Piece:
         self.coord_x = coord_x
         self.coord_y = coord_y
         self.orientation = orientation
+        self.kind = kind
 
     def __repr__(self):
         return '{} {} {} {} {}'.format(self.is_goal, self.is_single, \
             self.coord_x, self.coord_y, self.orientation)
 
+
+class PieceKind:
+    """
+    A kind of piece: its shape, the glyph drawn in each of its cells and how many
+    pieces of the kind are on the board. Pieces of one kind are interchangeable.
+    """
+
+    def __init__(self, cells, glyphs, count, is_goal=False):
+        """
+        :param cells: The (dx, dy) offsets of the cells from the top left corner
+            of the piece's bounding box, in row-major order.
+        :type cells: List[Tuple[int, int]]
+        :param glyphs: The glyph of each cell, in the order of cells.
+        :type glyphs: str
+        :param count: The number of pieces of this kind.
+        :type count: int
+        :param is_goal: True if this is the kind of the goal piece.
+        :type is_goal: bool
+        """
+
+        self.cells = cells
+        self.glyphs = glyphs
+        self.count = count
+        self.is_goal = is_goal
+        self.width = max(dx for dx, _ in cells) + 1
+        self.height = max(dy for _, dy in cells) + 1
+
+
+class PuzzleSpec:
+    """
+    The rules of a sliding block puzzle: the board size, the kinds of pieces and
+    the goal. All move generation tables are computed once here.
+
+    A state is packed into one integer with key_bits bits per cell (row by row,
+    first cell in the lowest bits). Each cell holds the code of the piece cell on
+    it, or 0 if empty. Cells get one code per glyph, except for kinds with several
+    pieces whose glyphs repeat, which get one code per cell so adjacent pieces of
+    the kind stay apart.
+    """
+
+    def __init__(self, width, height, kinds, goal_x, goal_y):
+        """
+        :param width: The width of the board.
+        :type width: int
+        :param height: The height of the board.
+        :type height: int
+        :param kinds: The kinds of pieces; exactly one of them is the goal kind.
+        :type kinds: List[PieceKind]
+        :param goal_x: The x coordinate the goal piece's top left corner must reach.
+        :type goal_x: int
+        :param goal_y: The y coordinate the goal piece's top left corner must reach.
+        :type goal_y: int
+        """
+
+        self.width = width
+        self.height = height
+        self.kinds = kinds
+        self.goal_x = goal_x
+        self.goal_y = goal_y
+        self.goal_kind = [kind.is_goal for kind in kinds].index(True)
+
+        # Codes: code_glyphs[code] is the glyph drawn, cell_codes[kind][i] the code of cell i
+        self.code_glyphs = ['.']
+        self.cell_codes = []
+        self.anchor_codes = {}  # code of the first cell of a kind -> (kind index, shared)
+        for index, kind in enumerate(kinds):
+            per_cell = kind.count > 1 and len(set(kind.glyphs)) < len(kind.glyphs)
+            codes = []
+            glyph_codes = {}
+            for cell, glyph in enumerate(kind.glyphs):
+                if per_cell or glyph not in glyph_codes:
+                    glyph_codes[glyph] = len(self.code_glyphs)
+                    self.code_glyphs.append(glyph)
+                codes.append(glyph_codes[glyph] if not per_cell else len(self.code_glyphs) - 1)
+            self.cell_codes.append(codes)
+            # A code shared by several cells of the kind marks the single piece's first cell
+            self.anchor_codes[codes[0]] = (index, codes.count(codes[0]) > 1)
+
+        self.key_bits = max(1, (len(self.code_glyphs) - 1).bit_length())
+        self.key_mask = (1 << self.key_bits) - 1
+        self.cell_count = width * height
+
+        # Occupancy mask and key field of every kind at every anchor, and its moves
+        self.masks = []
+        self.fields = []
+        self.moves = []
+        for index, kind in enumerate(kinds):
+            masks = {}
+            fields = {}
+            for y in range(height - kind.height + 1):
+                for x in range(width - kind.width + 1):
+                    anchor = y * width + x
+                    masks[anchor] = 0
+                    fields[anchor] = 0
+                    for (dx, dy), code in zip(kind.cells, self.cell_codes[index]):
+                        cell = (y + dy) * width + x + dx
+                        masks[anchor] |= 1 << cell
+                        fields[anchor] |= code << (self.key_bits * cell)
+            moves = {}
+            for anchor in masks:
+                moves[anchor] = []
+                x, y = anchor % width, anchor // width
+                for dx, dy in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
+                    target = (y + dy) * width + x + dx
+                    if 0 <= x + dx < width and 0 <= y + dy < height and target in masks:
+                        # The cells the piece newly covers must be empty
+                        moves[anchor].append((target, masks[target] & ~masks[anchor],
+                                              fields[target] - fields[anchor]))
+            self.masks.append(masks)
+            self.fields.append(fields)
+            self.moves.append(moves)
+
+        goal_anchor = goal_y * width + goal_x
+        self.goal_field = self.fields[self.goal_kind][goal_anchor]
+        self.goal_slots = 0
+        for cell in range(self.cell_count):
+            if (self.masks[self.goal_kind][goal_anchor] >> cell) & 1:
+                self.goal_slots |= self.key_mask << (self.key_bits * cell)
+
+    def decode(self, key):
+        """
+        Return the pieces of a key as (kind index, anchor cell) pairs and the
+        occupancy bitmask of the board.
+        """
+        pieces = []
+        occupied = 0
+        found = set()
+        for cell in range(self.cell_count):
+            code = (key >> (self.key_bits * cell)) & self.key_mask
+            if code:
+                occupied |= 1 << cell
+                if code in self.anchor_codes:
+                    index, shared = self.anchor_codes[code]
+                    if shared:
+                        if index in found:
+                            continue
+                        found.add(index)
+                    dx, dy = self.kinds[index].cells[0]
+                    pieces.append((index, cell - dy * self.width - dx))
+
+        return pieces, occupied
+
+    def classic_kind(self, piece):
+        """
+        Return the kind index of a piece described only by its classic attributes.
+        """
+        if piece.is_goal:
+            return self.goal_kind
+        glyphs = char_single if piece.is_single else ('<>' if piece.orientation == 'h' else '^v')
+        return [kind.glyphs for kind in self.kinds].index(glyphs)
+
+
+def classic_kinds(goal_cells=((0, 0), (1, 0), (0, 1), (1, 1)), counts=(1, 0, 0, 0)):
+    """
+    Return the four classic kinds of pieces (goal, 1x1, 1x2, 2x1) in key code order.
+    """
+    return [PieceKind(list(goal_cells), char_goal * len(goal_cells), counts[0], True),
+            PieceKind([(0, 0)], char_single, counts[1]),
+            PieceKind([(0, 0), (1, 0)], '<>', counts[2]),
+            PieceKind([(0, 0), (0, 1)], '^v', counts[3])]
+
+
+# The classic 4x5 Hua Rong Dao; counts do not change any table, so one spec serves all layouts
+classic_spec = PuzzleSpec(4, 5, classic_kinds(), 1, 3)
+
+
 class Board:
     """
     Board class for setting up the playing board.
     """
 
-    def __init__(self, pieces):
+    def __init__(self, pieces, spec=None):
         """
         :param pieces: The list of Pieces
         :type pieces: List[Piece]
+        :param spec: The rules of the puzzle, the classic Hua Rong Dao by default.
+        :type spec: Optional[PuzzleSpec]
         """
 
-        self.width = 4
-        self.height = 5
+        self.spec = spec if spec is not None else classic_spec
+        self.width = self.spec.width
+        self.height = self.spec.height
 
         self.pieces = pieces
+        for piece in self.pieces:
+            if piece.kind is None:
+                piece.kind = self.spec.classic_kind(piece)
 
         # self.grid is a 2-d (size * size) array automatically generated
         # using the information on the pieces when a board is being created.
@@ -77,20 +270,9 @@ class Board:
             self.grid.append(line)
 
         for piece in self.pieces:
-            if piece.is_goal:
-                self.grid[piece.coord_y][piece.coord_x] = char_goal
-                self.grid[piece.coord_y][piece.coord_x + 1] = char_goal
-                self.grid[piece.coord_y + 1][piece.coord_x] = char_goal
-                self.grid[piece.coord_y + 1][piece.coord_x + 1] = char_goal
-            elif piece.is_single:
-                self.grid[piece.coord_y][piece.coord_x] = char_single
-            else:
-                if piece.orientation == 'h':
-                    self.grid[piece.coord_y][piece.coord_x] = '<'
-                    self.grid[piece.coord_y][piece.coord_x + 1] = '>'
-                elif piece.orientation == 'v':
-                    self.grid[piece.coord_y][piece.coord_x] = '^'
-                    self.grid[piece.coord_y + 1][piece.coord_x] = 'v'
+            kind = self.spec.kinds[piece.kind]
+            for (dx, dy), glyph in zip(kind.cells, kind.glyphs):
+                self.grid[piece.coord_y + dy][piece.coord_x + dx] = glyph
 
     def display(self):
         """
@@ -145,498 +327,260 @@ def read_from_file(filename):
     """
 
     puzzle_file = open(filename, "r")
+    lines = puzzle_file.readlines()
+    puzzle_file.close()
 
-    line_index = 0
-    pieces = []
-    g_found = False
-
-    for line in puzzle_file:
+    return board_from_lines(lines)
 
-        for x, ch in enumerate(line):
 
-            if ch == '^': # found vertical piece
-                pieces.append(Piece(False, False, x, line_index, 'v'))
-            elif ch == '<': # found horizontal piece
-                pieces.append(Piece(False, False, x, line_index, 'h'))
-            elif ch == char_single:
-                pieces.append(Piece(False, True, x, line_index, None))
-            elif ch == char_goal:
-                if g_found == False:
-                    pieces.append(Piece(True, False, x, line_index, None))
-                    g_found = True
-        line_index += 1
+def write_to_file(filename, solution):
+    """
+    Write a solution to a given file: the board of every state followed by an
+    empty line, or a single empty line if there is no solution.
 
-    puzzle_file.close()
+    :param filename: The name of the given file.
+    :type filename: str
+    :param solution: The states from the initial board to the goal, or None.
+    :type solution: Optional[List[State]]
+    """
 
-    board = Board(pieces)
-    
-    return board
+    output_file = open(filename, "w")
+    if solution is None:
+        output_file.write("\n")
+    else:
+        for state in solution:
+            for line in state.board.grid:
+                output_file.write("".join(line) + "\n")
+            output_file.write("\n")
+    output_file.close()
 
 
-# List of Helper functions
-def goal_test(state):
+def board_from_lines(lines):
     """
-    Helper function to test weather the state is a goal state or not.
+    Build a board from the lines of a puzzle file.
+
+    The rows of the grid use the classic glyphs ('1' goal piece, '2' 1x1, '<>'
+    1x2, '^v' 2x1, '.' empty); any other character draws a piece of a custom
+    shape, each connected group of the character being one piece. The goal piece
+    may have any shape. A line "goal X Y" sets the cell the top left corner of the
+    goal piece must reach; by default it is the bottom middle of the board.
+
+    :param lines: The lines of the puzzle file.
+    :type lines: List[str]
+    :return: The board described by the lines
+    :rtype: Board
     """
-    current_board = state.board
 
-    # Check the position of the goal piece, if it is at the designated place, return true
-    # Else return false
-    for piece in current_board.pieces:
-        if piece.is_goal:
-            if piece.coord_x == 1 and piece.coord_y == 3:
-                return True
+    rows = []
+    goal = None
+    for line in lines:
+        words = line.split()
+        if words and words[0] == 'goal':
+            goal = (int(words[1]), int(words[2]))
+        elif words:
+            rows.append(line.rstrip())
+
+    width = max(len(row) for row in rows)
+    height = len(rows)
+    rows = [row.ljust(width, '.') for row in rows]
+
+    # Group the cells of every character into connected pieces
+    groups = {}
+    seen = set()
+    for y in range(height):
+        for x in range(width):
+            ch = rows[y][x]
+            if ch == '.' or (x, y) in seen:
+                continue
+            if ch in [char_single, '<', '>', '^', 'v']:  # Classic pieces are found by their first cell
+                if ch in [char_single, '<', '^']:
+                    groups.setdefault(ch, []).append([(x, y)])
+                continue
+            cells = []
+            stack = [(x, y)]
+            seen.add((x, y))
+            while stack:
+                cx, cy = stack.pop()
+                cells.append((cx, cy))
+                for nx, ny in [(cx - 1, cy), (cx + 1, cy), (cx, cy - 1), (cx, cy + 1)]:
+                    if 0 <= nx < width and 0 <= ny < height and (nx, ny) not in seen and rows[ny][nx] == ch:
+                        seen.add((nx, ny))
+                        stack.append((nx, ny))
+            groups.setdefault(ch, []).append(sorted(cells, key=lambda cell: (cell[1], cell[0])))
+
+    if len(groups.get(char_goal, [])) != 1:
+        raise ValueError("The puzzle must have exactly one goal piece")
+
+    def shape(cells):
+        left = min(x for x, _ in cells)
+        top = min(y for _, y in cells)
+        return [(x - left, y - top) for x, y in cells], left, top
+
+    goal_cells, _, _ = shape(groups[char_goal][0])
+    kinds = classic_kinds(goal_cells, (1, len(groups.get(char_single, [])),
+                                       len(groups.get('<', [])), len(groups.get('^', []))))
+    custom = sorted(ch for ch in groups if ch not in [char_goal, char_single, '<', '^'])
+    for ch in custom:
+        cells = shape(groups[ch][0])[0]
+        if any(shape(group)[0] != cells for group in groups[ch]):
+            raise ValueError("All pieces drawn with '{}' must have the same shape".format(ch))
+        kinds.append(PieceKind(cells, ch * len(cells), len(groups[ch])))
+
+    if goal is None:
+        goal = ((width - kinds[0].width) // 2, height - kinds[0].height)
+
+    first_chars = [char_goal, char_single, '<', '^'] + custom
+    if (width, height, goal) == (4, 5, (1, 3)) and not custom and kinds[0].cells == classic_spec.kinds[0].cells:
+        spec = classic_spec
+    else:
+        # Kinds without pieces are left out so the keys stay as short as possible
+        first_chars = [ch for ch, kind in zip(first_chars, kinds) if kind.count > 0]
+        kinds = [kind for kind in kinds if kind.count > 0]
+        spec = PuzzleSpec(width, height, kinds, goal[0], goal[1])
 
-    return False
+    pieces = []
+    for index, ch in enumerate(first_chars):
+        for group in groups.get(ch, []):
+            _, left, top = shape(group)
+            pieces.append(Piece(ch == char_goal, ch == char_single, left, top,
+                                {'<': 'h', '^': 'v'}.get(ch), index))
 
+    board = Board(pieces, spec)
+    
+    return board
 
-def heuristic_function(state):
-    """
-    Given a state, return its heuristic value.
-    """
-    state_board = state.board
-    for piece in state_board.pieces:
-        if piece.is_goal:
-            curr_x = piece.coord_x
-            curr_y = piece.coord_y
-            return abs(curr_x - 1) + abs(curr_y - 3)
 
+#====================================================================================
+# Packed state keys
 
-def locate_empty_squares(game_board):
+
+def get_state_key(board):
     """
-    Locates the 2 empty squares on the board, return them as a tuple.
+    Pack a board into an integer key (see PuzzleSpec).
     """
-    square_1 = []
-    square_2 = []
-
-    for row in range(len(game_board.grid)):
-        for column in range(len(game_board.grid[row])):
-            if game_board.grid[row][column] == ".":
-                if square_1:
-                    square_2.append(column)
-                    square_2.append(row)
-                else:
-                    square_1.append(column)
-                    square_1.append(row)
+    fields = board.spec.fields
+    key = 0
+    for piece in board.pieces:
+        key |= fields[piece.kind][piece.coord_y * board.width + piece.coord_x]
 
-    return square_1, square_2
+    return key
 
 
-def move_piece_right(game_board, piece):
+def board_from_key(key, spec=classic_spec):
     """
-    Given the game board and the piece of interest, move it right by 1.
-    Return a new game board of the result.
+    Unpack an integer key into a board.
     """
-    new_board = deepcopy(game_board)
+    pieces = []
+    for index, anchor in spec.decode(key)[0]:
+        kind = spec.kinds[index]
+        pieces.append(Piece(kind.is_goal, kind.glyphs == char_single, anchor % spec.width, anchor // spec.width,
+                            {'<>': 'h', '^v': 'v'}.get(kind.glyphs), index))
 
-    # Get the coordinates of the piece
-    x_cord = piece.coord_x
-    y_cord = piece.coord_y
+    return Board(pieces, spec)
 
-    # Change the coordinate of the piece in the new board.
-    for new_piece in new_board.pieces:
-        if new_piece.coord_x == x_cord and new_piece.coord_y == y_cord:
-            new_piece.coord_x += 1
-            break
 
-    # Change the grid of the new board.
-    if piece.is_single:  # The piece is 1x1
-        new_board.grid[y_cord][x_cord + 1] = "2"
-        new_board.grid[y_cord][x_cord] = "."
-    elif piece.orientation == "h":  # The piece is 1x2
-        new_board.grid[y_cord][x_cord + 2] = ">"
-        new_board.grid[y_cord][x_cord + 1] = "<"
-        new_board.grid[y_cord][x_cord] = "."
-    elif piece.orientation == "v":  # The piece is 2x1
-        new_board.grid[y_cord][x_cord + 1] = "^"
-        new_board.grid[y_cord + 1][x_cord + 1] = "v"
-        new_board.grid[y_cord][x_cord] = "."
-        new_board.grid[y_cord + 1][x_cord] = "."
-    elif piece.is_goal:  # The piece is 2x2
-        new_board.grid[y_cord][x_cord + 2] = "1"
-        new_board.grid[y_cord + 1][x_cord + 2] = "1"
-        new_board.grid[y_cord][x_cord] = "."
-        new_board.grid[y_cord + 1][x_cord] = "."
-
-    return new_board
-
-
-def check_left(square, game_board, state):
-    """
-    Given a board and the empty square, check the left side of it and consider the possible moves.
-    """
-    x_cord = square[0]
-    y_cord = square[1]
-    board_grid = game_board.grid
-    new_board = None
-    new_state = None
-
-    if x_cord > 0:  # If the x-coordinate is 0 then there's no possible moves.
-        # Start checking for the squares on the left of the coordinate
-        if board_grid[y_cord][x_cord - 1] == "2":  # the piece on the left is a 1x1 piece.
-            for piece in game_board.pieces:
-                if piece.coord_x == x_cord - 1 and piece.coord_y == y_cord:
-                    new_board = move_piece_right(game_board, piece)
-                    break
-        elif board_grid[y_cord][x_cord - 1] == ">":  # the piece on the left is a 1x2 piece.
-            for piece in game_board.pieces:
-                if piece.coord_x == x_cord - 2 and piece.coord_y == y_cord:
-                    new_board = move_piece_right(game_board, piece)
-                    break
-        elif board_grid[y_cord][x_cord - 1] == "v":  # the piece on the left is the bottom of a 2x1 piece
-            if board_grid[y_cord - 1][x_cord] == ".":  # Indicating that the piece is legal to move.
-                for piece in game_board.pieces:
-                    if piece.coord_x == x_cord - 1 and piece.coord_y == y_cord - 1:
-                        new_board = move_piece_right(game_board, piece)
-                        break
-        elif board_grid[y_cord][x_cord - 1] == "^":  # the piece on the left is the top of a 2x1 piece
-            if board_grid[y_cord + 1][x_cord] == ".":  # Indicating that the piece is legal to move.
-                for piece in game_board.pieces:
-                    if piece.coord_x == x_cord - 1 and piece.coord_y == y_cord:
-                        new_board = move_piece_right(game_board, piece)
-                        break
-        elif board_grid[y_cord][x_cord - 1] == "1":  # the piece on the left is a 2x2 piece
-            if y_cord < len(board_grid) - 1:
-                if board_grid[y_cord + 1][x_cord] == "." and board_grid[y_cord + 1][x_cord - 1] == "1":
-                    for piece in game_board.pieces:
-                        if piece.coord_x == x_cord - 2 and piece.coord_y == y_cord:
-                            new_board = move_piece_right(game_board, piece)
-                            break
-            else:
-                if board_grid[y_cord - 1][x_cord] == "." and board_grid[y_cord - 1][x_cord - 1] == "1":
-                    for piece in game_board.pieces:
-                        if piece.coord_x == x_cord - 2 and piece.coord_y == y_cord - 1:
-                            new_board = move_piece_right(game_board, piece)
-                            break
+def key_goal_position(key, spec=classic_spec):
+    """
+    Return the (x, y) coordinate of the top left corner of the goal piece in a key.
+    """
+    kind = spec.kinds[spec.goal_kind]
+    code = spec.cell_codes[spec.goal_kind][0]
+    for cell in range(spec.cell_count):
+        if (key >> (spec.key_bits * cell)) & spec.key_mask == code:
+            dx, dy = kind.cells[0]
+            return cell % spec.width - dx, cell // spec.width - dy
 
-        if new_board is not None:
-            old_cost = state.f - heuristic_function(state)
-            new_state = State(new_board, old_cost + 1, state.depth + 1, state)
-            new_state.f += heuristic_function(new_state)
-        return new_state
+    return None
 
 
-def move_piece_left(game_board, piece):
+def key_heuristic(key, spec=classic_spec):
     """
-    Given the game board and the piece of interest, move it left by 1.
-    Return a new game board of the result.
+    The heuristic_function of the state with the given key.
     """
-    new_board = deepcopy(game_board)
+    goal_x, goal_y = key_goal_position(key, spec)
+    return abs(goal_x - spec.goal_x) + abs(goal_y - spec.goal_y)
 
-    # Get the coordinates of the piece
-    x_cord = piece.coord_x
-    y_cord = piece.coord_y
 
-    # Change the coordinate of the piece in the new board.
-    for new_piece in new_board.pieces:
-        if new_piece.coord_x == x_cord and new_piece.coord_y == y_cord:
-            new_piece.coord_x -= 1
-            break
-
-    # Change the grid of the new board.
-    if piece.is_single:  # The piece is 1x1
-        new_board.grid[y_cord][x_cord - 1] = "2"
-        new_board.grid[y_cord][x_cord] = "."
-    elif piece.orientation == "h":  # The piece is 1x2
-        new_board.grid[y_cord][x_cord - 1] = "<"
-        new_board.grid[y_cord][x_cord] = ">"
-        new_board.grid[y_cord][x_cord + 1] = "."
-    elif piece.orientation == "v":  # The piece is 2x1
-        new_board.grid[y_cord][x_cord - 1] = "^"
-        new_board.grid[y_cord + 1][x_cord - 1] = "v"
-        new_board.grid[y_cord][x_cord] = "."
-        new_board.grid[y_cord + 1][x_cord] = "."
-    elif piece.is_goal:  # The piece is 2x2
-        new_board.grid[y_cord][x_cord - 1] = "1"
-        new_board.grid[y_cord + 1][x_cord - 1] = "1"
-        new_board.grid[y_cord][x_cord + 1] = "."
-        new_board.grid[y_cord + 1][x_cord + 1] = "."
-
-    return new_board
-
-
-def check_right(square, game_board, state):
-    """
-    Given a board and the empty square, check the right side of it and consider the possible moves.
-    """
-    x_cord = square[0]
-    y_cord = square[1]
-    board_grid = game_board.grid
-    new_board = None
-    new_state = None
-
-    if x_cord < len(board_grid[0]) - 1:  # If the x-coordinate is the max length then there's no possible moves.
-        # Start checking for the squares on the right of the coordinate
-        if board_grid[y_cord][x_cord + 1] == "2":  # the piece on the right is a 1x1 piece.
-            for piece in game_board.pieces:
-                if piece.coord_x == x_cord + 1 and piece.coord_y == y_cord:
-                    new_board = move_piece_left(game_board, piece)
-                    break
-        elif board_grid[y_cord][x_cord + 1] == "<":  # the piece on the right is a 1x2 piece.
-            for piece in game_board.pieces:
-                if piece.coord_x == x_cord + 1 and piece.coord_y == y_cord:
-                    new_board = move_piece_left(game_board, piece)
-                    break
-        elif board_grid[y_cord][x_cord + 1] == "v":  # the piece on the right is the bottom of a 2x1 piece
-            if board_grid[y_cord - 1][x_cord] == ".":  # Indicating that the piece is legal to move.
-                for piece in game_board.pieces:
-                    if piece.coord_x == x_cord + 1 and piece.coord_y == y_cord - 1:
-                        new_board = move_piece_left(game_board, piece)
-                        break
-        elif board_grid[y_cord][x_cord + 1] == "^":  # the piece on the left is the top of a 2x1 piece
-            if board_grid[y_cord + 1][x_cord] == ".":  # Indicating that the piece is legal to move.
-                for piece in game_board.pieces:
-                    if piece.coord_x == x_cord + 1 and piece.coord_y == y_cord:
-                        new_board = move_piece_left(game_board, piece)
-                        break
-        elif board_grid[y_cord][x_cord + 1] == "1":  # the piece on the left is a 2x2 piece
-            if y_cord < len(board_grid) - 1:
-                if board_grid[y_cord + 1][x_cord] == "." and board_grid[y_cord + 1][x_cord + 1] == "1":
-                    for piece in game_board.pieces:
-                        if piece.coord_x == x_cord + 1 and piece.coord_y == y_cord:
-                            new_board = move_piece_left(game_board, piece)
-                            break
-            else:
-                if board_grid[y_cord - 1][x_cord] == "." and board_grid[y_cord - 1][x_cord + 1] == "1":
-                    for piece in game_board.pieces:
-                        if piece.coord_x == x_cord + 1 and piece.coord_y == y_cord - 1:
-                            new_board = move_piece_left(game_board, piece)
-                            break
-
-        if new_board is not None:
-            old_cost = state.f - heuristic_function(state)
-            new_state = State(new_board, old_cost + 1, state.depth + 1, state)
-            new_state.f += heuristic_function(new_state)
-        return new_state
+def key_is_goal(key, spec=classic_spec):
+    """
+    The goal_test of the state with the given key.
+    """
+    return key & spec.goal_slots == spec.goal_field
 
 
-def move_piece_down(game_board, piece):
+def generate_successor_keys(key, spec=classic_spec):
     """
-    Given the game board and the piece of interest, move it down by 1.
-    Return a new game board of the result.
+    Given a key, return the keys of the successors of its state.
+    A piece can move when the cells it would newly cover are all empty.
     """
-    new_board = deepcopy(game_board)
+    pieces, occupied = spec.decode(key)
+    moves = spec.moves
+    successor_keys = []
+    for index, anchor in pieces:
+        for _, newly_covered, delta in moves[index][anchor]:
+            if not occupied & newly_covered:
+                successor_keys.append(key + delta)
 
-    # Get the coordinates of the piece
-    x_cord = piece.coord_x
-    y_cord = piece.coord_y
+    return successor_keys
 
-    # Change the coordinate of the piece in the new board.
-    for new_piece in new_board.pieces:
-        if new_piece.coord_x == x_cord and new_piece.coord_y == y_cord:
-            new_piece.coord_y += 1
-            break
 
-    # Change the grid of the new board.
-    if piece.is_single:  # The piece is 1x1
-        new_board.grid[y_cord + 1][x_cord] = "2"
-        new_board.grid[y_cord][x_cord] = "."
-    elif piece.orientation == "v":  # The piece is 2x1
-        new_board.grid[y_cord + 2][x_cord] = "v"
-        new_board.grid[y_cord + 1][x_cord] = "^"
-        new_board.grid[y_cord][x_cord] = "."
-    elif piece.orientation == "h":  # The piece is 1x2
-        new_board.grid[y_cord + 1][x_cord] = "<"
-        new_board.grid[y_cord + 1][x_cord + 1] = ">"
-        new_board.grid[y_cord][x_cord] = "."
-        new_board.grid[y_cord][x_cord + 1] = "."
-    elif piece.is_goal:  # The piece is 2x2
-        new_board.grid[y_cord + 2][x_cord] = "1"
-        new_board.grid[y_cord + 2][x_cord + 1] = "1"
-        new_board.grid[y_cord][x_cord] = "."
-        new_board.grid[y_cord][x_cord + 1] = "."
-
-    return new_board
-
-
-def check_top(square, game_board, state):
-    """
-    Given a board and the empty square, check the top side of it and consider the possible moves.
-    """
-    x_cord = square[0]
-    y_cord = square[1]
-    board_grid = game_board.grid
-    new_board = None
-    new_state = None
-
-    if y_cord > 0:  # If the y-coordinate is 0 then there's no possible moves.
-        # Start checking for the squares on the top of the square
-        if board_grid[y_cord - 1][x_cord] == "2":  # the piece on the top is a 1x1 piece.
-            for piece in game_board.pieces:
-                if piece.coord_x == x_cord and piece.coord_y == y_cord - 1:
-                    new_board = move_piece_down(game_board, piece)
-                    break
-        elif board_grid[y_cord - 1][x_cord] == "v":  # the piece on the top is a 2x1 piece.
-            for piece in game_board.pieces:
-                if piece.coord_x == x_cord and piece.coord_y == y_cord - 2:
-                    new_board = move_piece_down(game_board, piece)
-                    break
-        elif board_grid[y_cord - 1][x_cord] == "<":  # the piece on the top is the left of the 1x2 piece
-            if board_grid[y_cord][x_cord + 1] == ".":  # Indicating that the piece is legal to move.
-                for piece in game_board.pieces:
-                    if piece.coord_x == x_cord and piece.coord_y == y_cord - 1:
-                        new_board = move_piece_down(game_board, piece)
-                        break
-        elif board_grid[y_cord - 1][x_cord] == ">":  # right of the 1x2 piece
-            if board_grid[y_cord][x_cord - 1] == ".":
-                for piece in game_board.pieces:
-                    if piece.coord_x == x_cord - 1 and piece.coord_y == y_cord - 1:
-                        new_board = move_piece_down(game_board, piece)
-                        break
-        elif board_grid[y_cord - 1][x_cord] == "1":  # the piece is a 2x2 piece.
-            if x_cord < len(board_grid[0]) - 1:
-                if board_grid[y_cord][x_cord + 1] == "." and board_grid[y_cord - 1][x_cord + 1] == "1":
-                    for piece in game_board.pieces:
-                        if piece.coord_x == x_cord and piece.coord_y == y_cord - 2:
-                            new_board = move_piece_down(game_board, piece)
-                            break
-            else:
-                if board_grid[y_cord][x_cord - 1] == "." and board_grid[y_cord - 1][x_cord - 1] == "1":
-                    for piece in game_board.pieces:
-                        if piece.coord_x == x_cord - 1 and piece.coord_y == y_cord - 2:
-                            new_board = move_piece_down(game_board, piece)
-                            break
-
-    if new_board is not None:
-        old_cost = state.f - heuristic_function(state)
-        new_state = State(new_board, old_cost + 1, state.depth + 1, state)
-        new_state.f += heuristic_function(new_state)
-    return new_state
+def get_solution_from_keys(keys, spec=classic_spec):
+    """
+    Turn a sequence of keys from the initial state to the goal into a sequence of states.
+    """
+    result_sequence = []
+    parent = None
+    for depth, key in enumerate(keys):
+        parent = State(board_from_key(key, spec), depth, depth, parent)
+        result_sequence.append(parent)
+
+    return result_sequence
 
 
-def move_piece_up(game_board, piece):
+# List of Helper functions
+def goal_test(state):
     """
-    Given the game board and the piece of interest, move it up by 1.
-    Return a new game board of the result.
+    Helper function to test weather the state is a goal state or not.
     """
-    new_board = deepcopy(game_board)
-
-    # Get the coordinates of the piece
-    x_cord = piece.coord_x
-    y_cord = piece.coord_y
+    current_board = state.board
+    spec = current_board.spec
 
-    # Change the coordinate of the piece in the new board.
-    for new_piece in new_board.pieces:
-        if new_piece.coord_x == x_cord and new_piece.coord_y == y_cord:
-            new_piece.coord_y -= 1
-            break
+    # Check the position of the goal piece, if it is at the designated place, return true
+    # Else return false
+    for piece in current_board.pieces:
+        if piece.is_goal:
+            if piece.coord_x == spec.goal_x and piece.coord_y == spec.goal_y:
+                return True
 
-    # Change the grid of the new board.
-    if piece.is_single:  # The piece is 1x1
-        new_board.grid[y_cord - 1][x_cord] = "2"
-        new_board.grid[y_cord][x_cord] = "."
-    elif piece.orientation == "v":  # The piece is 2x1
-        new_board.grid[y_cord - 1][x_cord] = "^"
-        new_board.grid[y_cord][x_cord] = "v"
-        new_board.grid[y_cord + 1][x_cord] = "."
-    elif piece.orientation == "h":  # The piece is 1x2
-        new_board.grid[y_cord - 1][x_cord] = "<"
-        new_board.grid[y_cord - 1][x_cord + 1] = ">"
-        new_board.grid[y_cord][x_cord] = "."
-        new_board.grid[y_cord][x_cord + 1] = "."
-    elif piece.is_goal:  # The piece is 2x2
-        new_board.grid[y_cord - 1][x_cord] = "1"
-        new_board.grid[y_cord - 1][x_cord + 1] = "1"
-        new_board.grid[y_cord + 1][x_cord] = "."
-        new_board.grid[y_cord + 1][x_cord + 1] = "."
-
-    return new_board
-
-
-def check_bottom(square, game_board, state):
-    """
-    Given a board and the empty square, check the bottom side of it and consider the possible moves.
-    """
-    x_cord = square[0]
-    y_cord = square[1]
-    board_grid = game_board.grid
-    new_board = None
-    new_state = None
-
-    if y_cord < len(board_grid) - 1:  # If the y-coordinate is at the bottom then there's no possible moves.
-        # Start checking for the squares on the bottom of the square
-        if board_grid[y_cord + 1][x_cord] == "2":  # the piece on the bottom is a 1x1 piece.
-            for piece in game_board.pieces:
-                if piece.coord_x == x_cord and piece.coord_y == y_cord + 1:
-                    new_board = move_piece_up(game_board, piece)
-                    break
-        elif board_grid[y_cord + 1][x_cord] == "^":  # the piece on the bottom is a 2x1 piece.
-            for piece in game_board.pieces:
-                if piece.coord_x == x_cord and piece.coord_y == y_cord + 1:
-                    new_board = move_piece_up(game_board, piece)
-                    break
-        elif board_grid[y_cord + 1][x_cord] == "<":  # the piece on the bottom is the left of the 1x2 piece
-            if board_grid[y_cord] [x_cord + 1]== ".":  # Indicating that the piece is legal to move.
-                for piece in game_board.pieces:
-                    if piece.coord_x == x_cord and piece.coord_y == y_cord + 1:
-                        new_board = move_piece_up(game_board, piece)
-                        break
-        elif board_grid[y_cord + 1][x_cord] == ">":  # right of the 1x2 piece
-            if board_grid[y_cord][x_cord - 1] == ".":
-                for piece in game_board.pieces:
-                    if piece.coord_x == x_cord - 1 and piece.coord_y == y_cord + 1:
-                        new_board = move_piece_up(game_board, piece)
-                        break
-        elif board_grid[y_cord + 1][x_cord] == "1":  # the piece is a 2x2 piece.
-            if x_cord < len(board_grid[0]) - 1:
-                if board_grid[y_cord][x_cord + 1] == "." and board_grid[x_cord + 1][y_cord + 1] == "1":
-                    for piece in game_board.pieces:
-                        if piece.coord_x == x_cord and piece.coord_y == y_cord + 1:
-                            new_board = move_piece_up(game_board, piece)
-                            break
-            else:
-                if board_grid[y_cord][x_cord - 1] == "." and board_grid[x_cord - 1][y_cord + 1] == "1":
-                    for piece in game_board.pieces:
-                        if piece.coord_x == x_cord - 1 and piece.coord_y == y_cord + 1:
-                            new_board = move_piece_up(game_board, piece)
-                            break
-
-    if new_board is not None:
-        old_cost = state.f - heuristic_function(state)
-        new_state = State(new_board, old_cost + 1, state.depth + 1, state)
-        new_state.f += heuristic_function(new_state)
-    return new_state
+    return False
 
 
-def remove_duplicate_boards(result_states):
+def heuristic_function(state):
     """
-    Helper that remove duplicate states/boards from the list.
-    The list is a cleaned version and has no NULL states or boards.
+    Given a state, return its heuristic value.
     """
-    grid_explored = []
-    filtered_state = []
-
-    for state in result_states:
-        if state.board.grid not in grid_explored:
-            filtered_state.append(state)
-            grid_explored.append(state.board.grid)
-
-    return filtered_state
+    state_board = state.board
+    for piece in state_board.pieces:
+        if piece.is_goal:
+            curr_x = piece.coord_x
+            curr_y = piece.coord_y
+            return abs(curr_x - state_board.spec.goal_x) + abs(curr_y - state_board.spec.goal_y)
 
 
 def generate_successors(state):
     """
     Given a state, return a list of possible successors of this state.
     """
+    spec = state.board.spec
+    old_cost = state.f - heuristic_function(state)
     result_states = []  # List of the resulting successor states
-    cleaned_states = []  # List of the cleaned successor states
-    state_board = deepcopy(state.board)
-
-    squares = locate_empty_squares(state_board)  # locate the 2 empty squares and return them as a tuple
 
-    for square in squares:
-        result_states.append(check_left(square, state_board, state))
-        result_states.append(check_right(square, state_board, state))
-        result_states.append(check_top(square, state_board, state))
-        result_states.append(check_bottom(square, state_board, state))
-
-    for state in result_states:
-        if state is not None and state.board is not None:
-            cleaned_states.append(state)
-
-    further_cleaned_states = remove_duplicate_boards(cleaned_states)
+    for successor_key in generate_successor_keys(get_state_key(state.board), spec):
+        new_state = State(board_from_key(successor_key, spec), old_cost + 1, state.depth + 1, state)
+        new_state.f += heuristic_function(new_state)
+        result_states.append(new_state)
 
-    return further_cleaned_states
+    return result_states
 
 
 def get_solution(state):
@@ -657,14 +601,161 @@ def get_solution(state):
     return result_sequence
 
 
-def dfs(state):
+#====================================================================================
+# Visited sets
+#
+# dfs and astar remember explored states in a visited set. Three backends share
+# the same interface (key, __contains__, add, stats):
+#   'string' - a set of grid strings, exact but a few hundred bytes per state;
+#   'int'    - a set of packed integer keys, exact and several times smaller;
+#   'bloom'  - a Bloom filter over packed keys, a fixed bit array sized from the
+#              expected number of states. A false positive makes the search treat
+#              an unexplored state as explored, so it may miss the optimal
+#              solution, or every solution; the stats report the risk.
+
+
+class StringVisitedSet:
+    """
+    The exact visited set of grid strings.
+    """
+    name = 'string'
+    exact = True
+
+    def __init__(self):
+        self.entries = set()
+
+    def key(self, board):
+        return ' '.join(chain.from_iterable(board.grid))
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def add(self, key):
+        self.entries.add(key)
+
+    def stats(self):
+        return {'backend': self.name, 'exact': self.exact, 'entries': len(self.entries)}
+
+
+class KeyVisitedSet(StringVisitedSet):
+    """
+    The exact visited set of packed integer keys.
+    """
+    name = 'int'
+
+    def key(self, board):
+        return get_state_key(board)
+
+
+class BloomVisitedSet:
+    """
+    An approximate visited set: a Bloom filter over packed integer keys.
+
+    :param expected_states: The number of states the filter is sized for.
+    :param false_positive_rate: The false positive rate at expected_states entries.
+    """
+    name = 'bloom'
+    exact = False
+
+    def __init__(self, expected_states, false_positive_rate=0.01):
+        expected_states = max(1, expected_states)
+        bits = -expected_states * math.log(false_positive_rate) / math.log(2) ** 2
+        self.size = max(64, int(math.ceil(bits / 8)) * 8)
+        self.hashes = max(1, int(round(self.size / expected_states * math.log(2))))
+        self.bits = bytearray(self.size // 8)
+        self.expected_states = expected_states
+        self.false_positive_rate = false_positive_rate
+        self.count = 0
+
+    def key(self, board):
+        return get_state_key(board)
+
+    def positions(self, key):
+        """
+        Return the bit positions of a key, by double hashing two 64-bit mixes of it.
+        """
+        first = hash_mix(key)
+        second = hash_mix(first ^ key) | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def __contains__(self, key):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self.positions(key))
+
+    def add(self, key):
+        bits = self.bits
+        for position in self.positions(key):
+            bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def stats(self):
+        set_bits = sum(bin(byte).count('1') for byte in self.bits)
+        fill = set_bits / self.size
+        return {
+            'backend': self.name,
+            'exact': self.exact,
+            'entries': self.count,
+            'bytes': len(self.bits),
+            'hashes': self.hashes,
+            'fill': fill,
+            'false_positive_rate': fill ** self.hashes,
+            'caveat': 'approximate: states may be wrongly pruned, so the search may '
+                      'miss the optimal solution or report no solution'
+                      + (' (more states than expected were added)' if self.count > self.expected_states else ''),
+        }
+
+
+def hash_mix(value):
+    """
+    The splitmix64 finalizer: spread the bits of an integer over 64 bits.
+    """
+    value = (value ^ (value >> 30)) * 0xbf58476d1ce4e5b9 & 0xffffffffffffffff
+    value = (value ^ (value >> 27)) * 0x94d049bb133111eb & 0xffffffffffffffff
+    return value ^ (value >> 31)
+
+
+def make_visited_set(backend='string', expected_states=1000000, false_positive_rate=0.01):
+    """
+    Return an empty visited set of the given backend ('string', 'int' or 'bloom').
+    """
+    if backend == 'string':
+        return StringVisitedSet()
+    if backend == 'int':
+        return KeyVisitedSet()
+    if backend == 'bloom':
+        return BloomVisitedSet(expected_states, false_positive_rate)
+    raise ValueError("Unknown visited set backend: {}".format(backend))
+
+
+def benchmark_visited_sets(state, algo, expected_states, false_positive_rate):
+    """
+    Run dfs or astar with each visited set backend and print time, peak memory,
+    solution length and the backend stats.
+    """
+    search = dfs if algo == 'dfs' else astar
+    for backend in ['string', 'int', 'bloom']:
+        visited = make_visited_set(backend, expected_states, false_positive_rate)
+        tracemalloc.start()
+        start = time.time()
+        result = search(state, visited)
+        elapsed = time.time() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        length = len(result) - 1 if result is not None else None
+        print("{:>6}: {:8.2f}s  peak {:8.1f} MB  moves {}  {}".format(
+            backend, elapsed, peak / 1024 / 1024, length, visited.stats()))
+
+
+def dfs(state, visited=None):
     """
     Given an initial state, conduct DFS and returns when a solution is found.
     Multi-path pruning will also be implemented.
+
+    :param visited: The visited set to use (see make_visited_set); a set of grid strings by default.
     """
     # Initialize frontier and nodes explored
     frontier = []
-    grids_explored = set()
+    grids_explored = visited if visited is not None else StringVisitedSet()
 
     # Add the initial state to the frontier, and add the initial_grid to the explored list
     frontier.append(state)
@@ -673,8 +764,7 @@ def dfs(state):
     while frontier:
         temp_state = frontier.pop()  # Remove the last element of the frontier
 
-        flattened_grid = list(chain.from_iterable(temp_state.board.grid))
-        grid_string = ' '.join(flattened_grid)
+        grid_string = grids_explored.key(temp_state.board)
         if grid_string not in grids_explored:  # Check if the grid is explored
             grids_explored.add(grid_string)
 
@@ -684,22 +774,117 @@ def dfs(state):
                 successor_states = generate_successors(temp_state)  # Generate it's successor states
 
                 for successor in successor_states:  # Successors can potentially go to an already explored state
-                    flattened_successor_grid = list(chain.from_iterable(successor.board.grid))
-                    successor_string = ' '.join(flattened_successor_grid)
+                    successor_string = grids_explored.key(successor.board)
                     if successor_string not in grids_explored:
                         frontier.append(successor)
 
     return None  # No solution
 
 
-def astar(state):
+def ordered_successor_keys(key, spec, heuristic):
+    """
+    Return an iterator over (heuristic value, successor key) for the successors
+    of a key, most promising first.
+    """
+    return iter(sorted((heuristic(successor, spec), successor) for successor in generate_successor_keys(key, spec)))
+
+
+def bounded_dfs(start_key, spec, depth_bound, heuristic, shortest=None):
+    """
+    Depth first search from a key, children tried in heuristic order and goal
+    tested when they are generated. Only one successor iterator per depth is kept
+    on the stack.
+
+    Without a depth bound every state is expanded at most once. With one, a state
+    is not expanded when its depth plus its heuristic value exceeds the bound, and
+    it is searched again only when it is reached at a smaller depth than before
+    (with more of the bound left). shortest, if given, maps states to the smallest
+    depth any earlier search reached them at: reaching one deeper than that leads
+    nowhere new, since the shorter path is searched under every larger bound.
+    Returns (keys of the solution or None, the smallest depth plus heuristic value
+    of a state the bound cut off, or None if the bound cut nothing).
+    """
+    path = [start_key]
+    stack = [ordered_successor_keys(start_key, spec, heuristic)]
+    best_depth = {start_key: 0}
+    next_bound = None
+
+    while stack:
+        h, successor_key = next(stack[-1], (None, None))
+        if successor_key is None:  # All children of the deepest state are done
+            stack.pop()
+            path.pop()
+            continue
+
+        depth = len(path)
+        if depth_bound is None:
+            if successor_key in best_depth:  # A closed set: no path length to improve on
+                continue
+        elif best_depth.get(successor_key, depth + 1) <= depth:
+            continue
+        elif shortest is not None:
+            if shortest.get(successor_key, depth) < depth:
+                continue
+            shortest[successor_key] = depth
+        best_depth[successor_key] = depth
+        if key_is_goal(successor_key, spec):
+            return path + [successor_key], next_bound
+
+        if depth_bound is not None and depth + h > depth_bound:
+            # A goal below this state would be deeper than the bound
+            if next_bound is None or depth + h < next_bound:
+                next_bound = depth + h
+            continue
+        path.append(successor_key)
+        stack.append(ordered_successor_keys(successor_key, spec, heuristic))
+
+    return None, next_bound
+
+
+def guided_dfs(state, depth_bound=None, iterative=True, heuristic=key_heuristic):
+    """
+    Given an initial state, conduct heuristic-guided DFS and return a solution, or None.
+
+    :param depth_bound: The largest solution length to look for, or None for no bound.
+    :param iterative: If True, search with a bound starting at the heuristic value
+        of the initial state and raised to the smallest depth plus heuristic value
+        the previous bound cut off (up to depth_bound if given), as in IDA*, so the
+        first solution found is a shortest one. If False, search once, expanding
+        every state at most once: much faster, but the solution can be many times
+        longer than a shortest one.
+    """
+    spec = state.board.spec
+    start_key = get_state_key(state.board)
+    if key_is_goal(start_key, spec):
+        return get_solution_from_keys([start_key], spec)
+
+    if not iterative:
+        keys, _ = bounded_dfs(start_key, spec, depth_bound, heuristic)
+        return get_solution_from_keys(keys, spec) if keys is not None else None
+
+    bound = max(1, heuristic(start_key, spec))
+    shortest = {start_key: 0}
+    while depth_bound is None or bound <= depth_bound:
+        keys, next_bound = bounded_dfs(start_key, spec, bound, heuristic, shortest)
+        if keys is not None:
+            return get_solution_from_keys(keys, spec)
+        if next_bound is None:  # The whole reachable space fits under the bound
+            return None
+        bound = next_bound
+
+    return None  # No solution within the depth bound
+
+
+def astar(state, visited=None):
     """
     Given an initial state, conduct A* search and returns when a solution is found.
     Multi-path pruning will also be implemented.
+
+    :param visited: The visited set to use (see make_visited_set); a set of grid strings by default.
     """
     # Initialize frontier and nodes explored
     frontier = []
-    grids_explored = set()
+    grids_explored = visited if visited is not None else StringVisitedSet()
 
     # Add the initial state to the frontier. More specifically, its f-value
     heapq.heappush(frontier, (state.f, state))
@@ -717,8 +902,7 @@ def astar(state):
         #         temp_state = state_to_search
         #         frontier.remove(temp_state)  # Remove the state from the frontier.
         #         break
-        flattened_grid = list(chain.from_iterable(temp_state.board.grid))
-        grid_string = ' '.join(flattened_grid)
+        grid_string = grids_explored.key(temp_state.board)
         if grid_string not in grids_explored:  # Check if the grid is explored
             grids_explored.add(grid_string)
 
@@ -728,8 +912,7 @@ def astar(state):
                 successor_states = generate_successors(temp_state)  # Generate it's successor states
 
                 for successor in successor_states:
-                    flattened_successor_grid = list(chain.from_iterable(successor.board.grid))
-                    successor_string = ' '.join(flattened_successor_grid)
+                    successor_string = grids_explored.key(successor.board)
                     if successor_string not in grids_explored:
                         # Add successors to frontier
                         heapq.heappush(frontier, (successor.f, successor))
@@ -737,6 +920,1281 @@ def astar(state):
     return None  # No solution
 
 
+#====================================================================================
+# Weighted and anytime A*
+
+
+def path_from_parents(parents, key):
+    """
+    Follow parent links from a key back to the initial state and return the keys in order.
+    """
+    keys = []
+    while key is not None:
+        keys.append(key)
+        key = parents[key]
+    keys.reverse()
+
+    return keys
+
+
+def weighted_astar(state, weight=2.0, heuristic=key_heuristic):
+    """
+    Given an initial state, conduct weighted A* search (f = g + weight * h) and
+    return a solution at most weight times longer than the optimal one, or None.
+    """
+    spec = state.board.spec
+    start_key = get_state_key(state.board)
+    frontier = [(weight * heuristic(start_key, spec), 0, start_key)]
+    best_g = {start_key: 0}
+    parents = {start_key: None}
+    grids_explored = set()
+
+    while frontier:
+        _, g, key = heappop(frontier)
+        if key in grids_explored:
+            continue
+        grids_explored.add(key)
+
+        if key_is_goal(key, spec):
+            return get_solution_from_keys(path_from_parents(parents, key), spec)
+
+        for successor_key in generate_successor_keys(key, spec):
+            if successor_key not in best_g or g + 1 < best_g[successor_key]:
+                best_g[successor_key] = g + 1
+                parents[successor_key] = key
+                heappush(frontier, (g + 1 + weight * heuristic(successor_key, spec), g + 1, successor_key))
+
+    return None  # No solution
+
+
+def report_solution(solution, bound):
+    """
+    Default reporter of ara_star: print the length and bound of an improved solution.
+    """
+    print("solution with {} moves, at most {:.3f} times the optimum".format(len(solution) - 1, bound),
+          file=sys.stderr)
+
+
+def ara_star(state, time_limit=10.0, weight=3.0, weight_step=0.5, heuristic=key_heuristic,
+             report=report_solution):
+    """
+    Given an initial state, conduct anytime repairing A* (ARA*): find a first
+    solution with a large weight, then keep lowering the weight and reusing the
+    search effort to improve it until the solution is optimal or time runs out.
+    Every improved solution is passed to report with its suboptimality bound.
+    Returns the best solution found, or None.
+    """
+    deadline = time.time() + time_limit
+    spec = state.board.spec
+    start_key = get_state_key(state.board)
+    g = {start_key: 0}
+    parents = {start_key: None}
+    goal_key = None
+    best = None
+    best_bound = None
+
+    def priority(key):
+        return g[key] + weight * heuristic(key, spec)
+
+    frontier = [(priority(start_key), start_key)]
+    inconsistent = set()
+
+    while True:
+        # Improve the path: expand while some open state could still beat the goal
+        closed = set()
+        while frontier and time.time() < deadline:
+            f, key = frontier[0]
+            if goal_key is not None and g[goal_key] <= f:
+                break
+            heappop(frontier)
+            if key in closed or f > priority(key):  # Stale entry
+                continue
+            closed.add(key)
+            if key_is_goal(key, spec) and (goal_key is None or g[key] < g[goal_key]):
+                goal_key = key
+                continue
+            for successor_key in generate_successor_keys(key, spec):
+                if successor_key not in g or g[key] + 1 < g[successor_key]:
+                    g[successor_key] = g[key] + 1
+                    parents[successor_key] = key
+                    if successor_key in closed:
+                        inconsistent.add(successor_key)
+                    else:
+                        heappush(frontier, (priority(successor_key), successor_key))
+
+        if goal_key is None:
+            if not frontier:
+                return None  # No solution
+            if time.time() >= deadline:
+                return best
+            continue
+
+        # The optimum is at least the smallest g + h of any state still to be looked at
+        lower_bound = min([g[key] + heuristic(key, spec) for _, key in frontier] +
+                          [g[key] + heuristic(key, spec) for key in inconsistent] + [g[goal_key]])
+        bound = min(weight, g[goal_key] / lower_bound) if lower_bound > 0 else 1.0
+        if best is None or g[goal_key] < len(best) - 1 or bound < best_bound:
+            best = get_solution_from_keys(path_from_parents(parents, goal_key), spec)
+            best_bound = bound
+            report(best, bound)
+
+        if bound <= 1.0 or time.time() >= deadline:
+            return best
+
+        # Lower the weight and move the inconsistent states back into the open list
+        weight = max(1.0, weight - weight_step)
+        keys = {key for _, key in frontier} | inconsistent
+        inconsistent = set()
+        frontier = [(priority(key), key) for key in keys]
+        heapq.heapify(frontier)
+
+
+#====================================================================================
+# Hash-distributed A* (HDA*)
+#
+# Every worker process owns the states whose key hashes to it, with its own open
+# and closed lists. Work proceeds in rounds: each worker expands a batch of its
+# best states and sends every worker exactly one batch of successors, then takes
+# in the batches addressed to it. Between rounds the workers report the smallest
+# f value left in their open list and the best goal they have generated; the
+# search stops once no open state can lead to a cheaper goal, so the path is optimal.
+
+hda_batch_size = 256  # States a worker expands per round
+
+
+def hda_owner(key, workers):
+    """
+    Return the index of the worker that owns the key.
+    """
+    return ((key * 0x9E3779B97F4A7C15) >> 17) % workers
+
+
+def hda_worker(index, workers, start_key, spec, inboxes, connection):
+    """
+    The loop run by one HDA* worker process.
+
+    :param index: The index of this worker.
+    :param workers: The number of workers.
+    :param start_key: The key of the initial state.
+    :param spec: The rules of the puzzle.
+    :param inboxes: One queue per worker for the batches of successors.
+    :param connection: The pipe to the coordinating process.
+    """
+    frontier = []
+    best_g = {}  # key -> (g, parent key) of every state this worker has seen
+    goal_g = None
+    goal_key = None
+    expanded = 0
+
+    if hda_owner(start_key, workers) == index:
+        best_g[start_key] = (0, None)
+        heappush(frontier, (key_heuristic(start_key, spec), 0, start_key))
+
+    while True:
+        while frontier and frontier[0][1] > best_g[frontier[0][2]][0]:  # Drop stale entries
+            heappop(frontier)
+        connection.send((frontier[0][0] if frontier else None, goal_g, goal_key, expanded))
+
+        command = connection.recv()
+        if command[0] == 'stop':
+            break
+        bound = command[1]
+
+        outgoing = [[] for _ in range(workers)]
+        count = 0
+        while frontier and count < hda_batch_size:
+            f, g, key = heappop(frontier)
+            if g > best_g[key][0]:
+                continue
+            if bound is not None and f >= bound:  # Can not improve on the best goal found so far
+                heappush(frontier, (f, g, key))
+                break
+            count += 1
+            for successor_key in generate_successor_keys(key, spec):
+                outgoing[hda_owner(successor_key, workers)].append((successor_key, g + 1, key))
+        expanded += count
+
+        for destination in range(workers):
+            inboxes[destination].put(outgoing[destination])
+
+        for _ in range(workers):
+            for key, g, parent in inboxes[index].get():
+                if key in best_g and best_g[key][0] <= g:
+                    continue
+                best_g[key] = (g, parent)
+                if key_is_goal(key, spec):
+                    if goal_g is None or g < goal_g:
+                        goal_g, goal_key = g, key
+                else:
+                    heappush(frontier, (g + key_heuristic(key, spec), g, key))
+
+    # Answer parent lookups for the path reconstruction until told to exit
+    while True:
+        command = connection.recv()
+        if command[0] == 'exit':
+            break
+        connection.send(best_g[command[1]][1])
+
+
+def hda_star(state, workers=4, stats=None):
+    """
+    Given an initial state, conduct hash-distributed A* search with the given
+    number of worker processes and return an optimal solution, or None.
+
+    :param stats: If given, a dict that receives the number of rounds and expansions.
+    """
+    spec = state.board.spec
+    start_key = get_state_key(state.board)
+    if key_is_goal(start_key, spec):
+        return get_solution_from_keys([start_key], spec)
+
+    inboxes = [multiprocessing.Queue() for _ in range(workers)]
+    connections = []
+    processes = []
+    for index in range(workers):
+        parent_end, child_end = multiprocessing.Pipe()
+        process = multiprocessing.Process(target=hda_worker,
+                                          args=(index, workers, start_key, spec, inboxes, child_end))
+        process.start()
+        connections.append(parent_end)
+        processes.append(process)
+
+    rounds = 0
+    while True:
+        reports = [connection.recv() for connection in connections]
+        goals = [(report[1], report[2]) for report in reports if report[1] is not None]
+        incumbent = min(goals) if goals else None
+        open_f = [report[0] for report in reports if report[0] is not None]
+
+        # Stop when nothing is left to expand, or nothing left can beat the best goal
+        if not open_f or (incumbent is not None and incumbent[0] <= min(open_f)):
+            break
+        for connection in connections:
+            connection.send(('expand', incumbent[0] if incumbent is not None else None))
+        rounds += 1
+
+    for connection in connections:
+        connection.send(('stop',))
+
+    result = None
+    if incumbent is not None:
+        keys = []
+        key = incumbent[1]
+        while key is not None:
+            keys.append(key)
+            connection = connections[hda_owner(key, workers)]
+            connection.send(('parent', key))
+            key = connection.recv()
+        keys.reverse()
+        result = get_solution_from_keys(keys, spec)
+
+    for connection in connections:
+        connection.send(('exit',))
+    for process in processes:
+        process.join()
+
+    if stats is not None:
+        stats['rounds'] = rounds
+        stats['expanded'] = sum(report[3] for report in reports)
+    return result
+
+
+def benchmark_hda_star(state, worker_counts):
+    """
+    Time hda_star on the state for each number of workers and print the results.
+    """
+    for workers in worker_counts:
+        stats = {}
+        start = time.time()
+        result = hda_star(state, workers, stats)
+        elapsed = time.time() - start
+        length = len(result) - 1 if result is not None else None
+        print("{:>3} workers: {:8.2f}s  moves {}  expanded {}  rounds {}".format(
+            workers, elapsed, length, stats['expanded'], stats['rounds']))
+
+
+#====================================================================================
+# External-memory breadth-first search
+#
+# Each BFS layer is a file of fixed-width, big-endian packed keys in sorted order,
+# so byte order equals key order. Successors of a layer are collected in a buffer
+# bounded by the memory budget, sorted and written out as runs; the runs are then
+# merged, and duplicates are dropped against the current and the previous layer
+# (a move can be undone, so a successor lies in one of those or is new). Only the
+# current buffer and one record per open file live in RAM.
+
+external_bytes_per_state = 64  # Estimated RAM per buffered state (bytes object + list slot)
+
+
+def key_record_size(spec):
+    """
+    Return the number of bytes of a packed key of the puzzle.
+    """
+    return (spec.cell_count * spec.key_bits + 7) // 8
+
+
+def read_records(path, record_size):
+    """
+    Yield the records of a sorted layer or run file through a memory map.
+    """
+    if os.path.getsize(path) == 0:
+        return
+    with open(path, "rb") as record_file:
+        records = mmap.mmap(record_file.fileno(), 0, access=mmap.ACCESS_READ)
+        for offset in range(0, len(records), record_size):
+            yield records[offset:offset + record_size]
+        records.close()
+
+
+def write_run(path, records):
+    """
+    Write sorted records to a file.
+    """
+    with open(path, "wb") as run_file:
+        for record in records:
+            run_file.write(record)
+
+
+def unique_merge(*streams):
+    """
+    Merge sorted record streams, yielding every record once.
+    """
+    previous = None
+    for record in heapq.merge(*streams):
+        if record != previous:
+            yield record
+            previous = record
+
+
+def subtract_sorted(records, *excluded):
+    """
+    Yield the sorted records that are not in any of the sorted excluded streams.
+    """
+    excluded_records = unique_merge(*excluded)
+    current = next(excluded_records, None)
+    for record in records:
+        while current is not None and current < record:
+            current = next(excluded_records, None)
+        if record != current:
+            yield record
+
+
+def external_bfs(state, directory, memory_budget=64 * 1024 * 1024, stats=None):
+    """
+    Given an initial state, conduct breadth-first search with the layers kept on
+    disk in the directory, and return an optimal solution, or None.
+
+    :param memory_budget: The number of bytes the successor buffer may take.
+    :param stats: If given, a dict that receives the size of every layer.
+    """
+    spec = state.board.spec
+    record_size = key_record_size(spec)
+    buffer_limit = max(1, memory_budget // external_bytes_per_state)
+    os.makedirs(directory, exist_ok=True)
+
+    def layer_path(depth):
+        return os.path.join(directory, "layer_{}.bin".format(depth))
+
+    def to_record(key):
+        return key.to_bytes(record_size, "big")
+
+    start_key = get_state_key(state.board)
+    write_run(layer_path(0), [to_record(start_key)])
+    layer_sizes = [1]
+    goal_key = start_key if key_is_goal(start_key, spec) else None
+    depth = 0
+
+    while goal_key is None:
+        # Expand the layer into sorted runs that each fit in the memory budget
+        run_paths = []
+        buffer = []
+        for record in read_records(layer_path(depth), record_size):
+            for successor_key in generate_successor_keys(int.from_bytes(record, "big"), spec):
+                buffer.append(to_record(successor_key))
+            if len(buffer) >= buffer_limit:
+                run_paths.append(os.path.join(directory, "run_{}.bin".format(len(run_paths))))
+                write_run(run_paths[-1], sorted(set(buffer)))
+                buffer = []
+        if buffer:
+            run_paths.append(os.path.join(directory, "run_{}.bin".format(len(run_paths))))
+            write_run(run_paths[-1], sorted(set(buffer)))
+
+        # Merge the runs and remove the states of the current and the previous layer
+        previous_layers = [read_records(layer_path(depth), record_size)]
+        if depth > 0:
+            previous_layers.append(read_records(layer_path(depth - 1), record_size))
+        new_layer = subtract_sorted(unique_merge(*[read_records(path, record_size) for path in run_paths]),
+                                    *previous_layers)
+
+        size = 0
+        with open(layer_path(depth + 1), "wb") as layer_file:
+            for record in new_layer:
+                layer_file.write(record)
+                size += 1
+                if goal_key is None and key_is_goal(int.from_bytes(record, "big"), spec):
+                    goal_key = int.from_bytes(record, "big")
+        for path in run_paths:
+            os.remove(path)
+
+        layer_sizes.append(size)
+        depth += 1
+        if size == 0:  # The whole reachable space has been seen
+            break
+
+    result = None
+    if goal_key is not None:
+        # Scan back one layer at a time for a state that leads to the current one
+        keys = [goal_key]
+        for previous_depth in range(depth - 1, -1, -1):
+            for record in read_records(layer_path(previous_depth), record_size):
+                if keys[-1] in generate_successor_keys(int.from_bytes(record, "big"), spec):
+                    keys.append(int.from_bytes(record, "big"))
+                    break
+        keys.reverse()
+        result = get_solution_from_keys(keys, spec)
+
+    for layer in range(depth + 1):
+        os.remove(layer_path(layer))
+    if stats is not None:
+        stats['layers'] = layer_sizes
+    return result
+
+
+#====================================================================================
+# Vectorized breadth-first search
+#
+# A whole BFS layer is held as a sorted uint64 NumPy array of keys and expanded
+# with one set of array operations per possible move: a move of a kind from one
+# anchor to the next applies to every key whose slots at the anchor hold exactly
+# that piece and whose newly covered slots are empty. Needs keys of at most 64 bits.
+
+
+def vector_moves(spec):
+    """
+    Return the move tables of a puzzle as uint64 arrays:
+    (piece slots, piece field, newly covered slots, field after the move).
+    """
+    if spec.cell_count * spec.key_bits > 64:
+        raise ValueError("The keys of this puzzle do not fit in 64 bits")
+
+    def slots(mask):
+        result = 0
+        for cell in range(spec.cell_count):
+            if (mask >> cell) & 1:
+                result |= spec.key_mask << (spec.key_bits * cell)
+        return result
+
+    piece_slots, piece_fields, covered_slots, new_fields = [], [], [], []
+    for index in range(len(spec.kinds)):
+        for anchor, moves in spec.moves[index].items():
+            for target, newly_covered, _ in moves:
+                piece_slots.append(slots(spec.masks[index][anchor]))
+                piece_fields.append(spec.fields[index][anchor])
+                covered_slots.append(slots(newly_covered))
+                new_fields.append(spec.fields[index][target])
+
+    return tuple(np.array(values, dtype=np.uint64) for values in (piece_slots, piece_fields, covered_slots, new_fields))
+
+
+def expand_layer(keys, moves):
+    """
+    Return the sorted, duplicate free successor keys of an array of keys.
+    """
+    piece_slots, piece_fields, covered_slots, new_fields = moves
+    successors = []
+    for move in range(len(piece_slots)):
+        movable = ((keys & piece_slots[move]) == piece_fields[move]) & ((keys & covered_slots[move]) == 0)
+        if movable.any():
+            successors.append((keys[movable] & ~piece_slots[move]) | new_fields[move])
+
+    if not successors:
+        return np.empty(0, dtype=np.uint64)
+    return np.unique(np.concatenate(successors))
+
+
+def sorted_contains(sorted_keys, keys):
+    """
+    Return a boolean array telling which keys are in the sorted array.
+    """
+    if len(sorted_keys) == 0:
+        return np.zeros(len(keys), dtype=bool)
+    positions = np.searchsorted(sorted_keys, keys).clip(max=len(sorted_keys) - 1)
+    return sorted_keys[positions] == keys
+
+
+def numpy_bfs(state, stop_at_goal=True, stats=None):
+    """
+    Given an initial state, conduct vectorized breadth-first search and return an
+    optimal solution, or None. With stop_at_goal False the whole reachable space
+    is enumerated first.
+
+    :param stats: If given, a dict that receives the layer sizes and states per second.
+    """
+    if np is None:
+        raise RuntimeError("The vectorized BFS needs NumPy")
+
+    spec = state.board.spec
+    moves = vector_moves(spec)
+    goal_slots = np.uint64(spec.goal_slots)
+    goal_field = np.uint64(spec.goal_field)
+
+    start = time.time()
+    layer = np.array([get_state_key(state.board)], dtype=np.uint64)
+    layers = [layer]
+    visited = layer
+    goal_key = None
+    while len(layer):
+        goals = layer[(layer & goal_slots) == goal_field]
+        if len(goals) and goal_key is None:
+            goal_key = int(goals[0])
+            goal_depth = len(layers) - 1
+            if stop_at_goal:
+                break
+
+        successors = expand_layer(layer, moves)
+        layer = successors[~sorted_contains(visited, successors)]
+        visited = np.union1d(visited, layer)
+        if len(layer):
+            layers.append(layer)
+
+    if stats is not None:
+        stats['layers'] = [len(keys) for keys in layers]
+        stats['states_per_second'] = len(visited) / max(time.time() - start, 1e-9)
+        stats['reachable'] = len(visited)
+
+    if goal_key is None:
+        return None
+
+    # Walk back through the stored layers; every move can be undone
+    keys = [goal_key]
+    for depth in range(goal_depth - 1, -1, -1):
+        for predecessor_key in generate_successor_keys(keys[-1], spec):
+            if sorted_contains(layers[depth], np.array([predecessor_key], dtype=np.uint64))[0]:
+                keys.append(predecessor_key)
+                break
+    keys.reverse()
+
+    return get_solution_from_keys(keys, spec)
+
+
+#====================================================================================
+# Breadth-first frontier search
+#
+# Only the layer being expanded and the layer being generated are kept, as dicts
+# of packed keys. Every move has an operator number (from its kind, anchor cell and
+# direction) and each state carries the bits of the operators that lead back to
+# states already generated, so its parents are never regenerated and no closed set
+# is needed. (Every move changes the parity of the sum of the anchor coordinates, so
+# no move joins two states of one layer.) The path is rebuilt by divide and
+# conquer: once the depth of a target is known, a search that records each
+# state's ancestor in the middle layer (its relay) finds a midpoint of a
+# shortest path, and both halves are solved the same way.
+
+
+def generate_successor_moves(key, spec=classic_spec):
+    """
+    Given a key, yield (successor key, operator, inverse operator) for each move.
+    An operator is (kind index * cells + anchor cell) * 4 + direction: a custom shape
+    may leave its anchor cell empty for a piece of another kind, so the anchor alone
+    does not tell pieces apart. Direction numbers are 0 left, 1 right, 2 up, 3 down,
+    so d ^ 1 is the opposite.
+    """
+    pieces, occupied = spec.decode(key)
+    directions = {-1: 0, 1: 1, -spec.width: 2, spec.width: 3}
+    for index, anchor in pieces:
+        base = index * spec.cell_count
+        for target, newly_covered, delta in spec.moves[index][anchor]:
+            if not occupied & newly_covered:
+                direction = directions[target - anchor]
+                yield key + delta, (base + anchor) * 4 + direction, (base + target) * 4 + (direction ^ 1)
+
+
+def frontier_layers(start_key, is_target, spec, max_depth=None, relay_depth=None, stats=None):
+    """
+    Breadth-first frontier search from a key for a state passing is_target.
+
+    :param max_depth: The deepest layer to search, or None for no limit.
+    :param relay_depth: The layer whose states are recorded as the relays of their descendants.
+    :return: (target key, its depth, its relay) or None.
+    """
+    layer = {start_key: (0, start_key if relay_depth == 0 else None)}
+    depth = 0
+    while layer:
+        if stats is not None:
+            stats['peak_frontier'] = max(stats.get('peak_frontier', 0), len(layer))
+        for key, (_, relay) in layer.items():
+            if is_target(key):
+                return key, depth, relay
+        if depth == max_depth:
+            break
+
+        next_layer = {}
+        for key, (used, relay) in layer.items():
+            for successor_key, operator, inverse in generate_successor_moves(key, spec):
+                if (used >> operator) & 1:  # Leads back to a parent
+                    continue
+                entry = next_layer.get(successor_key)
+                if entry is None:
+                    next_layer[successor_key] = (1 << inverse, successor_key if depth + 1 == relay_depth else relay)
+                else:
+                    next_layer[successor_key] = (entry[0] | (1 << inverse), entry[1])
+        if stats is not None:
+            stats['expanded'] = stats.get('expanded', 0) + len(layer)
+            stats['peak_frontier'] = max(stats['peak_frontier'], len(layer) + len(next_layer))
+        layer = next_layer
+        depth += 1
+
+    return None
+
+
+def frontier_path(start_key, target_key, depth, spec, stats=None):
+    """
+    Return the keys of a shortest path of the given length between two keys,
+    found by divide and conquer over relay states.
+    """
+    if depth <= 1:
+        return [start_key] if depth == 0 else [start_key, target_key]
+
+    middle = depth // 2
+    _, _, relay = frontier_layers(start_key, lambda key: key == target_key, spec, depth, middle, stats)
+    if stats is not None:
+        stats['passes'] = stats.get('passes', 0) + 1
+
+    return (frontier_path(start_key, relay, middle, spec, stats)[:-1]
+            + frontier_path(relay, target_key, depth - middle, spec, stats))
+
+
+def frontier_search(state, stats=None):
+    """
+    Given an initial state, conduct breadth-first frontier search and return an
+    optimal solution, or None.
+
+    :param stats: If given, a dict that receives the number of states expanded,
+        the largest number of states held at once and the number of searches.
+    """
+    spec = state.board.spec
+    start_key = get_state_key(state.board)
+    found = frontier_layers(start_key, lambda key: key_is_goal(key, spec), spec, stats=stats)
+    if stats is not None:
+        stats['passes'] = stats.get('passes', 0) + 1
+    if found is None:
+        return None
+
+    goal_key, depth, _ = found
+    return get_solution_from_keys(frontier_path(start_key, goal_key, depth, spec, stats), spec)
+
+
+#====================================================================================
+# Solvability precheck
+#
+# An unsolvable layout makes dfs and astar exhaust its whole reachable space. The
+# precheck answers most inputs without searching:
+#   - invariants: a goal layout, a layout without legal moves, and separators. A
+#     piece with a row covering the whole board width can never be passed from
+#     above or below (nor a full column from the sides), so the goal piece must
+#     reach the goal without crossing one. There is no parity invariant to use:
+#     pieces of a kind are interchangeable and moves are reversible slides.
+#   - a reachability table per piece multiset: every layout of the multiset is
+#     enumerated once, labelled with the ID of its connected component, and each
+#     component marked solvable if it contains a goal layout. Tables are kept in
+#     memory and, with a cache directory, in one file per multiset: a header, a
+#     solvable byte per component and sorted (key, component) records, looked up
+#     by binary search through a memory map. An empty file marks a multiset with
+#     too many layouts.
+
+precheck_state_limit = 500000  # Multisets with more layouts are not tabulated
+reachability_magic = b'HRDR'
+reachability_header = struct.Struct('>4sBII')  # magic, key bytes, layouts, components
+reachability_tables = {}  # signature -> ReachabilityTable, or None if too large
+
+
+class ReachabilityTable:
+    """
+    The component ID and solvability of every layout of one piece multiset.
+    """
+
+    def __init__(self, buffer):
+        """
+        :param buffer: The table in the file format, as bytes or a memory map.
+        """
+        magic, self.key_size, self.count, self.components = reachability_header.unpack_from(buffer, 0)
+        if magic != reachability_magic:
+            raise ValueError("Not a reachability table")
+        self.buffer = buffer
+        self.solvable_offset = reachability_header.size
+        self.records_offset = self.solvable_offset + self.components
+        self.record_size = self.key_size + 4
+
+    def component(self, key):
+        """
+        Return the component ID of a key, or None if the key is not in the table.
+        """
+        target = key.to_bytes(self.key_size, 'big')
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            offset = self.records_offset + middle * self.record_size
+            record_key = self.buffer[offset:offset + self.key_size]
+            if record_key == target:
+                return int.from_bytes(self.buffer[offset + self.key_size:offset + self.record_size], 'big')
+            if record_key < target:
+                low = middle + 1
+            else:
+                high = middle
+
+        return None
+
+    def solvable(self, key):
+        """
+        Return True if the goal can be reached from a key, False if not, None if unknown.
+        """
+        component = self.component(key)
+        if component is None:
+            return None
+        return bool(self.buffer[self.solvable_offset + component])
+
+
+def layout_counts(key, spec):
+    """
+    Return the number of pieces of each kind in a key.
+    """
+    counts = [0] * len(spec.kinds)
+    for index, _ in spec.decode(key)[0]:
+        counts[index] += 1
+
+    return tuple(counts)
+
+
+def enumerate_layouts(spec, counts, limit=precheck_state_limit):
+    """
+    Return the keys of every layout with the given number of pieces of each kind,
+    or None if there are more than limit of them.
+
+    Cells are filled in order: the first free cell is either left empty or covered
+    by the first cell of a piece, so each layout is generated exactly once.
+    """
+    width = spec.width
+    remaining = list(counts)
+    empties = spec.cell_count - sum(count * len(kind.cells) for count, kind in zip(counts, spec.kinds))
+    if empties < 0:
+        return []
+    keys = []
+
+    def place(cell, filled, key, empties):
+        while cell < spec.cell_count and (filled >> cell) & 1:
+            cell += 1
+        if cell == spec.cell_count:
+            keys.append(key)
+            return len(keys) <= limit
+        if empties and not place(cell + 1, filled | (1 << cell), key, empties - 1):
+            return False
+        for index, kind in enumerate(spec.kinds):
+            if not remaining[index]:
+                continue
+            dx, dy = kind.cells[0]
+            x, y = cell % width - dx, cell // width - dy
+            if x < 0 or x + kind.width > width or y + kind.height > spec.height:
+                continue
+            anchor = y * width + x
+            if spec.masks[index][anchor] & filled:
+                continue
+            remaining[index] -= 1
+            complete = place(cell + 1, filled | spec.masks[index][anchor], key | spec.fields[index][anchor], empties)
+            remaining[index] += 1
+            if not complete:
+                return False
+        return True
+
+    return keys if place(0, 0, 0, empties) else None
+
+
+def build_reachability_table(spec, counts, limit=precheck_state_limit):
+    """
+    Enumerate the layouts of a piece multiset, label their connected components
+    and return the table in the file format, or None if there are too many layouts.
+    """
+    keys = enumerate_layouts(spec, counts, limit)
+    if keys is None:
+        return None
+
+    component = {}
+    solvable = bytearray()
+    for start_key in keys:
+        if start_key in component:
+            continue
+        label = len(solvable)
+        component[start_key] = label
+        goal_found = False
+        frontier = [start_key]
+        while frontier:
+            key = frontier.pop()
+            goal_found = goal_found or key_is_goal(key, spec)
+            for successor_key in generate_successor_keys(key, spec):
+                if successor_key not in component:
+                    component[successor_key] = label
+                    frontier.append(successor_key)
+        solvable.append(goal_found)
+
+    key_size = key_record_size(spec)
+    records = bytearray(reachability_header.pack(reachability_magic, key_size, len(keys), len(solvable)))
+    records += solvable
+    for key in sorted(component):
+        records += key.to_bytes(key_size, 'big') + component[key].to_bytes(4, 'big')
+
+    return bytes(records)
+
+
+def spec_signature(spec):
+    """
+    Return a name that identifies a puzzle (board, piece kinds and goal).
+    """
+    description = repr((spec.width, spec.height, spec.goal_x, spec.goal_y,
+                        [(kind.cells, kind.glyphs, kind.is_goal) for kind in spec.kinds]))
+    return hashlib.sha1(description.encode()).hexdigest()[:20]
+
+
+def reachability_signature(spec, counts):
+    """
+    Return a name that identifies a piece multiset on a puzzle.
+    """
+    description = repr((spec_signature(spec), counts))
+    return hashlib.sha1(description.encode()).hexdigest()[:20]
+
+
+def reachability_table(spec, counts, cache_dir=None, limit=precheck_state_limit):
+    """
+    Return the reachability table of a piece multiset, or None if it has too many
+    layouts. Tables are built once and kept in memory and, if cache_dir is given, on disk.
+    """
+    signature = reachability_signature(spec, counts)
+    if signature in reachability_tables:
+        return reachability_tables[signature]
+
+    path = os.path.join(cache_dir, 'reach-{}.bin'.format(signature)) if cache_dir else None
+    if path is None or not os.path.exists(path):
+        buffer = build_reachability_table(spec, counts, limit)
+        if path is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            temporary_path = path + '.tmp{}'.format(os.getpid())
+            with open(temporary_path, "wb") as table_file:
+                table_file.write(buffer if buffer is not None else b'')
+            os.replace(temporary_path, path)  # Readers never see a partial file
+    if path is not None:
+        buffer = None
+        if os.path.getsize(path):
+            with open(path, "rb") as table_file:
+                buffer = mmap.mmap(table_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    table = ReachabilityTable(buffer) if buffer is not None else None
+    reachability_tables[signature] = table
+
+    return table
+
+
+def separators_block_goal(key, spec):
+    """
+    Return True if pieces spanning the whole board width (or height) leave the
+    goal piece no way to reach the goal.
+    """
+    pieces, _ = spec.decode(key)
+    goal_kind = spec.kinds[spec.goal_kind]
+    goal_anchor = [anchor for index, anchor in pieces if index == spec.goal_kind][0]
+    goal_x, goal_y = goal_anchor % spec.width, goal_anchor // spec.width
+
+    above = below = left = right = 0
+    for index, anchor in pieces:
+        if index == spec.goal_kind:
+            continue
+        kind = spec.kinds[index]
+        x, y = anchor % spec.width, anchor // spec.width
+        for dy in range(kind.height):
+            if sum(1 for _, cell_dy in kind.cells if cell_dy == dy) == spec.width:
+                if y + dy < goal_y:
+                    above += 1
+                else:
+                    below += 1
+        for dx in range(kind.width):
+            if sum(1 for cell_dx, _ in kind.cells if cell_dx == dx) == spec.height:
+                if x + dx < goal_x:
+                    left += 1
+                else:
+                    right += 1
+
+    # Separated rows and columns keep their order, so the goal must fit between them
+    return (spec.goal_y < above or spec.goal_y + goal_kind.height + below > spec.height
+            or spec.goal_x < left or spec.goal_x + goal_kind.width + right > spec.width)
+
+
+def solvability_precheck(board, use_table=False, cache_dir=None):
+    """
+    Decide quickly whether the goal can be reached from a board, without searching.
+
+    :param use_table: If True, look the board up in the reachability table of its
+        piece multiset, building the table if needed.
+    :param cache_dir: The directory the reachability tables are kept in, if any.
+    :return: (True, False or None if undecided, the reason)
+    """
+    spec = board.spec
+    key = get_state_key(board)
+    if key_is_goal(key, spec):
+        return True, "the goal piece is at the goal"
+    if not generate_successor_keys(key, spec):
+        return False, "no piece can move"
+    if separators_block_goal(key, spec):
+        return False, "a piece spanning the board separates the goal piece from the goal"
+
+    if use_table:
+        table = reachability_table(spec, layout_counts(key, spec), cache_dir)
+        if table is not None:
+            solvable = table.solvable(key)
+            if solvable is not None:
+                return solvable, "component {} of {} in the reachability table".format(
+                    table.component(key), table.components)
+
+    return None, "no invariant applies"
+
+
+#====================================================================================
+# Solution cache
+#
+# Solutions are cached per puzzle, algorithm (with the parameters that change its
+# result, see cache_algo_name) and canonical layout: the smaller of
+# a key and the key of its left-right mirror image (when the puzzle is symmetric),
+# so mirror-equivalent inputs share one entry. A solution is stored as a compact
+# move sequence, one byte per move giving the index of the next key among the
+# successors of the current one, and re-expanded to boards when read. A missing
+# solution is cached too.
+#
+# The in-memory tier is an LRU dictionary. The optional on-disk tier is a single
+# file: a header, an open-addressing table of (digest, offset, length) slots that
+# is memory-mapped, and the move sequences appended after it. The table is
+# rewritten with twice the slots when it gets three quarters full. Several
+# processes may share the file: an flock on a lock file beside it is held shared
+# while probing and exclusive while inserting, and a process that finds the file
+# replaced by another one's rewrite maps it again.
+
+cache_header = struct.Struct('>4sII')  # magic, slots, used slots
+cache_slot = struct.Struct('>16sQI')  # digest of the entry name, data offset, length
+cache_magic = b'HRC2'
+cache_no_solution = 0xffffffff  # The length field of an unsolvable entry
+
+
+def mirror_kinds(spec):
+    """
+    Return the index of the mirror image of each kind of piece, or None if the
+    mirror image of a layout is not an equivalent layout of the same puzzle.
+    """
+    goal_kind = spec.kinds[spec.goal_kind]
+    if spec.goal_x != spec.width - spec.goal_x - goal_kind.width:
+        return None
+
+    shapes = [sorted(kind.cells) for kind in spec.kinds]
+    mirrors = []
+    for kind in spec.kinds:
+        cells = sorted((kind.width - 1 - dx, dy) for dx, dy in kind.cells)
+        matches = [index for index, shape in enumerate(shapes)
+                   if shape == cells and spec.kinds[index].is_goal == kind.is_goal]
+        if not matches:
+            return None
+        mirrors.append(matches[0])
+
+    return mirrors
+
+
+def mirror_key(key, spec, mirrors):
+    """
+    Return the key of the left-right mirror image of a layout.
+    """
+    mirrored = 0
+    for index, anchor in spec.decode(key)[0]:
+        kind = spec.kinds[index]
+        x, y = anchor % spec.width, anchor // spec.width
+        mirrored |= spec.fields[mirrors[index]][y * spec.width + spec.width - x - kind.width]
+
+    return mirrored
+
+
+def canonical_key(key, spec):
+    """
+    Return the canonical key of a layout and the mirror kinds if the canonical
+    key is the mirror image (else None).
+    """
+    mirrors = mirror_kinds(spec)
+    if mirrors is not None:
+        mirrored = mirror_key(key, spec, mirrors)
+        if mirrored < key:
+            return mirrored, mirrors
+
+    return key, None
+
+
+def encode_moves(keys, spec):
+    """
+    Encode a sequence of keys as the index of each key among the successors of the one before.
+    """
+    return bytes(generate_successor_keys(key, spec).index(next_key) for key, next_key in zip(keys, keys[1:]))
+
+
+def decode_moves(key, moves, spec):
+    """
+    Replay an encoded move sequence from a key and return the sequence of keys.
+    """
+    keys = [key]
+    for move in moves:
+        keys.append(generate_successor_keys(keys[-1], spec)[move])
+
+    return keys
+
+
+def cache_algo_name(algo, weight=2.0, depth_bound=None, iterative=True):
+    """
+    Return the name the solutions of an algorithm are cached under: the algorithm
+    and the parameters that change its result. arastar returns whatever it found
+    within its time limit, so its results are not cached and the name is None.
+    """
+    if algo == 'arastar':
+        return None
+    if algo == 'wastar':
+        return 'wastar weight={}'.format(float(weight))
+    if algo == 'gdfs':
+        return 'gdfs depth_bound={} iterative={}'.format(depth_bound, iterative)
+    return algo
+
+
+class SolutionCache:
+    """
+    A cache of solutions keyed by canonical layout and algorithm, with an LRU
+    tier in memory and an optional tier on disk.
+    """
+
+    def __init__(self, capacity=1024, path=None, slots=4096):
+        """
+        :param capacity: The number of solutions kept in memory.
+        :param path: The file of the on-disk tier, or None for memory only.
+        :param slots: The number of slots of a new file.
+        """
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.metrics = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+        self.path = path
+        self.cache_file = None
+        self.lock_file = None
+        if path is not None:
+            self.lock_file = open(path + '.lock', "a")
+            self.lock(exclusive=True)
+            try:
+                if not os.path.exists(path) or os.path.getsize(path) == 0:
+                    with open(path, "wb") as cache_file:
+                        cache_file.write(cache_header.pack(cache_magic, slots, 0) + bytes(cache_slot.size * slots))
+                self.open_file()
+            finally:
+                self.unlock()
+
+    def lock(self, exclusive=False):
+        """
+        Lock the on-disk tier against other processes, shared or exclusive, and map
+        the file again if another process has rewritten it.
+        """
+        if fcntl is not None:
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        if self.cache_file is not None and os.stat(self.path).st_ino != os.fstat(self.cache_file.fileno()).st_ino:
+            self.close_file()
+            self.open_file()
+
+    def unlock(self):
+        if fcntl is not None:
+            fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+
+    def open_file(self):
+        """
+        Open the on-disk tier and map its slot table.
+        """
+        self.cache_file = open(self.path, "r+b")
+        magic, self.slots, _ = cache_header.unpack(self.cache_file.read(cache_header.size))
+        if magic != cache_magic:
+            raise ValueError("{} is not a solution cache".format(self.path))
+        self.table_size = cache_header.size + cache_slot.size * self.slots
+        self.table = mmap.mmap(self.cache_file.fileno(), self.table_size)
+
+    def close_file(self):
+        if self.cache_file is not None:
+            self.table.close()
+            self.cache_file.close()
+            self.cache_file = None
+
+    def close(self):
+        self.close_file()
+        if self.lock_file is not None:
+            self.lock_file.close()
+            self.lock_file = None
+
+    @property
+    def used(self):
+        """
+        The number of used slots, kept in the header so every process sees it.
+        """
+        return cache_header.unpack_from(self.table)[2]
+
+    def read_slot(self, slot):
+        return cache_slot.unpack_from(self.table, cache_header.size + slot * cache_slot.size)
+
+    def find_slot(self, digest):
+        """
+        Return the slot holding a digest, or the empty slot where it would go.
+        """
+        slot = int.from_bytes(digest[:8], 'big') % self.slots
+        while True:
+            slot_digest = self.read_slot(slot)[0]
+            if slot_digest == digest or slot_digest == bytes(16):
+                return slot
+            slot = (slot + 1) % self.slots
+
+    def disk_get(self, digest):
+        slot_digest, offset, length = self.read_slot(self.find_slot(digest))
+        if slot_digest != digest:
+            return False, None
+        if length == cache_no_solution:
+            return True, None
+        self.cache_file.seek(offset)
+        return True, self.cache_file.read(length)
+
+    def disk_put(self, digest, moves):
+        slot = self.find_slot(digest)
+        if self.read_slot(slot)[0] == digest:
+            return
+        self.cache_file.seek(0, os.SEEK_END)
+        offset = self.cache_file.tell()
+        if moves is not None:
+            self.cache_file.write(moves)
+            self.cache_file.flush()
+        cache_slot.pack_into(self.table, cache_header.size + slot * cache_slot.size, digest, offset,
+                             len(moves) if moves is not None else cache_no_solution)
+        cache_header.pack_into(self.table, 0, cache_magic, self.slots, self.used + 1)
+        if self.used * 4 >= self.slots * 3:
+            self.grow()
+
+    def grow(self):
+        """
+        Rewrite the file with twice as many slots. Called with the exclusive lock held.
+        """
+        entries = []
+        for slot in range(self.slots):
+            digest, offset, length = self.read_slot(slot)
+            if digest != bytes(16):
+                entries.append((digest, self.disk_get(digest)[1]))
+        slots = self.slots * 2
+        self.close_file()
+        temporary_path = self.path + '.tmp{}'.format(os.getpid())
+        with open(temporary_path, "wb") as cache_file:
+            cache_file.write(cache_header.pack(cache_magic, slots, 0) + bytes(cache_slot.size * slots))
+        os.replace(temporary_path, self.path)
+        self.open_file()
+        for digest, moves in entries:
+            self.disk_put(digest, moves)
+
+    def get(self, board, algo):
+        """
+        Return (True, the cached solution or None if it has none) for a board and
+        algorithm, or (False, None) on a miss. The algorithm is named as by
+        cache_algo_name, so runs with different parameters do not share entries.
+        """
+        spec = board.spec
+        key = get_state_key(board)
+        canonical, mirrors = canonical_key(key, spec)
+        name = (spec_signature(spec), algo, canonical)
+
+        found = False
+        if name in self.entries:
+            self.entries.move_to_end(name)
+            moves = self.entries[name]
+            found = True
+            self.metrics['memory_hits'] += 1
+        elif self.cache_file is not None:
+            self.lock()
+            try:
+                found, moves = self.disk_get(self.digest(name))
+            finally:
+                self.unlock()
+            if found:
+                self.metrics['disk_hits'] += 1
+                self.remember(name, moves)
+        if not found:
+            self.metrics['misses'] += 1
+            return False, None
+        if moves is None:
+            return True, None
+
+        keys = decode_moves(canonical, moves, spec)
+        if mirrors is not None:
+            keys = [mirror_key(step, spec, mirrors) for step in keys]
+        return True, get_solution_from_keys(keys, spec)
+
+    def put(self, board, algo, solution):
+        """
+        Store the solution (a sequence of states, or None) found for a board by an algorithm.
+        """
+        spec = board.spec
+        key = get_state_key(board)
+        canonical, mirrors = canonical_key(key, spec)
+        name = (spec_signature(spec), algo, canonical)
+
+        moves = None
+        if solution is not None:
+            keys = [get_state_key(state.board) for state in solution]
+            if mirrors is not None:
+                keys = [mirror_key(step, spec, mirrors) for step in keys]
+            moves = encode_moves(keys, spec)
+        self.remember(name, moves)
+        if self.cache_file is not None:
+            self.lock(exclusive=True)
+            try:
+                self.disk_put(self.digest(name), moves)
+            finally:
+                self.unlock()
+        self.metrics['stores'] += 1
+
+    def remember(self, name, moves):
+        self.entries[name] = moves
+        self.entries.move_to_end(name)
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+            self.metrics['evictions'] += 1
+
+    def digest(self, name):
+        return hashlib.blake2b(repr(name).encode(), digest_size=16).digest()
+
+    def stats(self):
+        lookups = self.metrics['memory_hits'] + self.metrics['disk_hits'] + self.metrics['misses']
+        stats = dict(self.metrics)
+        stats['hit_rate'] = (lookups - self.metrics['misses']) / lookups if lookups else 0.0
+        stats['memory_entries'] = len(self.entries)
+        if self.cache_file is not None:
+            stats['disk_entries'] = self.used
+        return stats
+
+
+def solve_with_daemon(path, filename, algo):
+    """
+    Ask a solver daemon (solver_daemon.py) to solve the puzzle in a file with an
+    algorithm at its default parameters.
+
+    :param path: The Unix socket of the daemon.
+    :param filename: The puzzle file.
+    :param algo: The searching algorithm, one the daemon serves.
+    :return: Whether the daemon answered, and if so the solution as a list of states or None.
+    :rtype: Tuple[bool, Optional[List[State]]]
+    """
+    import solver_daemon
+    with open(filename) as puzzle_file:
+        puzzle = puzzle_file.read()
+    response = solver_daemon.send_request({'type': 'hrd', 'puzzle': puzzle, 'algo': algo}, path)
+    if response is None or not response.get('ok'):
+        return False, None
+    if response['solution'] is None:
+        return True, None
+    return True, [State(board_from_lines(rows), 0, depth, None) for depth, rows in enumerate(response['solution'])]
+
+
 if __name__ == "__main__":
 
     parser = argparse.ArgumentParser()
@@ -756,8 +2214,118 @@ if __name__ == "__main__":
         "--algo",
         type=str,
         required=True,
-        choices=['astar', 'dfs'],
-        help="The searching algorithm."
+        choices=['astar', 'dfs', 'gdfs', 'hdastar', 'extbfs', 'npbfs', 'frontier', 'wastar', 'arastar'],
+        help="The searching algorithm. npbfs needs NumPy and packed keys of at most 64 bits (the cells "
+             "of the board times the bits per cell, e.g. 4x5 boards but not 6x6 ones); other puzzles "
+             "are solved with frontier instead. gdfs finds a shortest solution by default; with "
+             "--no-iterative it is much faster but its solutions can be many times longer."
+    )
+    parser.add_argument(
+        "--depth-bound",
+        type=int,
+        help="The largest solution length gdfs looks for."
+    )
+    parser.add_argument(
+        "--iterative",
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help="Make gdfs raise its bound in rounds, as IDA* does, so it finds a shortest solution (the default). "
+             "--no-iterative searches once, expanding every state at most once: on the classic puzzle it takes "
+             "a fraction of a second instead of about 20, but finds a solution of thousands of moves instead of 117."
+    )
+    parser.add_argument(
+        "--weight",
+        type=float,
+        default=2.0,
+        help="The heuristic weight of wastar, or the starting weight of arastar."
+    )
+    parser.add_argument(
+        "--time-limit",
+        type=float,
+        default=10.0,
+        help="The number of seconds arastar may spend improving its solution."
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=4,
+        help="The number of worker processes for hdastar."
+    )
+    parser.add_argument(
+        "--benchmark-workers",
+        type=str,
+        help="Comma separated worker counts to time hdastar with, e.g. 1,2,4,8,16."
+    )
+    parser.add_argument(
+        "--workdir",
+        type=str,
+        help="The directory for the layer files of extbfs (a temporary one by default)."
+    )
+    parser.add_argument(
+        "--memory-budget",
+        type=int,
+        default=64,
+        help="The memory budget of extbfs in megabytes."
+    )
+    parser.add_argument(
+        "--visited",
+        type=str,
+        default="string",
+        choices=['string', 'int', 'bloom'],
+        help="The visited set of dfs and astar: grid strings, packed keys, or an approximate Bloom filter."
+    )
+    parser.add_argument(
+        "--expected-states",
+        type=int,
+        default=1000000,
+        help="The number of states the Bloom filter is sized for."
+    )
+    parser.add_argument(
+        "--fp-rate",
+        type=float,
+        default=0.01,
+        help="The false positive rate of the Bloom filter at the expected number of states."
+    )
+    parser.add_argument(
+        "--benchmark-visited",
+        action="store_true",
+        help="Time dfs or astar (per --algo) with each visited set backend."
+    )
+    parser.add_argument(
+        "--precheck",
+        type=str,
+        default="invariants",
+        choices=['none', 'invariants', 'table'],
+        help="Reject unsolvable inputs before searching: by invariants only, or also by reachability tables."
+    )
+    parser.add_argument(
+        "--precheck-cache",
+        type=str,
+        help="The directory the reachability tables of --precheck table are kept in."
+    )
+    parser.add_argument(
+        "--cache-file",
+        type=str,
+        help="The file of the on-disk solution cache; solutions are looked up there before searching "
+             "(not used by arastar, nor by dfs and astar with --visited bloom)."
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=1024,
+        help="The number of solutions the cache keeps in memory."
+    )
+    parser.add_argument(
+        "--cache-stats",
+        action="store_true",
+        help="Print the hit and miss counts of the solution cache."
+    )
+    parser.add_argument(
+        "--daemon",
+        type=str,
+        metavar="SOCKET",
+        help="Ask the solver daemon on this Unix socket first; the puzzle is solved here if no daemon answers. "
+             "Only used for the algorithms the daemon serves, at their default parameters."
     )
     args = parser.parse_args()
 
@@ -767,32 +2335,75 @@ if __name__ == "__main__":
     init_board = read_from_file(args_dict["inputfile"])
     init_state = State(board=init_board, f=0, depth=0, parent=None)
 
-    # Create and write to the output file
-    output_file = open(args_dict["outputfile"], "w")
-    if args_dict["algo"] == "dfs":
-        result = dfs(init_state)
-        if result is not None:
-            for state in result:
-                for line in state.board.grid:
-                    for char in line:
-                        output_file.write(char)
-                    output_file.write("\n")
-                output_file.write("\n")
-        else:
-            output_file.write("\n")
-    elif args_dict["algo"] == "astar":
-        result = astar(init_state)
-        if result is not None:
-            for state in result:
-                for line in state.board.grid:
-                    for char in line:
-                        output_file.write(char)
-                    output_file.write("\n")
-                output_file.write("\n")
+    if args_dict["benchmark_workers"]:
+        benchmark_hda_star(init_state, [int(count) for count in args_dict["benchmark_workers"].split(",")])
+        sys.exit(0)
+    if args_dict["benchmark_visited"]:
+        benchmark_visited_sets(init_state, args_dict["algo"], args_dict["expected_states"], args_dict["fp_rate"])
+        sys.exit(0)
+    visited = make_visited_set(args_dict["visited"], args_dict["expected_states"], args_dict["fp_rate"])
+
+    solvable = None
+    if args_dict["precheck"] != "none":
+        solvable, reason = solvability_precheck(init_board, args_dict["precheck"] == "table",
+                                                args_dict["precheck_cache"])
+        if solvable is False:
+            print("unsolvable: {}".format(reason), file=sys.stderr)
+
+    cache = None
+    cached = False
+    answered = False
+    result = None
+    cache_name = cache_algo_name(args_dict["algo"], args_dict["weight"], args_dict["depth_bound"],
+                                 args_dict["iterative"])
+    if not visited.exact and args_dict["algo"] in ["dfs", "astar"]:
+        cache_name = None  # A Bloom filter may miss solutions, so its results are not kept
+    if args_dict["cache_file"] and cache_name is not None:
+        cache = SolutionCache(args_dict["cache_size"], args_dict["cache_file"])
+        if solvable is not False:
+            cached, result = cache.get(init_board, cache_name)
+
+    if args_dict["daemon"] and solvable is not False and not cached and visited.exact and \
+            args_dict["algo"] in ['astar', 'dfs', 'gdfs', 'frontier', 'npbfs', 'wastar'] and \
+            cache_name == cache_algo_name(args_dict["algo"]):
+        answered, result = solve_with_daemon(args_dict["daemon"], args_dict["inputfile"], args_dict["algo"])
+
+    if solvable is not False and not cached and not answered:
+        if args_dict["algo"] == "dfs":
+            result = dfs(init_state, visited)
+        elif args_dict["algo"] == "hdastar":
+            result = hda_star(init_state, args_dict["workers"])
+        elif args_dict["algo"] == "extbfs":
+            with tempfile.TemporaryDirectory(dir=args_dict["workdir"]) as directory:
+                result = external_bfs(init_state, directory, args_dict["memory_budget"] * 1024 * 1024)
+        elif args_dict["algo"] == "npbfs":
+            try:
+                result = numpy_bfs(init_state)
+            except (ValueError, RuntimeError) as error:  # Keys over 64 bits, or no NumPy
+                print("npbfs: {}; solving with frontier instead".format(error), file=sys.stderr)
+                result = frontier_search(init_state)
+        elif args_dict["algo"] == "frontier":
+            result = frontier_search(init_state)
+        elif args_dict["algo"] == "gdfs":
+            result = guided_dfs(init_state, args_dict["depth_bound"], args_dict["iterative"])
+        elif args_dict["algo"] == "wastar":
+            result = weighted_astar(init_state, args_dict["weight"])
+        elif args_dict["algo"] == "arastar":
+            result = ara_star(init_state, args_dict["time_limit"], args_dict["weight"])
         else:
-            output_file.write("\n")
+            result = astar(init_state, visited)
 
-    output_file.close()
+    write_to_file(args_dict["outputfile"], result)
+
+    if cache is not None:
+        if solvable is not False and not cached:
+            cache.put(init_board, cache_name, result)
+        if args_dict["cache_stats"]:
+            print("solution cache: {}".format(cache.stats()), file=sys.stderr)
+        cache.close()
+
+    if not visited.exact and args_dict["algo"] in ["dfs", "astar"]:
+        print("visited set: {}".format(visited.stats()), file=sys.stderr)
 
     # The following lines are for debugging
     # test_board = read_from_file("testhrd_easy1.txt")
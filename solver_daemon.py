@@ -0,0 +1,326 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+
+#====================================================================================
+# Solver daemon
+#
+# A long-lived process that answers Hua Rong Dao solve requests and checkers
+# best-move requests, so the interpreter start, the imports and the caches are paid
+# for once. Requests and responses are JSON objects, one per line, over a Unix
+# socket. The searches run on a process pool: each worker keeps its own warm state
+# (the HRD reachability tables, a checkers transposition table), and the daemon
+# keeps the HRD solution cache in front of the pool.
+#
+# Requests:
+#   {"type": "hrd", "puzzle": "<the lines of a puzzle file>", "algo": "astar"}
+#   {"type": "checkers", "position": "<a FEN line or 8 board rows>", "depth": 8,
+#    "time": null, "timeout": null}
+#   {"type": "stats"}, {"type": "ping"}, {"type": "stop"}
+# Every response has "ok"; failed requests carry "error" instead of a result.
+#
+# The client commands send one request and fall back to running it in-process when
+# no daemon answers, importing the solvers only then.
+
+default_socket = os.environ.get('SOLVER_DAEMON_SOCKET',
+                                os.path.join('/tmp', 'csc384-solver-{}.sock'.format(os.getuid())))
+hrd_algorithms = ['astar', 'dfs', 'gdfs', 'frontier', 'npbfs', 'wastar']
+
+
+def solve_hrd_keys(puzzle, algo, use_table=True):
+    """
+    Solve a puzzle given as the text of a puzzle file with one algorithm.
+
+    :return: The keys of the solution from the initial board to the goal, or None.
+    """
+    import hrd
+    board = hrd.board_from_lines(puzzle.splitlines())
+    if hrd.solvability_precheck(board, use_table)[0] is False:
+        return None
+
+    state = hrd.State(board, 0, 0, None)
+    if algo == 'astar':
+        result = hrd.astar(state)
+    elif algo == 'dfs':
+        result = hrd.dfs(state)
+    elif algo == 'gdfs':
+        result = hrd.guided_dfs(state)
+    elif algo == 'frontier':
+        result = hrd.frontier_search(state)
+    elif algo == 'npbfs':
+        result = hrd.numpy_bfs(state)
+    elif algo == 'wastar':
+        result = hrd.weighted_astar(state)
+    else:
+        raise ValueError("Unknown algorithm: {}".format(algo))
+    if result is None:
+        return None
+    return [hrd.get_state_key(step.board) for step in result]
+
+
+def checkers_best_move(position, depth=None, time_budget=None, timeout=None):
+    """
+    Search a checkers position, given as a FEN line or 8 board rows (red to move),
+    and return the result dict of checkers.analyse_position. Within one process
+    the transposition table is kept from one request to the next.
+    """
+    import checkers
+    if checkers.analysis_tables is None:
+        checkers.analysis_tables = checkers.SearchTables()
+    if ':' in position:
+        board, player = checkers.fen_to_board(position)
+    else:
+        board, player = [list(row.strip()) for row in position.strip().splitlines()], 'r'
+
+    if time_budget is not None:
+        checkers.DEPTH_LIMIT = checkers.MAX_PLY // 2
+    else:
+        checkers.DEPTH_LIMIT = depth if depth is not None else 10
+    return checkers.analyse_position('request', 0, board, player, time_budget, timeout)
+
+
+def warm_worker():
+    """
+    Import the solvers in a fresh worker process, so no request pays for it.
+    """
+    import hrd  # noqa: F401
+    import checkers  # noqa: F401
+
+
+def respond(request, cache, run, cache_lock=None):
+    """
+    Answer one request.
+
+    :param cache: The hrd.SolutionCache to look solutions up in, or None.
+    :param run: Called as run(function, *args) to run a search, here or on a pool.
+    :param cache_lock: A lock held while the cache is used, if it is shared.
+    :return: The response dict.
+    """
+    kind = request.get('type')
+    try:
+        if kind == 'ping':
+            return {'ok': True}
+        if kind == 'hrd':
+            return respond_hrd(request, cache, run, cache_lock)
+        if kind == 'checkers':
+            result = run(checkers_best_move, request['position'], request.get('depth'),
+                         request.get('time'), request.get('timeout'))
+            return dict(result, ok=True)
+        return {'ok': False, 'error': "Unknown request type: {}".format(kind)}
+    except Exception as error:  # Reported to the client, the daemon keeps serving
+        return {'ok': False, 'error': "{}: {}".format(type(error).__name__, error)}
+
+
+def respond_hrd(request, cache, run, cache_lock=None):
+    """
+    Answer an HRD request from the solution cache, or by solving it with run.
+    The solution is a list of boards, each a list of rows.
+    """
+    import hrd
+    algo = request.get('algo', 'astar')
+    if algo not in hrd_algorithms:
+        return {'ok': False, 'error': "Unknown algorithm: {}".format(algo)}
+    board = hrd.board_from_lines(request['puzzle'].splitlines())
+    cache_name = hrd.cache_algo_name(algo)  # The searches run with their default parameters
+
+    cached, solution = False, None
+    if cache is not None:
+        with cache_lock or nullcontext():
+            cached, solution = cache.get(board, cache_name)
+    if not cached:
+        keys = run(solve_hrd_keys, request['puzzle'], algo)
+        solution = hrd.get_solution_from_keys(keys, board.spec) if keys is not None else None
+        if cache is not None:
+            with cache_lock or nullcontext():
+                cache.put(board, cache_name, solution)
+
+    boards = None
+    if solution is not None:
+        boards = [[''.join(line) for line in step.board.grid] for step in solution]
+    return {'ok': True, 'cached': cached, 'solution': boards}
+
+
+class SolverDaemon:
+    """
+    The server: an asyncio Unix socket server that answers each request in a thread,
+    running the searches on a process pool.
+    """
+
+    def __init__(self, path=default_socket, workers=None, cache_size=1024, cache_file=None):
+        import hrd
+        self.path = path
+        self.workers = workers or os.cpu_count() or 1
+        self.cache = hrd.SolutionCache(cache_size, cache_file)
+        self.cache_lock = threading.Lock()
+        self.pool = None
+        self.server = None
+        self.started = time.time()
+        self.metrics = {'requests': 0, 'errors': 0, 'clients': 0}
+
+    def run_on_pool(self, function, *args):
+        return self.pool.submit(function, *args).result()
+
+    async def handle_client(self, reader, writer):
+        self.metrics['clients'] += 1
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                except ValueError as error:
+                    response = {'ok': False, 'error': "Malformed request: {}".format(error)}
+                else:
+                    if request.get('type') == 'stats':
+                        response = self.stats()
+                    elif request.get('type') == 'stop':
+                        response = {'ok': True}
+                        self.server.close()
+                    else:
+                        response = await loop.run_in_executor(None, respond, request, self.cache,
+                                                              self.run_on_pool, self.cache_lock)
+                self.metrics['requests'] += 1
+                self.metrics['errors'] += not response['ok']
+                writer.write((json.dumps(response) + "\n").encode())
+                await writer.drain()
+        finally:
+            writer.close()
+
+    def stats(self):
+        with self.cache_lock:
+            cache_stats = self.cache.stats()
+        return dict(self.metrics, ok=True, workers=self.workers, uptime=round(time.time() - self.started, 1),
+                    solution_cache=cache_stats)
+
+    async def serve(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'),
+                                        initializer=warm_worker)
+        for _ in range(self.workers):  # Start the workers now rather than on the first requests
+            self.pool.submit(time.sleep, 0)
+        self.server = await asyncio.start_unix_server(self.handle_client, path=self.path)
+        try:
+            async with self.server:
+                await self.server.wait_closed()
+        finally:
+            self.pool.shutdown(cancel_futures=True)
+            self.cache.close()
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+
+def send_request(request, path=default_socket, timeout=None):
+    """
+    Send one request to the daemon and return its response, or None if no daemon
+    answers it: nothing listens on the socket, the connection fails or times out,
+    or the reply is not a JSON object. The callers then run the request themselves.
+    """
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+            connection.settimeout(timeout)
+            connection.connect(path)
+            connection.sendall((json.dumps(request) + "\n").encode())
+            with connection.makefile('r') as reply:
+                line = reply.readline()
+        response = json.loads(line)
+    except (OSError, ValueError):  # socket.timeout is an OSError, a JSONDecodeError a ValueError
+        return None
+    return response if isinstance(response, dict) else None
+
+
+def request_or_run(request, path=default_socket, cache_file=None):
+    """
+    Answer a request through the daemon, or in this process if there is none.
+    """
+    response = send_request(request, path)
+    if response is not None:
+        return response
+
+    cache = None
+    if cache_file is not None and request.get('type') == 'hrd':
+        import hrd
+        cache = hrd.SolutionCache(path=cache_file)
+    response = respond(request, cache, lambda function, *args: function(*args))
+    if cache is not None:
+        cache.close()
+    return response
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--socket",
+        type=str,
+        default=default_socket,
+        help="The Unix socket of the daemon."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = commands.add_parser("serve", help="Run the daemon.")
+    serve_parser.add_argument("--workers", type=int, help="The number of search processes.")
+    serve_parser.add_argument("--cache-size", type=int, default=1024,
+                              help="The number of HRD solutions kept in memory.")
+    serve_parser.add_argument("--cache-file", type=str, help="The file of the on-disk HRD solution cache.")
+
+    hrd_parser = commands.add_parser("hrd", help="Solve a Hua Rong Dao puzzle.")
+    hrd_parser.add_argument("--inputfile", type=str, required=True, help="The input file that contains the puzzle.")
+    hrd_parser.add_argument("--outputfile", type=str, required=True,
+                            help="The output file that contains the solution.")
+    hrd_parser.add_argument("--algo", type=str, default="astar", choices=hrd_algorithms,
+                            help="The searching algorithm.")
+    hrd_parser.add_argument("--cache-file", type=str,
+                            help="The on-disk solution cache to use when no daemon is running.")
+
+    checkers_parser = commands.add_parser("checkers", help="Find the best move of a checkers position.")
+    checkers_parser.add_argument("--inputfile", type=str, required=True,
+                                 help="A file with a FEN line or the 8 rows of a board (red to move).")
+    checkers_parser.add_argument("--depth", type=int, default=10, help="The depth limit of the search.")
+    checkers_parser.add_argument("--time", type=float, help="Search for this many seconds instead.")
+    checkers_parser.add_argument("--timeout", type=float, help="Cut the search off after this many seconds.")
+
+    commands.add_parser("stats", help="Print the counters of the daemon.")
+    commands.add_parser("stop", help="Stop the daemon.")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        daemon = SolverDaemon(args.socket, args.workers, args.cache_size, args.cache_file)
+        asyncio.run(daemon.serve())
+    elif args.command == "hrd":
+        with open(args.inputfile) as puzzle_file:
+            puzzle = puzzle_file.read()
+        response = request_or_run({'type': 'hrd', 'puzzle': puzzle, 'algo': args.algo}, args.socket,
+                                  args.cache_file)
+        if not response['ok']:
+            sys.exit(response['error'])
+        with open(args.outputfile, "w") as output_file:
+            if response['solution'] is None:
+                output_file.write("\n")
+            for board in response['solution'] or []:
+                for line in board:
+                    output_file.write(line + "\n")
+                output_file.write("\n")
+    elif args.command == "checkers":
+        with open(args.inputfile) as position_file:
+            position = position_file.read()
+        response = request_or_run({'type': 'checkers', 'position': position, 'depth': args.depth,
+                                   'time': args.time, 'timeout': args.timeout}, args.socket)
+        if not response['ok']:
+            sys.exit(response['error'])
+        print(json.dumps(response))
+    else:
+        response = send_request({'type': args.command}, args.socket)
+        if response is None:
+            sys.exit("No daemon is listening on {}".format(args.socket))
+        print(json.dumps(response))